@@ -0,0 +1,159 @@
+import threading
+import time
+
+import numpy as np
+
+from .instrumentation import observe, timer
+from .processing import StreamingAverager
+
+
+class SpectrumRingBuffer:
+    def __init__(self, capacity, num_pixels):
+        self.capacity = capacity
+        self.num_pixels = num_pixels
+        self._spectra = np.zeros((capacity, num_pixels))
+        self._timestamps = np.zeros(capacity)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+
+    @property
+    def count(self):
+        # Total number of frames written since the buffer was created
+        return self._count
+
+    def append(self, intensities, timestamp):
+        with self._new_frame:
+            index = self._count % self.capacity
+            self._spectra[index] = intensities
+            self._timestamps[index] = timestamp
+            self._count += 1
+            self._new_frame.notify_all()
+
+    def _window(self, start, stop):
+        indices = np.arange(start, stop) % self.capacity
+        return self._spectra[indices], self._timestamps[indices]
+
+    def latest(self, n=1):
+        with self._lock:
+            n = min(n, self._count, self.capacity)
+            return self._window(self._count - n, self._count)
+
+    def since(self, frame_number):
+        # Frames written from frame_number onwards that have not been overwritten yet
+        with self._lock:
+            start = max(frame_number, self._count - self.capacity)
+            spectra, timestamps = self._window(start, self._count)
+            return spectra, timestamps, start
+
+    def accumulate(self, frame_number, averager):
+        # Feed one frame straight from the buffer into a StreamingAverager
+        with self._lock:
+            if frame_number >= self._count or frame_number < self._count - self.capacity:
+                return False
+            averager.update(self._spectra[frame_number % self.capacity])
+            return True
+
+    def mean(self, n):
+        spectra, _ = self.latest(n)
+        if len(spectra) == 0:
+            raise ValueError("The buffer does not contain any spectra yet.")
+        return spectra.mean(axis=0)
+
+    def wait_for(self, frame_number, timeout=None):
+        with self._new_frame:
+            return self._new_frame.wait_for(lambda: self._count >= frame_number, timeout)
+
+
+class ContinuousAcquisition:
+    # Set by an AcquisitionWatchdog; while one is attached, a stopped
+    # detector is being restarted and collect keeps waiting for frames
+    watchdog = None
+
+    def __init__(self, spec, capacity=1024):
+        self.spec = spec
+        self.wavelengths = spec.wavelengths()
+        self.serial_number = getattr(spec, 'serial_number', 'unknown')
+        self.buffer = SpectrumRingBuffer(capacity, len(self.wavelengths))
+        self.error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self.error = None
+        # A fresh event per thread, so a read thread that was abandoned
+        # while hung still stops once its read returns
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spectrometer-acquisition", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def restart(self, spec, timeout=5.0):
+        # Carries on with a reopened detector, e.g. after a USB reset. The
+        # buffer and its frame numbers continue where they were.
+        self.stop(timeout)
+        self.spec = spec
+        return self.start()
+
+    def _run(self):
+        # spec.intensities() already blocks for one integration period, so the
+        # detector is read back-to-back without any extra sleep
+        stop_event = self._stop_event
+        try:
+            while not stop_event.is_set():
+                started = time.perf_counter()
+                intensities = self.spec.intensities()
+                observe('detector_read', time.perf_counter() - started, serial=self.serial_number)
+                self.buffer.append(intensities, time.monotonic())
+        except Exception as e:
+            self.error = e
+            print(f"Acquisition stopped: {e}")
+
+    def frame_rate(self, n=100):
+        _, timestamps = self.buffer.latest(n)
+        if len(timestamps) < 2 or timestamps[-1] == timestamps[0]:
+            return 0.0
+        return (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+
+    def wait_for_frames(self, frame_number, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.buffer.wait_for(frame_number, 0.5):
+            if not self.running and self.watchdog is None:
+                raise RuntimeError(f"Acquisition is not running: {self.error}")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for spectrum {frame_number}.")
+
+    def collect(self, num_measurements=10, timeout=None, averager=None):
+        # Average the next num_measurements frames as they arrive. The frame
+        # being integrated when this is called may have started earlier, so it
+        # is skipped. Pass an averager to reuse its buffers or to read back
+        # the per-pixel standard error afterwards.
+        if averager is None:
+            averager = StreamingAverager(len(self.wavelengths))
+        else:
+            averager.reset()
+        with timer('collect', serial=self.serial_number):
+            start = self.buffer.count + 1
+            for frame_number in range(start, start + num_measurements):
+                self.wait_for_frames(frame_number + 1, timeout)
+                if not self.buffer.accumulate(frame_number, averager):
+                    raise RuntimeError("Spectra were overwritten before they could be averaged.")
+        return averager.mean, self.wavelengths
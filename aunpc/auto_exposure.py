@@ -0,0 +1,97 @@
+import numpy as np
+
+from .processing import StreamingAverager
+
+MIN_INTEGRATION_TIME = 8000
+MAX_INTEGRATION_TIME = 3600000
+# Full-scale counts of the QE Pro, used when the driver does not report it
+DEFAULT_MAX_INTENSITY = 200000.0
+
+
+def roi_mask(wavelengths, roi):
+    wavelengths = np.asarray(wavelengths)
+    return (wavelengths >= roi[0]) & (wavelengths <= roi[1])
+
+
+def auto_exposure(spec, target_fraction=0.75, saturation_fraction=0.9, roi=(400.0, 800.0),
+                  start_time=100000, max_iterations=8, tolerance=0.05):
+    # Finds the integration time that fills the brightest pixel in the ROI
+    # to target_fraction of full scale without passing saturation_fraction.
+    # Counts are linear in integration time above the dark offset, so each
+    # unsaturated reading predicts the next time directly; a saturated
+    # reading halves it. Run this with the reference in the light path and
+    # before the acquisition engine is started.
+    max_intensity = getattr(spec, 'max_intensity', DEFAULT_MAX_INTENSITY)
+    mask = roi_mask(spec.wavelengths(), roi)
+    integration_time = int(np.clip(start_time, MIN_INTEGRATION_TIME, MAX_INTEGRATION_TIME))
+    target = target_fraction * max_intensity
+    saturation = saturation_fraction * max_intensity
+
+    def measure(integration_time):
+        spec.integration_time_micros(integration_time)
+        # The first frame after a change may have been integrated with the old setting
+        spec.intensities()
+        intensities = spec.intensities()
+        return float(np.max(intensities[mask])), float(np.percentile(intensities, 1))
+
+    # The last setting measured below saturation; only such a setting is returned
+    unsaturated = None
+    for _ in range(max_iterations):
+        peak, dark = measure(integration_time)
+        if peak >= saturation:
+            next_time = integration_time // 2
+        else:
+            unsaturated = integration_time
+            next_time = integration_time * (target - dark) / max(peak - dark, 1.0)
+        next_time = int(np.clip(next_time, MIN_INTEGRATION_TIME, MAX_INTEGRATION_TIME))
+        if unsaturated == integration_time and abs(next_time - integration_time) <= tolerance * integration_time:
+            break
+        if next_time == integration_time:
+            break
+        integration_time = next_time
+    # Out of iterations the last prediction has not been measured yet, and a
+    # reading may still be saturated: keep halving until it is not
+    while unsaturated != integration_time:
+        peak, dark = measure(integration_time)
+        if peak < saturation:
+            unsaturated = integration_time
+        elif integration_time == MIN_INTEGRATION_TIME:
+            raise RuntimeError(f"The detector saturates even at {MIN_INTEGRATION_TIME} microseconds "
+                               f"(peak {peak:.0f} of {max_intensity:.0f} counts); reduce the light level.")
+        else:
+            integration_time = max(MIN_INTEGRATION_TIME, integration_time // 2)
+    spec.integration_time_micros(integration_time)
+    print(f"Auto exposure: {integration_time} microseconds, peak {peak:.0f} of {max_intensity:.0f} counts.")
+    return integration_time
+
+
+def collect_adaptive(acquisition, target_standard_error, roi=(400.0, 800.0), absorbance_calculator=None,
+                     min_measurements=3, max_measurements=1000, averager=None):
+    # Averages fresh frames until the largest per-pixel standard error in the
+    # ROI reaches the target. With an absorbance_calculator the target is in
+    # absorbance units, otherwise in counts. Returns the same
+    # (intensities, wavelengths) pair as ContinuousAcquisition.collect.
+    wavelengths = acquisition.wavelengths
+    mask = roi_mask(wavelengths, roi)
+    if averager is None:
+        averager = StreamingAverager(len(wavelengths))
+    else:
+        averager.reset()
+    standard_error = np.empty(len(wavelengths))
+    absorbance_error = np.empty(len(wavelengths))
+    frame_number = acquisition.buffer.count + 1
+    while True:
+        acquisition.wait_for_frames(frame_number + 1)
+        if not acquisition.buffer.accumulate(frame_number, averager):
+            raise RuntimeError("Spectra were overwritten before they could be averaged.")
+        frame_number += 1
+        if averager.count < min_measurements:
+            continue
+        error = averager.standard_error(out=standard_error)
+        if absorbance_calculator is not None:
+            error = absorbance_calculator.standard_error(averager.mean, standard_error, out=absorbance_error)
+        worst = np.nanmax(error[mask])
+        if worst <= target_standard_error or averager.count >= max_measurements:
+            break
+    print(f"Averaged {averager.count} spectra, largest standard error {worst:.3g}.")
+    return averager.mean, wavelengths
@@ -0,0 +1,132 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from .spr_features import FEATURE_NAMES, extract_features
+
+# absorbance_data_<YYYYmmddHHMMSS>[_<concentration>mM][_<frame>].csv, as
+# written by the scripts' save_to_csv and by SpectrumStore.export_csv
+FILENAME_PATTERN = re.compile(
+    r'^absorbance_data_(\d{14})(?:_([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)mM)?(?:_(\d+))?\.csv$')
+
+SUMMARY_COLUMNS = ('path', 'timestamp', 'concentration') + FEATURE_NAMES
+
+
+def parse_filename(name):
+    # Returns (unix timestamp, concentration in mM or NaN), or None for
+    # files that do not follow the naming convention
+    match = FILENAME_PATTERN.match(name)
+    if match is None:
+        return None
+    timestamp = datetime.strptime(match.group(1), "%Y%m%d%H%M%S").timestamp()
+    concentration = float(match.group(2)) if match.group(2) is not None else np.nan
+    return timestamp, concentration
+
+
+def scan_directory(directory, recursive=False):
+    # (path, timestamp, concentration) for every matching file, oldest first
+    entries = []
+    walker = os.walk(directory) if recursive else [(directory, None, os.listdir(directory))]
+    for root, _, names in walker:
+        for name in names:
+            parsed = parse_filename(name)
+            if parsed is not None:
+                entries.append((os.path.join(root, name),) + parsed)
+    entries.sort(key=lambda entry: (entry[1], entry[0]))
+    return entries
+
+
+def read_spectrum(path):
+    import pandas as pd
+
+    data = pd.read_csv(path, usecols=['Wavelength', 'Absorbance'], dtype=np.float64, engine='c')
+    return data['Wavelength'].to_numpy(), data['Absorbance'].to_numpy()
+
+
+def process_chunk(entries, options):
+    # Runs in a worker process. Files in a chunk that share a wavelength
+    # grid, which is every file from the same spectrometer, go through
+    # extract_features as one (n_files, n_pixels) array.
+    groups = {}
+    results = []
+    for path, timestamp, concentration in entries:
+        try:
+            wavelengths, absorbance = read_spectrum(path)
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        key = (len(wavelengths), wavelengths[0], wavelengths[-1]) if len(wavelengths) else None
+        if key is None:
+            continue
+        group = groups.setdefault(key, {'wavelengths': wavelengths, 'rows': [], 'spectra': []})
+        group['rows'].append((path, timestamp, concentration))
+        group['spectra'].append(absorbance)
+    for group in groups.values():
+        features = extract_features(group['wavelengths'], np.vstack(group['spectra']), **options)
+        for i, row in enumerate(group['rows']):
+            results.append(row + tuple(float(features[name][i]) for name in FEATURE_NAMES))
+    return results
+
+
+def summarize(directory, workers=None, chunk_files=64, recursive=False, **options):
+    # Features for every absorbance CSV under directory as a dict of
+    # columns, sorted by timestamp
+    entries = scan_directory(directory, recursive)
+    chunks = [entries[i:i + chunk_files] for i in range(0, len(entries), chunk_files)]
+    rows = []
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            rows.extend(process_chunk(chunk, options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_rows in pool.map(process_chunk, chunks, [options] * len(chunks)):
+                rows.extend(chunk_rows)
+    rows.sort(key=lambda row: (row[1], row[0]))
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(SUMMARY_COLUMNS)}
+    summary = {'path': np.array(columns['path'], dtype=str)}
+    summary.update({name: np.array(columns[name], dtype=np.float64) for name in SUMMARY_COLUMNS[1:]})
+    return summary
+
+
+def write_summary(summary, path):
+    # The format follows the extension: .npz (numpy only), .csv or .parquet
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        np.savez(path, **summary)
+    elif extension in ('.csv', '.parquet'):
+        import pandas as pd
+
+        df = pd.DataFrame(summary)
+        if extension == '.csv':
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"Unsupported summary format '{extension}'. Use .npz, .csv or .parquet.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="aunpc batch",
+                                     description="Compute SPR features for a directory of absorbance CSV files.")
+    parser.add_argument("directory", help="directory containing absorbance_data_*.csv files")
+    parser.add_argument("output", help="summary file (.npz, .csv or .parquet)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-files", type=int, default=64, help="files handed to a worker at a time")
+    parser.add_argument("--recursive", action="store_true", help="include subdirectories")
+    parser.add_argument("--roi", type=float, nargs=2, default=(450.0, 700.0), help="peak search range in nm")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    summary = summarize(args.directory, args.workers, args.chunk_files, args.recursive, roi=tuple(args.roi))
+    write_summary(summary, args.output)
+    elapsed = time.perf_counter() - start
+    print(f"Features for {len(summary['path'])} files have been written to {args.output} in {elapsed:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
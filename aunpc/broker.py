@@ -0,0 +1,424 @@
+import argparse
+import base64
+import ipaddress
+import json
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+from .acquisition import ContinuousAcquisition, SpectrumRingBuffer
+from .hardware import open_spectrometer, set_integration_time
+from .supervisor import AcquisitionWatchdog, open_supervised_pump
+from .syringe_pump import PumpResponse
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 50505
+DEFAULT_ADDRESS = f'{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+# SyringePump methods a client may call through the broker; 'state' only
+# reads the broker's model of the pump
+PUMP_METHODS = ('state', 'send_command', 'set_syringe_diameter', 'set_flow_rate', 'set_volume', 'start_pump', 'stop_pump',
+                'sync', 'invalidate')
+
+
+def parse_address(address):
+    host, _, port = (address or DEFAULT_ADDRESS).rpartition(':')
+    return host or DEFAULT_HOST, int(port or DEFAULT_PORT)
+
+
+def is_loopback(host):
+    # True if every address host resolves to is on this machine
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None)]
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses)
+
+
+def encode_spectrum(values):
+    # Spectra travel as base64 little-endian float64, about a third of the
+    # size of the same numbers as JSON text and without any float parsing
+    return base64.b64encode(np.ascontiguousarray(values, dtype='<f8').tobytes()).decode('ascii')
+
+
+def decode_spectrum(text):
+    return np.frombuffer(base64.b64decode(text), dtype='<f8')
+
+
+def _write_message(stream, message):
+    stream.write((json.dumps(message) + '\n').encode())
+    stream.flush()
+
+
+def _pump_reply(pump, response):
+    reply = {'state': pump.state}
+    if response is not None:
+        reply.update({'command': response.command, 'raw': response.raw.decode('latin1'),
+                      'round_trip_time': response.round_trip_time, 'skipped': response.skipped,
+                      'sent_at': response.sent_at})
+    return reply
+
+
+class Broker:
+    # Long-lived owner of the pumps and spectrometers on this machine.
+    # Serial ports are opened on first use and kept open; each spectrometer
+    # is read by one ContinuousAcquisition whose frames every client shares.
+    # Requests and replies are JSON lines over a localhost TCP socket, which
+    # works the same on Windows and Linux. One connection may carry any
+    # number of requests; a 'subscribe' request turns the connection into a
+    # stream of frames until the client disconnects. There is no
+    # authentication, so the broker refuses to listen beyond this machine.
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, open_device=open_spectrometer, open_pump=open_supervised_pump,
+                 capacity=1024):
+        if not is_loopback(host):
+            raise ValueError(f"The broker accepts pump commands without authentication, so it only listens on "
+                             f"this machine's loopback interface, not on {host!r}.")
+        self.open_device = open_device
+        self.open_pump = open_pump
+        self.capacity = capacity
+        self._pumps = {}
+        self._acquisitions = {}
+        self._integration_times = {}
+        self._watchdogs = {}
+        # Separate locks, so opening a spectrometer (auto exposure can take
+        # a while) never holds up pump commands
+        self._pump_lock = threading.Lock()
+        self._device_lock = threading.Lock()
+        self.server = _BrokerServer((host, port), _BrokerHandler)
+        self.server.broker = self
+        self.address = self.server.server_address
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def pump(self, port):
+        # (SyringePump, lock); the lock keeps one client's command and its
+        # reply together on the serial line
+        with self._pump_lock:
+            if port not in self._pumps:
+                self._pumps[port] = (self.open_pump(port), threading.Lock())
+            return self._pumps[port]
+
+    def acquisition(self, serial_number, integration_time=None):
+        with self._device_lock:
+            if serial_number not in self._acquisitions:
+                spec = self.open_device(serial_number)
+                self._integration_times[serial_number] = (
+                    set_integration_time(spec, integration_time) if integration_time is not None else None)
+                acquisition = ContinuousAcquisition(spec, self.capacity).start()
+                self._acquisitions[serial_number] = acquisition
+                # The broker outlives any run, so a USB hiccup reopens the
+                # spectrometer instead of ending every client's stream
+                self._watchdogs[serial_number] = AcquisitionWatchdog(
+                    acquisition, lambda: self._reopen(serial_number)).start()
+            elif integration_time not in (None, 'auto', self._integration_times[serial_number]):
+                raise ValueError(f"Spectrometer {serial_number} is shared at "
+                                 f"{self._integration_times[serial_number]} microseconds.")
+            return self._acquisitions[serial_number]
+
+    def _reopen(self, serial_number):
+        spec = self.open_device(serial_number)
+        if self._integration_times[serial_number] is not None:
+            set_integration_time(spec, self._integration_times[serial_number])
+        return spec
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'status':
+            with self._pump_lock:
+                pumps = {port: pump.state for port, (pump, _) in self._pumps.items()}
+            with self._device_lock:
+                spectrometers = {serial_number: {'integration_time': self._integration_times[serial_number],
+                                                 'frames': acquisition.buffer.count,
+                                                 'frame_rate': acquisition.frame_rate(),
+                                                 'running': acquisition.running}
+                                 for serial_number, acquisition in self._acquisitions.items()}
+            return {'pumps': pumps, 'spectrometers': spectrometers}
+        if op == 'pump':
+            method = request.get('method')
+            if method not in PUMP_METHODS:
+                raise ValueError(f"Unknown pump method {method!r}. Expected one of {PUMP_METHODS}.")
+            pump, lock = self.pump(request['port'])
+            if method == 'state':
+                return _pump_reply(pump, None)
+            with lock:
+                result = getattr(pump, method)(*request.get('args', []))
+            return _pump_reply(pump, result if hasattr(result, 'raw') else None)
+        if op == 'open_spectrometer':
+            serial_number = request['serial_number']
+            acquisition = self.acquisition(serial_number, request.get('integration_time'))
+            return {'wavelengths': encode_spectrum(acquisition.wavelengths),
+                    'integration_time': self._integration_times[serial_number]}
+        if op == 'collect':
+            acquisition = self.acquisition(request['serial_number'])
+            intensities, _ = acquisition.collect(request.get('num_measurements', 10), request.get('timeout'))
+            return {'intensities': encode_spectrum(intensities), 'monotonic': time.monotonic()}
+        raise ValueError(f"Unknown request {op!r}.")
+
+    def stream(self, request, output):
+        # Sends every new frame of one spectrometer, with its monotonic
+        # timestamp and frame number so clients can tell if they fell behind
+        acquisition = self.acquisition(request['serial_number'])
+        buffer = acquisition.buffer
+        frame_number = buffer.count
+        # A watchdog restart stops the acquisition for a moment
+        while acquisition.running or acquisition.watchdog is not None:
+            if not buffer.wait_for(frame_number + 1, 0.5):
+                continue
+            spectra, timestamps, start = buffer.since(frame_number)
+            for i in range(len(spectra)):
+                _write_message(output, {'frame': start + i, 'monotonic': timestamps[i],
+                                        'intensities': encode_spectrum(spectra[i])})
+            frame_number = start + len(spectra)
+        _write_message(output, {'error': f"Acquisition stopped: {acquisition.error}"})
+
+    def serve_forever(self):
+        host, port = self.address
+        print(f"Hardware broker listening on {host}:{port}. Press Ctrl+C to stop.")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        self.server.server_close()
+        with self._device_lock:
+            for watchdog in self._watchdogs.values():
+                watchdog.stop()
+            self._watchdogs = {}
+            for acquisition in self._acquisitions.values():
+                acquisition.stop()
+            self._acquisitions = {}
+        with self._pump_lock:
+            for pump, lock in self._pumps.values():
+                with lock:
+                    pump.close()
+            self._pumps = {}
+
+
+class _BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = None
+            try:
+                request = json.loads(line)
+                if request.get('op') == 'subscribe':
+                    broker.stream(request, self.wfile)
+                    return
+                reply = {'result': broker.handle(request)}
+            except ConnectionError:
+                return
+            except Exception as e:
+                reply = {'error': f"{type(e).__name__}: {e}"}
+            if isinstance(request, dict) and 'id' in request:
+                reply['id'] = request['id']
+            try:
+                _write_message(self.wfile, reply)
+            except ConnectionError:
+                return
+
+
+class BrokerClient:
+    # One connection to a Broker. Calls are serialised on the connection,
+    # so a client can be shared between threads; frame subscriptions get
+    # connections of their own.
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=None):
+        self.host, self.port = parse_address(address)
+        self.timeout = timeout
+        self._socket = socket.create_connection((self.host, self.port), timeout)
+        self._stream = self._socket.makefile('rwb')
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def call(self, op, **arguments):
+        with self._lock:
+            _write_message(self._stream, dict(arguments, op=op))
+            line = self._stream.readline()
+        if not line:
+            raise ConnectionError(f"The broker at {self.host}:{self.port} closed the connection.")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(f"Broker: {reply['error']}")
+        return reply['result']
+
+    def status(self):
+        return self.call('status')
+
+    def subscribe(self, serial_number):
+        # (socket, line stream); shut the socket down to end the stream
+        connection = socket.create_connection((self.host, self.port), self.timeout)
+        stream = connection.makefile('rwb')
+        _write_message(stream, {'op': 'subscribe', 'serial_number': serial_number})
+        return connection, stream
+
+    def pump(self, port):
+        return RemoteSyringePump(self, port)
+
+    def acquisition(self, serial_number, integration_time=None, capacity=1024):
+        return RemoteAcquisition(self, serial_number, integration_time, capacity)
+
+    def close(self):
+        self._stream.close()
+        self._socket.close()
+
+
+class RemoteSyringePump:
+    # Stands in for SyringePump with the port held open by the broker.
+    # Replies come back as PumpResponse objects and the broker's model of
+    # the pump state is mirrored in .state, so PumpGroup, RecipeRunner and
+    # record_pump_events work unchanged. Each pump has a connection of its
+    # own, because the broker answers one request per connection at a time
+    # and PumpGroup needs the pumps' commands to go out together. sent_at
+    # is the broker's send time; both sides share the machine's monotonic
+    # clock.
+    def __init__(self, client, port):
+        self.client = client
+        self.port = port
+        self.last_response = None
+        self.listeners = []
+        self.connection = BrokerClient(f"{client.host}:{client.port}", client.timeout)
+        # The broker synced the pump when it opened the port, so attaching
+        # costs no serial traffic
+        self.state = self.connection.call('pump', port=port, method='state')['state']
+        print(f"Using pump on {port} through the broker at {client.host}:{client.port}")
+
+    def _call(self, method, *args):
+        sent_at = time.monotonic()
+        reply = self.connection.call('pump', port=self.port, method=method, args=list(args))
+        self.state = reply['state']
+        if 'raw' not in reply:
+            return self.state
+        response = PumpResponse(reply['command'], reply['raw'].encode('latin1'), reply['round_trip_time'])
+        response.skipped = reply['skipped']
+        if reply.get('sent_at') is not None:
+            sent_at = response.sent_at = reply['sent_at']
+        self.last_response = response
+        if not response.skipped:
+            print(f"Command sent: {response.command}, Response: {response} ({response.round_trip_time * 1000:.1f} ms)")
+            for listener in self.listeners:
+                listener(self, response, sent_at)
+        if not response.ok:
+            print(f"Pump on {self.port} reported an error for '{response.command}': {response.error}")
+        return response
+
+    def is_open(self):
+        return True
+
+    def sync(self):
+        return self._call('sync')
+
+    def invalidate(self):
+        return self._call('invalidate')
+
+    def send_command(self, command):
+        return self._call('send_command', command)
+
+    def set_syringe_diameter(self, diameter):
+        return self._call('set_syringe_diameter', diameter)
+
+    def set_flow_rate(self, rate, unit):
+        return self._call('set_flow_rate', rate, unit)
+
+    def set_volume(self, volume):
+        return self._call('set_volume', volume)
+
+    def start_pump(self):
+        return self._call('start_pump')
+
+    def stop_pump(self):
+        return self._call('stop_pump')
+
+    def close(self):
+        # The broker keeps the port open for the next client
+        self.connection.close()
+        print(f"Released pump on {self.port}.")
+
+
+class RemoteAcquisition(ContinuousAcquisition):
+    # ContinuousAcquisition fed by the broker's frame stream instead of a
+    # local detector. Frames land in a local ring buffer with the broker's
+    # monotonic timestamps, so collect, collect_adaptive,
+    # wait_for_steady_state and LiveViewer work unchanged, and any number of
+    # clients share one spectrometer.
+    def __init__(self, client, serial_number, integration_time=None, capacity=1024):
+        self.client = client
+        self.spec = None
+        self.serial_number = serial_number
+        reply = client.call('open_spectrometer', serial_number=serial_number, integration_time=integration_time)
+        self.integration_time = reply['integration_time']
+        self.wavelengths = decode_spectrum(reply['wavelengths']).copy()
+        self.buffer = SpectrumRingBuffer(capacity, len(self.wavelengths))
+        self.error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._subscription = None
+
+    def start(self):
+        if self.running:
+            return self
+        self._subscription = self.client.subscribe(self.serial_number)
+        return super().start()
+
+    def _run(self):
+        connection, stream = self._subscription
+        try:
+            for line in stream:
+                message = json.loads(line)
+                if 'error' in message:
+                    raise RuntimeError(message['error'])
+                self.buffer.append(decode_spectrum(message['intensities']), message['monotonic'])
+        except Exception as e:
+            if not self._stop_event.is_set():
+                self.error = e
+                print(f"Acquisition stopped: {e}")
+        finally:
+            stream.close()
+            connection.close()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._subscription is not None:
+            try:
+                self._subscription[0].shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        super().stop(timeout)
+        self._subscription = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="aunpc broker",
+                                     description="Share the spectrometers and pump ports between several clients.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on, on localhost only")
+    parser.add_argument("--status", action="store_true", help="print the devices a running broker holds and exit")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        with BrokerClient(f"{DEFAULT_HOST}:{args.port}") as client:
+            print(json.dumps(client.status(), indent=2))
+        return
+    with Broker(DEFAULT_HOST, args.port) as broker:
+        broker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.aunpc', 'calibration')
+
+
+class CalibrationCache:
+    # Reference and background spectra on disk, one .npz file per
+    # spectrometer serial number, integration time and averaging count.
+    # Entries older than max_age seconds are dropped, and only the
+    # max_entries most recently used ones are kept.
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_age=12 * 3600, max_entries=20):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(serial_number, integration_time, num_measurements):
+        return f"{serial_number}_{int(integration_time)}us_{int(num_measurements)}avg"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, serial_number, integration_time, num_measurements):
+        path = self._path(self.key(serial_number, integration_time, num_measurements))
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            entry = {name: data[name] for name in data.files}
+        age = time.time() - float(entry['created'])
+        if age > self.max_age:
+            os.remove(path)
+            return None
+        entry['age'] = age
+        # Loading counts as a use for the eviction order
+        os.utime(path)
+        return entry
+
+    def save(self, serial_number, integration_time, num_measurements, wavelengths, reference, background):
+        key = self.key(serial_number, integration_time, num_measurements)
+        temporary_path = self._path(key + '.tmp')
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, wavelengths=wavelengths, reference=reference, background=background, created=time.time())
+        os.replace(temporary_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, name)
+            modified = os.path.getmtime(path)
+            if time.time() - modified > self.max_age:
+                os.remove(path)
+            else:
+                entries.append((modified, path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            os.remove(path)
+
+
+def drift_check(collect, reference, background, num_measurements=3, tolerance=0.01, signal_fraction=0.1):
+    # Relative RMS difference between a quick reference reading and the
+    # cached one, over pixels with at least signal_fraction of the peak
+    # lamp signal. collect(num_measurements) returns (intensities, wavelengths).
+    intensities, _ = collect(num_measurements)
+    cached_signal = reference - background
+    mask = cached_signal > signal_fraction * np.max(cached_signal)
+    deviation = float(np.sqrt(np.mean(((intensities[mask] - background[mask]) / cached_signal[mask] - 1) ** 2)))
+    return deviation <= tolerance, deviation
+
+
+def load_or_acquire_calibration(collect, serial_number, integration_time, num_measurements, cache=None,
+                                tolerance=0.01):
+    # Reuses a cached reference/background if a few-scan drift check agrees
+    # with it; otherwise runs the full calibration and caches the result.
+    if cache is None:
+        cache = CalibrationCache()
+    cached = cache.load(serial_number, integration_time, num_measurements)
+    if cached is not None:
+        input("Cached calibration found. Put the reference in place and press Enter for a quick drift check...")
+        ok, deviation = drift_check(collect, cached['reference'], cached['background'], tolerance=tolerance)
+        if ok:
+            print(f"Reusing the calibration from {cached['age'] / 60:.0f} minutes ago (drift {deviation:.2%}).")
+            return cached['reference'], cached['background']
+        print(f"Reference has drifted by {deviation:.2%}; recalibrating.")
+
+    input("Press Enter to store the reference spectrum...")
+    reference, wavelengths = collect(num_measurements)
+    reference = reference.copy()
+    input("Press Enter to collect the background spectrum...")
+    background, _ = collect(num_measurements)
+    background = background.copy()
+    cache.save(serial_number, integration_time, num_measurements, wavelengths, reference, background)
+    return reference, background
@@ -0,0 +1,111 @@
+import argparse
+
+# broker.DEFAULT_ADDRESS, repeated so the parser does not import numpy
+DEFAULT_BROKER = '127.0.0.1:50505'
+
+# Commands whose modules parse their own options
+_OWN_OPTIONS = ("multi", "optimize", "batch", "kinetics", "broker", "replay", "reduce", "features", "export")
+
+
+def _integration_time(value):
+    if value.lower() == 'auto':
+        return 'auto'
+    return int(value)
+
+
+def _add_spectrometer_arguments(parser):
+    parser.add_argument("--serial", dest="serial_number", help="spectrometer serial number (prompted if omitted)")
+    parser.add_argument("--integration-time", type=_integration_time,
+                        help="integration time in microseconds, or 'auto' (prompted if omitted)")
+
+
+def _add_broker_argument(parser):
+    parser.add_argument("--broker", nargs='?', const=DEFAULT_BROKER, metavar="HOST:PORT",
+                        help=f"use the devices held by a running 'aunpc broker' (default address {DEFAULT_BROKER})")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="aunpc", description="AuNPC inline synthesis and spectroscopy tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pump = subparsers.add_parser("pump", help="run a single syringe pump")
+    pump.add_argument("--port", help="serial port of the pump, e.g. COM7 (prompted if omitted)")
+    _add_broker_argument(pump)
+
+    measure = subparsers.add_parser("measure", help="measure one absorbance spectrum and save it as CSV")
+    _add_spectrometer_arguments(measure)
+
+    synthesize = subparsers.add_parser("synthesize", help="two-pump inline synthesis with a steady-state measurement")
+    _add_spectrometer_arguments(synthesize)
+
+    sweep = subparsers.add_parser("sweep", help="methyl orange concentration sweep, interactive or from a recipe")
+    _add_spectrometer_arguments(sweep)
+    sweep.add_argument("--recipe", help="JSON recipe file to run unattended")
+    sweep.add_argument("--dry-run", action="store_true", help="with --recipe, print the flow rates and timing only")
+    sweep.add_argument("--resume", metavar="STORE", help="continue an interrupted recipe run from its store directory")
+    _add_broker_argument(sweep)
+
+    # Options after these commands are parsed by their own modules, see _OWN_OPTIONS
+    subparsers.add_parser("multi", help="record from several spectrometers in parallel", add_help=False)
+    subparsers.add_parser("optimize", help="closed-loop search for conditions giving a target SPR peak", add_help=False)
+    subparsers.add_parser("batch", help="SPR features for a directory of absorbance CSV files", add_help=False)
+    subparsers.add_parser("kinetics", help="look up a run's spectra by residence time", add_help=False)
+    subparsers.add_parser("broker", help="hold the pumps and spectrometers open for several clients", add_help=False)
+    subparsers.add_parser("replay", help="replay a recorded run through the processing faster than real time",
+                          add_help=False)
+    subparsers.add_parser("reduce", help="copy a run's store cropped, binned and compressed", add_help=False)
+    subparsers.add_parser("features", help="SPR features for every spectrum in a run's store", add_help=False)
+    subparsers.add_parser("export", help="show a run's store or export its spectra to CSV files", add_help=False)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, remaining = parser.parse_known_args(argv)
+    if remaining and args.command not in _OWN_OPTIONS:
+        parser.error(f"unrecognized arguments: {' '.join(remaining)}")
+    # Each command imports only its own module, so a pump-only run never
+    # loads seabreeze, matplotlib or pandas
+    if args.command == "pump":
+        from .pump import main as run
+        return run(args.port, args.broker)
+    if args.command == "measure":
+        from .measure import main as run
+    elif args.command == "synthesize":
+        from .synthesize import main as run
+    elif args.command == "multi":
+        from .multi_device import main as run
+        return run(remaining)
+    elif args.command == "optimize":
+        from .optimizer import main as run
+        return run(remaining)
+    elif args.command == "batch":
+        from .batch import main as run
+        return run(remaining)
+    elif args.command == "kinetics":
+        from .kinetics import main as run
+        return run(remaining)
+    elif args.command == "broker":
+        from .broker import main as run
+        return run(remaining)
+    elif args.command == "replay":
+        from .replay import main as run
+        return run(remaining)
+    elif args.command == "reduce":
+        from .reduction import main as run
+        return run(remaining)
+    elif args.command == "features":
+        from .spr_features import main as run
+        return run(remaining)
+    elif args.command == "export":
+        from .spectrum_store import main as run
+        return run(remaining)
+    elif args.resume is not None:
+        from .recipe import run_recipe
+        return run_recipe(args.resume, broker=args.broker, resume=True)
+    elif args.recipe is not None:
+        from .recipe import run_recipe
+        return run_recipe(args.recipe, args.dry_run, broker=args.broker)
+    else:
+        from .sweep import main as run
+    return run(args.serial_number, args.integration_time)
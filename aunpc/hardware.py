@@ -0,0 +1,84 @@
+from .auto_exposure import MAX_INTEGRATION_TIME, MIN_INTEGRATION_TIME, auto_exposure
+from .instrumentation import timed
+from .processing import StreamingAverager
+
+
+def _seabreeze():
+    # seabreeze takes a while to import and to load its backend, so only the
+    # commands that talk to a spectrometer pay for it
+    import seabreeze
+    seabreeze.use('cseabreeze')
+    from seabreeze import spectrometers
+    return spectrometers
+
+
+def open_spectrometer(serial_number, integration_time=None):
+    spec = _seabreeze().Spectrometer.from_serial_number(serial_number)
+    if integration_time not in (None, 'auto'):
+        spec.integration_time_micros(integration_time)
+    return spec
+
+
+def list_serial_numbers():
+    return [device.serial_number for device in _seabreeze().list_devices()]
+
+
+def get_spectrometer(serial_number=None):
+    if serial_number is not None:
+        return open_spectrometer(serial_number)
+    devices = _seabreeze().list_devices()
+    if not devices:
+        print("No spectrometers found.")
+        return None
+    print("Available spectrometers:")
+    for i, device in enumerate(devices):
+        print(f"{i + 1}: {device}")
+
+    while True:
+        try:
+            index = int(input("Enter the number of the spectrometer you want to use: ")) - 1
+            if 0 <= index < len(devices):
+                spec = open_spectrometer(devices[index].serial_number)
+                print(f"Spectrometer initialized successfully with serial number: {spec.serial_number}")
+                return spec
+            else:
+                print("Invalid selection. Please enter a number from the list.")
+        except ValueError:
+            print("Invalid input. Please enter a valid number.")
+
+
+def set_integration_time(spec, integration_time=None):
+    # Prompts unless integration_time is given; 'auto' runs auto exposure,
+    # which needs the reference in the light path
+    while True:
+        answer = integration_time
+        if answer is None:
+            answer = input(f"Enter the integration time in microseconds (range: {MIN_INTEGRATION_TIME} - {MAX_INTEGRATION_TIME}), "
+                           "or 'auto' with the reference in place: ").strip()
+        try:
+            if str(answer).lower() == 'auto':
+                return auto_exposure(spec)
+            answer = int(answer)
+            if MIN_INTEGRATION_TIME <= answer <= MAX_INTEGRATION_TIME:
+                spec.integration_time_micros(answer)
+                print(f"Integration time set to {answer} microseconds.")
+                return answer
+            else:
+                print(f"Integration time out of range. Please enter a value between {MIN_INTEGRATION_TIME} and {MAX_INTEGRATION_TIME}.")
+        except ValueError:
+            print("Invalid input. Please enter an integer value.")
+        if integration_time is not None:
+            raise ValueError(f"Invalid integration time: {integration_time!r}")
+
+
+@timed('collect')
+def collect_intensity_arrays(spec, integration_time, num_measurements=10):
+    # Reads the detector directly, for scripts that do not run a
+    # ContinuousAcquisition; the integration time is already set on spec
+    wavelengths = spec.wavelengths()
+    averager = StreamingAverager(len(wavelengths))
+
+    for _ in range(num_measurements):
+        averager.update(spec.intensities())
+
+    return averager.mean, wavelengths
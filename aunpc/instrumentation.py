@@ -0,0 +1,158 @@
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Upper bounds in seconds, from fast serial replies up to long equilibration waits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    # Timing histograms keyed by stage name and labels such as the pump port
+    # or spectrometer serial number. Observations are cheap enough to leave
+    # on permanently; the JSONL trace of individual timings is only written
+    # while a run is being recorded.
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._trace = None
+        self.run_directory = None
+        self._started = time.perf_counter()
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._started = time.perf_counter()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if self._trace is not None:
+                self._trace.write(json.dumps({'time': time.time(), 'stage': name, 'seconds': seconds, **dict(key[1])}) + '\n')
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def histograms(self):
+        with self._lock:
+            return dict(self._histograms)
+
+    def start_run(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.reset()
+        self.run_directory = directory
+        with self._lock:
+            self._trace = open(os.path.join(directory, 'trace.jsonl'), 'a', buffering=1)
+
+    def finish_run(self):
+        # Writes metrics.prom next to the trace and prints the summary
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+        if self.run_directory is not None:
+            self.write_prometheus(os.path.join(self.run_directory, 'metrics.prom'))
+        print(self.summary())
+
+    def write_prometheus(self, path):
+        lines = []
+        for name in sorted({name for name, _ in self.histograms()}):
+            metric = f"aunpc_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (other, labels), histogram in sorted(self.histograms().items()):
+                if other != name:
+                    continue
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                prefix = label_text + ',' if label_text else ''
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+                suffix = f'{{{label_text}}}' if label_text else ''
+                lines.append(f"{metric}_sum{suffix} {histogram.sum:.6f}")
+                lines.append(f"{metric}_count{suffix} {histogram.count}")
+        # Written to a temporary file first so a node_exporter textfile
+        # collector never reads a half-written file
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, path)
+
+    def summary(self):
+        histograms = sorted(self.histograms().items(), key=lambda item: -item[1].sum)
+        if not histograms:
+            return "No stage timings were recorded."
+        # Stages nest (a cycle contains its steps) and the detector is read on
+        # its own thread, so each share is of the wall time since the run
+        # started rather than of the sum of all stages
+        wall_time = time.perf_counter() - self._started
+        lines = [f"Shares are of {wall_time:.2f} s wall time; nested and concurrent stages overlap.",
+                 f"{'Stage':<40}{'Count':>8}{'Total s':>10}{'Share':>8}{'Mean ms':>10}{'p95 ms':>10}{'Max ms':>10}"]
+        for (name, labels), histogram in histograms:
+            label_text = ' '.join(f"{v}" for _, v in labels)
+            stage = f"{name} {label_text}".strip()
+            lines.append(f"{stage:<40}{histogram.count:>8}{histogram.sum:>10.2f}{histogram.sum / wall_time:>8.1%}"
+                         f"{histogram.mean * 1000:>10.2f}{histogram.quantile(0.95) * 1000:>10.2f}{histogram.max * 1000:>10.2f}")
+        return '\n'.join(lines)
+
+
+METRICS = Metrics()
+timer = METRICS.timer
+timed = METRICS.timed
+observe = METRICS.observe
@@ -0,0 +1,212 @@
+import argparse
+import time
+
+import numpy as np
+
+from .spr_features import FEATURE_NAMES, extract_features
+
+# Pump settings kept with every pump event, from SyringePump.state
+PUMP_FIELDS = ('rate', 'diameter', 'volume')
+
+
+def measurement_times(started):
+    # (timestamp, monotonic) for a spectrum averaged from started until
+    # now: the middle of the averaging window, on both clocks
+    finished = time.monotonic()
+    monotonic = (started + finished) / 2
+    return time.time() - (finished - monotonic), monotonic
+
+
+def record_pump_events(store, pumps):
+    # Logs every command sent to the pumps, keyed by pump name, into the
+    # store's events.jsonl together with the pump's state after the reply.
+    # pumps is {name: SyringePump}. Each pump's current state is logged
+    # straight away so the index knows the configuration from here on.
+    def event(name, pump, command=None, ok=True):
+        state = pump.state
+        return {'kind': 'pump', 'pump': name, 'port': pump.port, 'command': command, 'ok': ok,
+                'running': state['running'], 'rate': state['rate'], 'rate_unit': state['rate_unit'],
+                'diameter': state['diameter'], 'volume': state['volume']}
+
+    for name, pump in pumps.items():
+        def listener(pump, response, sent_at, name=name):
+            store.add_event(event(name, pump, response.command, response.ok), monotonic=sent_at)
+
+        pump.listeners.append(listener)
+        store.add_event(event(name, pump))
+
+
+class _PumpTimeline:
+    # One pump's events sorted by time, as arrays for searchsorted
+    def __init__(self, events):
+        events = sorted(events, key=lambda event: event['run_time'])
+        self.times = np.array([event['run_time'] for event in events], dtype=float)
+        self.running = np.array([bool(event['running']) for event in events])
+        self.starts = np.array([event['run_time'] for event in events
+                                if event['command'] == 'RUN' and event['ok'] and event['running']], dtype=float)
+        self.fields = {name: np.array([np.nan if event[name] is None else event[name] for event in events],
+                                      dtype=float) for name in PUMP_FIELDS}
+
+    def last_event(self, times):
+        # Index of the latest event at or before each time, -1 before the first
+        return np.searchsorted(self.times, times, side='right') - 1
+
+
+class KineticsIndex:
+    # Looks spectra up by residence time, concentration or pump setting.
+    # Every spectrum's time is matched to the pump events with
+    # searchsorted, and each query column is sorted once and then searched
+    # with searchsorted, so nothing is scanned per query and no spectra are
+    # read until they are asked for.
+    #
+    # The residence time of a spectrum is measured from the latest start of
+    # a given pump, e.g. the one whose reagent starts the reaction; offset
+    # subtracts the transit time from the mixer to the flow cell.
+    def __init__(self, store, concentration_key='methyl_orange_concentration'):
+        self.store = store
+        # On one clock even if the run was resumed after a reboot, see
+        # SpectrumStore.run_times
+        self.times = store.run_times()
+        self.metadata = store.metadata()
+        self.concentration_key = concentration_key
+        events = {}
+        for event in store.events():
+            if event.get('kind') == 'pump':
+                events.setdefault(event['pump'], []).append(event)
+        self.pumps = {name: _PumpTimeline(pump_events) for name, pump_events in events.items()}
+        self._columns = {}
+        self._sorted = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def _pump(self, name):
+        if name not in self.pumps:
+            raise KeyError(f"No events for pump '{name}'. Known pumps: {sorted(self.pumps)}")
+        return self.pumps[name]
+
+    def _column(self, key, compute):
+        if key not in self._columns:
+            self._columns[key] = compute()
+        return self._columns[key]
+
+    def residence_times(self, pump, offset=0.0):
+        # Seconds since the pump was last started, NaN for spectra taken
+        # before its first start or while it was stopped
+        def compute():
+            timeline = self._pump(pump)
+            result = np.full(len(self.times), np.nan)
+            latest = timeline.last_event(self.times)
+            start = np.searchsorted(timeline.starts, self.times, side='right') - 1
+            valid = (latest >= 0) & (start >= 0)
+            valid[valid] &= timeline.running[latest[valid]]
+            result[valid] = self.times[valid] - timeline.starts[start[valid]]
+            return result
+        return self._column(('residence_time', pump), compute) - offset
+
+    def pump_settings(self, pump, field='rate'):
+        # The pump's diameter, rate or volume when each spectrum was taken
+        if field not in PUMP_FIELDS:
+            raise ValueError(f"Unknown pump field '{field}'. Expected one of {PUMP_FIELDS}.")
+
+        def compute():
+            timeline = self._pump(pump)
+            latest = timeline.last_event(self.times)
+            return np.where(latest >= 0, timeline.fields[field][np.maximum(latest, 0)], np.nan)
+        return self._column((field, pump), compute)
+
+    def concentrations(self):
+        def compute():
+            values = [metadata.get(self.concentration_key) for metadata in self.metadata]
+            return np.array([np.nan if value is None else value for value in values], dtype=float)
+        return self._column(('concentration',), compute)
+
+    def _between(self, key, values, low, high):
+        # Frame numbers with low <= value <= high, in time order
+        if key not in self._sorted:
+            order = np.argsort(values, kind='stable')
+            order = order[~np.isnan(values[order])]
+            self._sorted[key] = (values[order], order)
+        sorted_values, order = self._sorted[key]
+        first = np.searchsorted(sorted_values, low, side='left')
+        last = np.searchsorted(sorted_values, high, side='right')
+        return np.sort(order[first:last])
+
+    def by_residence_time(self, pump, low, high, offset=0.0):
+        values = self.residence_times(pump)
+        return self._between(('residence_time', pump), values, low + offset, high + offset)
+
+    def by_concentration(self, concentration, tolerance=1e-9):
+        return self._between(('concentration',), self.concentrations(),
+                             concentration - tolerance, concentration + tolerance)
+
+    def by_pump_setting(self, pump, value, field='rate', tolerance=1e-9):
+        return self._between((field, pump), self.pump_settings(pump, field), value - tolerance, value + tolerance)
+
+    def spectra(self, frames, field='absorbance'):
+        # Reads only the requested frames from the memory-mapped store
+        return np.asarray(self.store.read(field)[np.asarray(frames, dtype=int)])
+
+    def features(self, frames, **options):
+        frames = np.asarray(frames, dtype=int)
+        if len(frames) == 0:
+            return {name: np.empty(0) for name in FEATURE_NAMES}
+        return extract_features(self.store.wavelengths, self.spectra(frames), **options)
+
+    def table(self, pump, frames=None, offset=0.0, **options):
+        # Columns of frame number, residence time, concentration, the
+        # pumps' flow rates and SPR features, e.g. for batch.write_summary
+        frames = np.arange(len(self)) if frames is None else np.asarray(frames, dtype=int)
+        columns = {
+            'frame': frames,
+            'timestamp': np.asarray(self.store.index()['timestamp'])[frames],
+            'residence_time': self.residence_times(pump, offset)[frames],
+            'concentration': self.concentrations()[frames],
+        }
+        for name in self.pumps:
+            columns[f'{name}_rate'] = self.pump_settings(name)[frames]
+        columns.update(self.features(frames, **options))
+        return columns
+
+
+def main(argv=None):
+    from .batch import write_summary
+    from .spectrum_store import SpectrumStore
+
+    parser = argparse.ArgumentParser(prog="aunpc kinetics",
+                                     description="Tabulate a run's spectra against residence time.")
+    parser.add_argument("store", help="spectrum store directory")
+    parser.add_argument("--pump", help="residence time is measured from this pump's last start "
+                                       "(default: the last pump to be started)")
+    parser.add_argument("--offset", type=float, default=0.0, help="transit time to the flow cell in seconds")
+    parser.add_argument("--min", type=float, default=-np.inf, help="shortest residence time to include")
+    parser.add_argument("--max", type=float, default=np.inf, help="longest residence time to include")
+    parser.add_argument("--concentration", type=float, help="only spectra at this concentration")
+    parser.add_argument("--roi", type=float, nargs=2, default=(450.0, 700.0), help="peak search range in nm")
+    parser.add_argument("--output", help="write the table (.npz, .csv or .parquet)")
+    args = parser.parse_args(argv)
+
+    with SpectrumStore(args.store) as store:
+        index = KineticsIndex(store)
+        if not index.pumps:
+            print(f"{args.store} has no pump events.")
+            return
+        pump = args.pump
+        if pump is None:
+            pump = max(index.pumps, key=lambda name: index.pumps[name].starts.max(initial=-np.inf))
+        frames = index.by_residence_time(pump, args.min, args.max, args.offset)
+        if args.concentration is not None:
+            frames = np.intersect1d(frames, index.by_concentration(args.concentration, 1e-6))
+        table = index.table(pump, frames, args.offset, roi=tuple(args.roi))
+
+    print(f"{len(frames)} spectra, residence time from the last start of '{pump}':")
+    for i in range(len(frames)):
+        print(f"  spectrum {table['frame'][i]}: {table['residence_time'][i]:.1f} s, "
+              f"concentration {table['concentration'][i]:g}, peak {table['peak_wavelength'][i]:.1f} nm")
+    if args.output:
+        write_summary(table, args.output)
+        print(f"The table has been written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
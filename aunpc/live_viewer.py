@@ -0,0 +1,186 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .processing import AbsorbanceCalculator
+
+
+def _finite_limits(data, current):
+    finite = data[np.isfinite(data)]
+    if finite.size == 0:
+        return current
+    low, high = finite.min(), finite.max()
+    if current[0] <= low and high <= current[1]:
+        return current
+    margin = 0.1 * (high - low or 1.0)
+    return low - margin, high + margin
+
+
+def _run_viewer(frames, commands, wavelengths, max_fps, title):
+    # Runs in its own process so that drawing, window events and savefig
+    # never hold up acquisition or pump control in the experiment process
+    import matplotlib.pyplot as plt
+
+    fig, (raw_ax, absorbance_ax) = plt.subplots(2, 1, sharex=True)
+    fig.suptitle(title)
+    raw_ax.set_ylabel('Intensity')
+    absorbance_ax.set_ylabel('Absorbance')
+    absorbance_ax.set_xlabel('Wavelength (nm)')
+    axes = {'raw': raw_ax, 'absorbance': absorbance_ax}
+    empty = np.full_like(wavelengths, np.nan)
+    live_lines = {
+        'raw': raw_ax.plot(wavelengths, empty, color='k', lw=1, animated=True, label='Live')[0],
+        'absorbance': absorbance_ax.plot(wavelengths, empty, color='k', lw=1, animated=True, label='Live')[0],
+    }
+    limits = {'raw': (0.0, 1.0), 'absorbance': (0.0, 1.0)}
+    static_lines = {}
+    for kind, ax in axes.items():
+        ax.set_xlim(wavelengths[0], wavelengths[-1])
+        ax.set_ylim(*limits[kind])
+    plt.show(block=False)
+
+    def redraw():
+        for kind, ax in axes.items():
+            ax.set_ylim(*limits[kind])
+        fig.canvas.draw()
+        return fig.canvas.copy_from_bbox(fig.bbox)
+
+    background = redraw()
+    # A resized window invalidates the saved background
+    resized = threading.Event()
+    fig.canvas.mpl_connect('resize_event', lambda event: resized.set())
+    frame_interval = 1.0 / max_fps
+
+    while plt.fignum_exists(fig.number):
+        started = time.monotonic()
+        needs_redraw = resized.is_set()
+        resized.clear()
+
+        while True:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+            if command[0] == 'close':
+                plt.close(fig)
+                return
+            if command[0] == 'static':
+                _, kind, label, data = command
+                if label in static_lines:
+                    static_lines[label].set_ydata(data)
+                else:
+                    static_lines[label] = axes[kind].plot(wavelengths, data, lw=1, label=label)[0]
+                    axes[kind].legend(loc='upper right')
+                limits[kind] = _finite_limits(data, limits[kind])
+                needs_redraw = True
+            elif command[0] == 'snapshot':
+                fig.savefig(command[1])
+
+        latest = None
+        while True:
+            try:
+                latest = frames.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None:
+            for kind, data in zip(('raw', 'absorbance'), latest):
+                if data is None:
+                    continue
+                live_lines[kind].set_ydata(data)
+                new_limits = _finite_limits(data, limits[kind])
+                if new_limits != limits[kind]:
+                    limits[kind] = new_limits
+                    needs_redraw = True
+
+        if needs_redraw:
+            background = redraw()
+        if needs_redraw or latest is not None:
+            fig.canvas.restore_region(background)
+            for kind, line in live_lines.items():
+                axes[kind].draw_artist(line)
+            fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+        time.sleep(max(0.0, frame_interval - (time.monotonic() - started)))
+
+
+class LiveViewer:
+    # Shows the latest raw spectrum and its absorbance while the experiment
+    # runs. A feeder thread samples the acquisition ring buffer at most
+    # max_fps times a second and hands decimated traces to the viewer
+    # process; if the viewer falls behind, frames are dropped, never queued.
+    def __init__(self, acquisition=None, wavelengths=None, max_fps=10, max_points=500, title="Live spectrum"):
+        self.acquisition = acquisition
+        if wavelengths is None:
+            wavelengths = acquisition.wavelengths
+        self.max_fps = max_fps
+        self.title = title
+        self._decimation = slice(None, None, max(1, int(np.ceil(len(wavelengths) / max_points))))
+        self.wavelengths = np.asarray(wavelengths)[self._decimation]
+        self._calculator = None
+        self._absorbance = np.empty(len(wavelengths))
+        self._frames = multiprocessing.Queue(maxsize=2)
+        self._commands = multiprocessing.Queue()
+        self._process = None
+        self._stop_event = threading.Event()
+        self._feeder = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        self._process = multiprocessing.Process(
+            target=_run_viewer,
+            args=(self._frames, self._commands, self.wavelengths, self.max_fps, self.title),
+            name="live-viewer",
+            daemon=True,
+        )
+        self._process.start()
+        if self.acquisition is not None:
+            self._feeder = threading.Thread(target=self._feed, name="live-viewer-feeder", daemon=True)
+            self._feeder.start()
+        return self
+
+    def _feed(self):
+        last_count = 0
+        while not self._stop_event.wait(1.0 / self.max_fps):
+            count = self.acquisition.buffer.count
+            if count == last_count:
+                continue
+            last_count = count
+            spectra, _ = self.acquisition.buffer.latest(1)
+            absorbance = None
+            calculator = self._calculator
+            if calculator is not None:
+                absorbance = calculator(spectra[0], out=self._absorbance)[self._decimation]
+            try:
+                self._frames.put_nowait((spectra[0][self._decimation], absorbance))
+            except queue.Full:
+                pass
+
+    def set_calibration(self, reference, background):
+        self._calculator = AbsorbanceCalculator(reference, background)
+
+    def show(self, data, label, kind='raw'):
+        # Adds or replaces a fixed trace, e.g. the reference spectrum
+        self._commands.put(('static', kind, label, np.asarray(data)[self._decimation]))
+
+    def snapshot(self, path):
+        # Saved by the viewer process; returns immediately
+        self._commands.put(('snapshot', path))
+
+    def close(self, timeout=5.0):
+        self._stop_event.set()
+        if self._feeder is not None:
+            self._feeder.join()
+        if self._process is not None:
+            self._commands.put(('close',))
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
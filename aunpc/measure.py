@@ -0,0 +1,73 @@
+import os
+
+from .calibration_cache import load_or_acquire_calibration
+from .hardware import collect_intensity_arrays, get_spectrometer, set_integration_time
+from .instrumentation import METRICS, timed, timer
+from .processing import calculate_absorbance
+
+
+@timed('blocking_plot')
+def plot_spectrum(wavelengths, data, title, y_label):
+    import matplotlib.pyplot as plt
+
+    plt.figure()
+    plt.plot(wavelengths, data)
+    plt.xlabel('Wavelength (nm)')
+    plt.ylabel(y_label)
+    plt.title(title)
+    plt.show()
+
+
+def save_to_csv(wavelengths, absorbance):
+    while True:
+        file_path = input("Enter the file path to save the absorbance data (including the file name and .csv extension): ")
+        if not file_path.endswith('.csv'):
+            print("Invalid file extension. Please ensure the file name ends with .csv")
+            continue
+        
+        directory = os.path.dirname(file_path)
+        if not os.path.exists(directory) and directory != '':
+            print(f"Directory '{directory}' does not exist. Please enter a valid directory.")
+            continue
+
+        try:
+            import pandas as pd
+
+            data = {'Wavelength': wavelengths, 'Absorbance': absorbance}
+            with timer('csv_write'):
+                df = pd.DataFrame(data)
+                df.to_csv(file_path, index=False)
+            print(f"Data has been written to {file_path}")
+            break
+        except Exception as e:
+            print(f"Failed to save file: {e}. Please try again.")
+
+
+def main(serial_number=None, integration_time=None):
+    spec = get_spectrometer(serial_number)
+    if spec:
+        integration_time = set_integration_time(spec, integration_time)
+        print(f"Spectrometer {spec.serial_number} is ready with an integration time of {integration_time} microseconds.")
+        
+        reference_intensities, background_intensities = load_or_acquire_calibration(
+            lambda n: collect_intensity_arrays(spec, integration_time, n),
+            spec.serial_number, integration_time, num_measurements=10)
+        wavelengths = spec.wavelengths()
+        plot_spectrum(wavelengths, reference_intensities, "Reference Spectrum", "Intensity")
+        plot_spectrum(wavelengths, background_intensities, "Background Spectrum", "Intensity")
+
+        input("Press Enter to measure the absorbance of the sample...")
+        sample_intensities, _ = collect_intensity_arrays(spec, integration_time, num_measurements=10)
+        absorbance = calculate_absorbance(sample_intensities, reference_intensities, background_intensities)
+        plot_spectrum(wavelengths, absorbance, "Absorbance Spectrum", "Absorbance")
+
+        save_to_csv(wavelengths, absorbance)
+        
+        print("Absorbance measurement and data saving completed.")
+        print(METRICS.summary())
+    else:
+        print("No spectrometer initialized.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .acquisition import ContinuousAcquisition, SpectrumRingBuffer
+from .auto_exposure import auto_exposure
+from .calibration_cache import CalibrationCache, drift_check
+from .hardware import list_serial_numbers, open_spectrometer
+from .processing import AbsorbanceCalculator
+from .spectrum_store import SpectrumStore
+
+
+class SharedSpectrumRingBuffer(SpectrumRingBuffer):
+    # SpectrumRingBuffer whose frames, timestamps and frame count live in
+    # shared memory, so a worker process writes spectra that the parent
+    # reads in place. The process that creates it owns the memory and
+    # unlinks it on close; forked or unpickled copies only detach.
+    def __init__(self, capacity, num_pixels):
+        self.capacity = capacity
+        self.num_pixels = num_pixels
+        self._shm = shared_memory.SharedMemory(create=True, size=8 * (1 + capacity + capacity * num_pixels))
+        self._owner_pid = os.getpid()
+        self._lock = multiprocessing.Lock()
+        self._new_frame = multiprocessing.Condition(self._lock)
+        self._attach()
+
+    def _attach(self):
+        self._counter = np.ndarray(1, dtype=np.int64, buffer=self._shm.buf)
+        self._timestamps = np.ndarray(self.capacity, dtype=np.float64, buffer=self._shm.buf, offset=8)
+        self._spectra = np.ndarray((self.capacity, self.num_pixels), dtype=np.float64, buffer=self._shm.buf,
+                                   offset=8 * (1 + self.capacity))
+
+    @property
+    def _count(self):
+        return int(self._counter[0])
+
+    @_count.setter
+    def _count(self, value):
+        self._counter[0] = value
+
+    def __getstate__(self):
+        return {
+            'capacity': self.capacity,
+            'num_pixels': self.num_pixels,
+            'name': self._shm.name,
+            'lock': self._lock,
+            'new_frame': self._new_frame,
+        }
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.num_pixels = state['num_pixels']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner_pid = None
+        self._lock = state['lock']
+        self._new_frame = state['new_frame']
+        self._attach()
+
+    def close(self):
+        if self._shm is None:
+            return
+        # The numpy views must go before the mapping can be closed
+        self._counter = self._timestamps = self._spectra = None
+        self._shm.close()
+        if self._owner_pid == os.getpid():
+            self._shm.unlink()
+        self._shm = None
+
+
+def _acquire(open_device, serial_number, integration_time, buffer, stop_event, ready, integration_time_value, errors):
+    # Runs in the worker process: one spectrometer, read back-to-back into
+    # the shared buffer. The device is opened here because USB handles
+    # cannot be shared between processes.
+    spec = None
+    try:
+        spec = open_device(serial_number)
+        if integration_time == 'auto':
+            integration_time = auto_exposure(spec)
+        else:
+            spec.integration_time_micros(integration_time)
+        integration_time_value.value = int(integration_time)
+        ready.set()
+        while not stop_event.is_set():
+            intensities = spec.intensities()
+            buffer.append(intensities, time.monotonic())
+    except Exception as e:
+        errors.put(f"{type(e).__name__}: {e}")
+    finally:
+        if spec is not None and hasattr(spec, 'close'):
+            spec.close()
+        buffer.close()
+
+
+class ProcessAcquisition(ContinuousAcquisition):
+    # ContinuousAcquisition for one spectrometer read by its own worker
+    # process, so slow driver calls on one detector never hold up another.
+    # collect, wait_for_frames and frame_rate work unchanged on the shared
+    # buffer, and so does everything built on them (collect_adaptive,
+    # wait_for_steady_state, LiveViewer). integration_time is in
+    # microseconds or 'auto'; the drivers cannot read back the device's
+    # current setting, which the calibration cache and the stores need.
+    def __init__(self, serial_number, integration_time, capacity=1024, open_device=open_spectrometer):
+        if integration_time is None:
+            raise ValueError(f"Give spectrometer {serial_number} an integration time in microseconds or 'auto'.")
+        self.serial_number = serial_number
+        self.requested_integration_time = integration_time
+        self.open_device = open_device
+        # Open the device once here to size the buffer; the worker reopens it
+        spec = open_device(serial_number)
+        try:
+            self.wavelengths = spec.wavelengths()
+        finally:
+            if hasattr(spec, 'close'):
+                spec.close()
+        self.buffer = SharedSpectrumRingBuffer(capacity, len(self.wavelengths))
+        self._integration_time = multiprocessing.Value('q', 0)
+        self._stop_event = multiprocessing.Event()
+        self._ready = multiprocessing.Event()
+        self._errors = multiprocessing.Queue()
+        self._error = None
+        self._process = None
+
+    @property
+    def integration_time(self):
+        return self._integration_time.value or None
+
+    @property
+    def error(self):
+        try:
+            self._error = self._errors.get_nowait()
+        except queue.Empty:
+            pass
+        return self._error
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.is_alive()
+
+    def start(self, wait=True, timeout=60.0):
+        if self.running:
+            return self
+        self._error = None
+        self._stop_event.clear()
+        self._ready.clear()
+        self._process = multiprocessing.Process(
+            target=_acquire,
+            args=(self.open_device, self.serial_number, self.requested_integration_time, self.buffer,
+                  self._stop_event, self._ready, self._integration_time, self._errors),
+            name=f"acquisition-{self.serial_number}",
+            daemon=True,
+        )
+        self._process.start()
+        if wait:
+            self.wait_until_ready(timeout)
+        return self
+
+    def wait_until_ready(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while not self._ready.wait(0.1):
+            if not self.running:
+                raise RuntimeError(f"Acquisition from {self.serial_number} failed to start: {self.error}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Spectrometer {self.serial_number} did not start within {timeout} s.")
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._process is not None:
+            self._process.join(timeout)
+            self._process = None
+
+    def close(self):
+        self.stop()
+        self.buffer.close()
+
+
+class MultiDeviceAcquisition:
+    # Several spectrometers acquired in parallel, e.g. at different
+    # residence times along the reactor. devices maps serial number to
+    # integration time (microseconds or 'auto'). Each device has its own
+    # worker process, calibration and SpectrumStore; collect and record
+    # read all devices concurrently.
+    def __init__(self, devices, capacity=1024, open_device=open_spectrometer):
+        self.devices = {serial_number: ProcessAcquisition(serial_number, integration_time, capacity, open_device)
+                        for serial_number, integration_time in devices.items()}
+        self.calculators = {}
+        self.calibrations = {}
+        self.stores = {}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.devices)), thread_name_prefix="multi-device")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        # Start every worker before waiting, so auto exposure and device
+        # start-up overlap
+        for device in self.devices.values():
+            device.start(wait=False)
+        for device in self.devices.values():
+            device.wait_until_ready()
+        return self
+
+    def stop(self):
+        for device in self.devices.values():
+            device._stop_event.set()
+        for device in self.devices.values():
+            device.stop()
+
+    def close(self):
+        self.stop()
+        for store in self.stores.values():
+            store.close()
+        self._pool.shutdown(wait=True)
+        for device in self.devices.values():
+            device.buffer.close()
+
+    def _map(self, function):
+        futures = {serial_number: self._pool.submit(function, device) for serial_number, device in self.devices.items()}
+        return {serial_number: future.result() for serial_number, future in futures.items()}
+
+    def frame_rates(self, n=100):
+        return {serial_number: device.frame_rate(n) for serial_number, device in self.devices.items()}
+
+    def collect(self, num_measurements=10, timeout=None):
+        # {serial_number: (intensities, monotonic time the average completed)}
+        def collect_one(device):
+            intensities, _ = device.collect(num_measurements, timeout)
+            return intensities.copy(), time.monotonic()
+        return self._map(collect_one)
+
+    def _set_calibration(self, serial_number, reference, background):
+        self.calibrations[serial_number] = (reference, background)
+        self.calculators[serial_number] = AbsorbanceCalculator(reference, background)
+        if serial_number in self.stores:
+            self.stores[serial_number].add_calibration(reference, background)
+
+    def calibrate(self, num_measurements=10, cache=None, tolerance=0.01):
+        # One set of prompts for all devices. Cached calibrations are reused
+        # only if every device passes its drift check.
+        if cache is None:
+            cache = CalibrationCache()
+        cached = {serial_number: cache.load(serial_number, device.integration_time, num_measurements)
+                  for serial_number, device in self.devices.items()}
+        if all(entry is not None for entry in cached.values()):
+            input("Cached calibrations found. Put the reference in place and press Enter for a quick drift check...")
+            checks = self._map(lambda device: drift_check(device.collect, cached[device.serial_number]['reference'],
+                                                          cached[device.serial_number]['background'], tolerance=tolerance))
+            for serial_number, (ok, deviation) in checks.items():
+                print(f"{serial_number}: drift {deviation:.2%}")
+            if all(ok for ok, _ in checks.values()):
+                for serial_number, entry in cached.items():
+                    self._set_calibration(serial_number, entry['reference'], entry['background'])
+                return self.calibrations
+            print("At least one reference has drifted; recalibrating all spectrometers.")
+
+        input("Press Enter to store the reference spectra...")
+        references = self.collect(num_measurements)
+        input("Press Enter to collect the background spectra...")
+        backgrounds = self.collect(num_measurements)
+        for serial_number, device in self.devices.items():
+            reference, background = references[serial_number][0], backgrounds[serial_number][0]
+            cache.save(serial_number, device.integration_time, num_measurements, device.wavelengths, reference, background)
+            self._set_calibration(serial_number, reference, background)
+        return self.calibrations
+
+    def open_stores(self, directory, run_metadata=None, chunk_frames=64, reduction=None, compression=None):
+        # One store per device under directory, named by serial number.
+        # reduction is a dict of SpectralReduction options, applied to each
+        # device's own wavelengths.
+        for serial_number, device in self.devices.items():
+            metadata = dict(run_metadata or {}, spectrometer=serial_number, integration_time=device.integration_time)
+            self.stores[serial_number] = SpectrumStore(os.path.join(directory, serial_number), device.wavelengths,
+                                                       metadata, chunk_frames, reduction, compression)
+            if serial_number in self.calibrations:
+                self.stores[serial_number].add_calibration(*self.calibrations[serial_number])
+        return self.stores
+
+    def record(self, num_measurements=10, metadata=None):
+        # Averages a spectrum from every device and appends it to that
+        # device's store; returns {serial_number: frame number}
+        frame_numbers = {}
+        for serial_number, (intensities, monotonic) in self.collect(num_measurements).items():
+            absorbance = self.calculators[serial_number](intensities)
+            frame_numbers[serial_number] = self.stores[serial_number].append(intensities, absorbance, metadata,
+                                                                             monotonic=monotonic)
+        return frame_numbers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="aunpc multi", description="Record absorbance spectra from several spectrometers in parallel.")
+    parser.add_argument("--serial", dest="serial_numbers", nargs='+', help="spectrometers to use (default: all connected)")
+    parser.add_argument("--integration-time", nargs='+', default=['auto'],
+                        help="integration time in microseconds or 'auto', one for all devices or one per device")
+    parser.add_argument("--num-measurements", type=int, default=10, help="spectra averaged per recorded point")
+    parser.add_argument("--count", type=int, default=10, help="number of points to record")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between recorded points")
+    parser.add_argument("--output", default=os.path.join(os.path.expanduser('~'), 'Desktop'), help="output directory")
+    parser.add_argument("--roi", type=float, nargs=2, help="only store this wavelength range in nm")
+    parser.add_argument("--bin", dest="bin_size", type=int, default=1, help="average this many adjacent pixels before storing")
+    parser.add_argument("--float32", action="store_true", help="store spectra as float32")
+    parser.add_argument("--compress", action="store_true", help="zlib-compress the stored spectra")
+    args = parser.parse_args(argv)
+
+    serial_numbers = args.serial_numbers or list_serial_numbers()
+    if not serial_numbers:
+        print("No spectrometers found.")
+        return
+    integration_times = [value if value == 'auto' else int(value) for value in args.integration_time]
+    if len(integration_times) == 1:
+        integration_times = integration_times * len(serial_numbers)
+    if len(integration_times) != len(serial_numbers):
+        parser.error("Give one integration time for all spectrometers or one per spectrometer.")
+    if 'auto' in integration_times:
+        input("Put the reference in place and press Enter to set the integration times...")
+
+    directory = os.path.join(args.output, datetime.now().strftime("multi_device_run_%Y%m%d%H%M%S"))
+    with MultiDeviceAcquisition(dict(zip(serial_numbers, integration_times))) as acquisition:
+        for serial_number, device in acquisition.devices.items():
+            print(f"{serial_number}: integration time {device.integration_time} microseconds")
+        acquisition.calibrate(args.num_measurements)
+        reduction = None
+        if args.roi or args.bin_size > 1 or args.float32:
+            reduction = {'roi': args.roi, 'bin_size': args.bin_size, 'dtype': '<f4' if args.float32 else '<f8'}
+        acquisition.open_stores(directory, reduction=reduction, compression='zlib' if args.compress else None)
+        input("Press Enter to start recording...")
+        for i in range(args.count):
+            started = time.monotonic()
+            acquisition.record(args.num_measurements, {'point': i})
+            rates = ', '.join(f"{serial_number} {rate:.1f} fps" for serial_number, rate in acquisition.frame_rates().items())
+            print(f"Point {i + 1}/{args.count}: {rates}")
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    print(f"Spectra have been written to {directory}")
+
+
+if __name__ == "__main__":
+    main()
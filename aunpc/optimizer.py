@@ -0,0 +1,201 @@
+import argparse
+
+import numpy as np
+
+from .spr_features import extract_features
+
+# Objective given to experiments whose spectrum has no usable SPR peak
+FAILED_EXPERIMENT = 1e6
+
+
+class NelderMead:
+    # Bounded Nelder-Mead simplex in ask/tell form: ask() returns the next
+    # point to measure and tell(value) reports its objective. Points are
+    # clipped to the bounds, so nothing outside the recipe's allowed range
+    # is ever proposed. Needs no gradients and copes with noisy objectives,
+    # and only one new experiment is required per step.
+    def __init__(self, initial, step, bounds, xtol=1e-3, alpha=1.0, gamma=2.0, rho=0.5, sigma=0.5):
+        self.bounds = np.asarray(bounds, dtype=float).reshape(-1, 2)
+        self.xtol = xtol
+        self.alpha = alpha
+        self.gamma = gamma
+        self.rho = rho
+        self.sigma = sigma
+        self.simplex = None
+        self.values = None
+        self.history = []
+        self._search = self._nelder_mead(np.asarray(initial, dtype=float), np.asarray(step, dtype=float))
+        self._pending = next(self._search)
+
+    def _clip(self, point):
+        return np.clip(point, self.bounds[:, 0], self.bounds[:, 1])
+
+    def ask(self):
+        return self._pending.copy()
+
+    def tell(self, value):
+        self.history.append((self._pending.copy(), value))
+        self._pending = self._search.send(value)
+
+    @property
+    def best(self):
+        if not self.history:
+            return None, None
+        return min(self.history, key=lambda item: item[1])
+
+    @property
+    def converged(self):
+        # The simplex has shrunk below xtol in every parameter
+        return self.simplex is not None and bool(np.all(np.ptp(self.simplex, axis=0) <= self.xtol))
+
+    def _replace_worst(self, point, value):
+        self.simplex[-1] = point
+        self.values[-1] = value
+
+    def _nelder_mead(self, initial, step):
+        first = self._clip(initial)
+        points = [first]
+        for i in range(len(first)):
+            point = first.copy()
+            point[i] += step[i]
+            # Step the other way if the first vertex sits on the upper bound
+            if point[i] > self.bounds[i, 1]:
+                point[i] = first[i] - step[i]
+            points.append(self._clip(point))
+        values = []
+        for point in points:
+            values.append((yield point))
+        self.simplex = np.array(points)
+        self.values = np.array(values, dtype=float)
+
+        while True:
+            order = np.argsort(self.values, kind='stable')
+            self.simplex = self.simplex[order]
+            self.values = self.values[order]
+            centroid = self.simplex[:-1].mean(axis=0)
+            worst = self.values[-1]
+
+            reflected = self._clip(centroid + self.alpha * (centroid - self.simplex[-1]))
+            reflected_value = yield reflected
+            if reflected_value < self.values[0]:
+                expanded = self._clip(centroid + self.gamma * (reflected - centroid))
+                expanded_value = yield expanded
+                if expanded_value < reflected_value:
+                    self._replace_worst(expanded, expanded_value)
+                else:
+                    self._replace_worst(reflected, reflected_value)
+            elif reflected_value < self.values[-2]:
+                self._replace_worst(reflected, reflected_value)
+            else:
+                if reflected_value < worst:
+                    contracted = self._clip(centroid + self.rho * (reflected - centroid))
+                else:
+                    contracted = self._clip(centroid + self.rho * (self.simplex[-1] - centroid))
+                contracted_value = yield contracted
+                if contracted_value < min(reflected_value, worst):
+                    self._replace_worst(contracted, contracted_value)
+                else:
+                    # Shrink towards the best vertex
+                    for i in range(1, len(self.simplex)):
+                        self.simplex[i] = self._clip(self.simplex[0] + self.sigma * (self.simplex[i] - self.simplex[0]))
+                        self.values[i] = yield self.simplex[i]
+
+
+def objective(features, targets, tolerances):
+    # Sum of squared misses, each in units of that feature's tolerance
+    total = 0.0
+    for name, target in targets.items():
+        value = features[name]
+        if not np.isfinite(value):
+            return FAILED_EXPERIMENT
+        total += ((value - target) / tolerances[name]) ** 2
+    return total
+
+
+def on_target(features, targets, tolerances):
+    return all(abs(features[name] - target) <= tolerances[name] for name, target in targets.items())
+
+
+def optimize(runner, settings):
+    # Closed loop over a RecipeRunner: propose recipe variables, run one
+    # condition with them, read the SPR features of the measured spectrum
+    # and feed the miss back to the simplex. Stops once every target is
+    # within tolerance, the simplex has converged, or max_experiments have
+    # run. Points that round to an already measured condition reuse that
+    # result instead of spending reagent on a repeat.
+    #
+    # settings is the recipe's "optimize" section, e.g.
+    #   {"parameters": {"c": [0.0, 2.5]}, "targets": {"peak_wavelength": 530},
+    #    "tolerances": {"peak_wavelength": 1.0}, "max_experiments": 15}
+    # A parameter named "c" is the condition's concentration; any other
+    # name overrides the recipe variable of that name.
+    names = list(settings['parameters'])
+    bounds = [settings['parameters'][name] for name in names]
+    initial = [settings.get('initial', {}).get(name, (low + high) / 2) for name, (low, high) in zip(names, bounds)]
+    step = [settings.get('step', {}).get(name, (high - low) / 4) for name, (low, high) in zip(names, bounds)]
+    resolution = np.array([settings.get('resolution', {}).get(name, 0.01) for name in names])
+    targets = settings['targets']
+    tolerances = {name: settings.get('tolerances', {}).get(name, 1.0) for name in targets}
+    max_experiments = settings.get('max_experiments', 15)
+    feature_options = {'roi': tuple(settings.get('roi', (450.0, 700.0)))}
+
+    search = NelderMead(initial, step, bounds, xtol=resolution)
+    measured = {}
+    best = None
+    try:
+        runner.run_setup()
+        # Cache hits cost nothing, but a fully collapsed simplex could keep
+        # proposing the same condition; cap the number of proposals as well
+        for _ in range(50 * max_experiments):
+            if len(measured) >= max_experiments or search.converged:
+                break
+            point = np.round(search.ask() / resolution) * resolution
+            key = tuple(float(value) for value in np.round(point, 10))
+            if key not in measured:
+                variables = dict(zip(names, key))
+                concentration = variables.pop('c', settings.get('concentration'))
+                runner.variables = variables
+                frame_number = runner.run_condition(concentration)[-1]
+                absorbance = runner.store.read('absorbance', frame_number, frame_number + 1)[0]
+                features = extract_features(runner.store.wavelengths, absorbance, **feature_options)
+                value = objective(features, targets, tolerances)
+                measured[key] = value
+                summary = ', '.join(f"{name} {features[name]:.2f}" for name in targets)
+                print(f"Experiment {len(measured)}: {dict(zip(names, key))} -> {summary} (objective {value:.3g})")
+                if best is None or value < best['objective']:
+                    best = {'parameters': dict(zip(names, key)), 'features': features, 'objective': value,
+                            'frame_number': frame_number}
+                if on_target(features, targets, tolerances):
+                    print("All targets are within tolerance.")
+                    break
+            search.tell(measured[key])
+    finally:
+        runner.shutdown()
+
+    runner.store.update_run_metadata(optimization={
+        'settings': settings,
+        'experiments': len(measured),
+        'best': best,
+    })
+    if best is not None:
+        print(f"Best conditions after {len(measured)} experiments: {best['parameters']} "
+              f"(objective {best['objective']:.3g}, spectrum {best['frame_number']})")
+    return best
+
+
+def main(argv=None):
+    from .broker import DEFAULT_ADDRESS
+    from .recipe import run_recipe
+
+    parser = argparse.ArgumentParser(prog="aunpc optimize",
+                                     description="Search recipe conditions for a target SPR peak in closed loop.")
+    parser.add_argument("recipe", help="JSON recipe file with an 'optimize' section")
+    parser.add_argument("--broker", nargs='?', const=DEFAULT_ADDRESS, metavar="HOST:PORT",
+                        help="use the devices held by a running 'aunpc broker'")
+    args = parser.parse_args(argv)
+    run_recipe(args.recipe, run=lambda runner: optimize(runner, runner.recipe['optimize']), broker=args.broker,
+               kind='optimize')
+
+
+if __name__ == "__main__":
+    main()
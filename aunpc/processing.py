@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class StreamingAverager:
+    # Running per-pixel mean and variance (Welford), updated in place so that
+    # averaging thousands of scans needs no more memory than averaging one
+    def __init__(self, num_pixels):
+        self.num_pixels = num_pixels
+        self.count = 0
+        self._mean = np.zeros(num_pixels)
+        self._m2 = np.zeros(num_pixels)
+        self._delta = np.empty(num_pixels)
+        self._scratch = np.empty(num_pixels)
+
+    def reset(self):
+        self.count = 0
+        self._mean.fill(0.0)
+        self._m2.fill(0.0)
+
+    def update(self, intensities):
+        self.count += 1
+        np.subtract(intensities, self._mean, out=self._delta)
+        np.multiply(self._delta, 1.0 / self.count, out=self._scratch)
+        self._mean += self._scratch
+        np.subtract(intensities, self._mean, out=self._scratch)
+        self._scratch *= self._delta
+        self._m2 += self._scratch
+
+    @property
+    def mean(self):
+        # Live view of the running mean; copy it if the averager will be reused
+        return self._mean
+
+    def variance(self, out=None):
+        if out is None:
+            out = np.empty(self.num_pixels)
+        if self.count < 2:
+            out.fill(np.nan)
+            return out
+        return np.multiply(self._m2, 1.0 / (self.count - 1), out=out)
+
+    def standard_error(self, out=None):
+        out = self.variance(out)
+        out *= 1.0 / max(self.count, 1)
+        return np.sqrt(out, out=out)
+
+
+class AbsorbanceCalculator:
+    # The reference and background are fixed for a run, so the denominator is
+    # computed once and every sample is converted into a caller-owned buffer
+    def __init__(self, intensities_reference, intensities_background):
+        self.background = np.array(intensities_background, dtype=float)
+        self._denominator = np.subtract(intensities_reference, self.background, dtype=float)
+
+    def __call__(self, intensities_sample, out=None):
+        # intensities_sample may also be a batch of spectra, one per row
+        if out is None:
+            out = np.empty(np.broadcast(intensities_sample, self._denominator).shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.subtract(intensities_sample, self.background, out=out)
+            np.divide(out, self._denominator, out=out)
+            np.log10(out, out=out)
+            np.negative(out, out=out)
+        return out
+
+    def standard_error(self, intensities_sample, sample_standard_error, out=None):
+        # First-order propagation: dA/dS = -1 / (ln(10) * (S - B))
+        if out is None:
+            out = np.empty(np.broadcast(intensities_sample, sample_standard_error, self._denominator).shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.subtract(intensities_sample, self.background, out=out)
+            np.abs(out, out=out)
+            out *= np.log(10)
+            np.divide(sample_standard_error, out, out=out)
+        return out
+
+
+def calculate_absorbance(intensities_sample, intensities_reference, intensities_background, out=None):
+    return AbsorbanceCalculator(intensities_reference, intensities_background)(intensities_sample, out)
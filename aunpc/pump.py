@@ -0,0 +1,32 @@
+from .syringe_pump import SyringePump
+
+
+def main(port=None, broker=None):
+    if port is None:
+        port = input("Enter the COM port for the syringe pump (e.g., COM7): ")
+    try:
+        if broker is not None:
+            # The broker keeps the port open, so other clients can share it
+            from .broker import BrokerClient
+            pump = BrokerClient(broker).pump(port)
+        else:
+            pump = SyringePump(port=port)
+        if pump.is_open():
+            diameter = float(input("Enter the syringe diameter in mm: "))
+            rate = float(input("Enter the flow rate: "))
+            unit = input("Enter the unit for flow rate (e.g., UM, MM, UH, MH): ")
+            volume = float(input("Enter the volume in mL: "))
+            pump.set_syringe_diameter(diameter)
+            pump.set_flow_rate(rate, unit)
+            pump.set_volume(volume)
+            pump.start_pump()
+            input("Press Enter to stop the pump...")
+            pump.stop_pump()
+        pump.close()
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+
+if __name__ == "__main__":
+    main()
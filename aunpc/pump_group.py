@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+PumpAcknowledgement = namedtuple('PumpAcknowledgement', ['port', 'response', 'sent_at', 'completed_at'])
+
+
+class _PumpWorker:
+    # One long-lived thread per serial port so a group command never waits
+    # for a thread to be created
+    def __init__(self, pump):
+        self.pump = pump
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"pump-{pump.port}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            action, barrier, future = job
+            try:
+                barrier.wait()
+                sent_at = time.monotonic()
+                response = action(self.pump)
+                # The pump's own send time, e.g. the broker's for a remote
+                # pump, so the skew is what reached the serial lines
+                if getattr(response, 'sent_at', None) is not None:
+                    sent_at = response.sent_at
+                future.set_result(PumpAcknowledgement(self.pump.port, response, sent_at, time.monotonic()))
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, action, barrier):
+        future = Future()
+        self._jobs.put((action, barrier, future))
+        return future
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+
+class PumpGroup:
+    # Sends the same operation to several pumps at once. Every port thread
+    # waits on a shared barrier and writes its command the moment the
+    # barrier releases, so the pumps start within a few milliseconds of
+    # each other instead of one command round-trip apart.
+    def __init__(self, pumps, barrier_timeout=5.0):
+        self.pumps = list(pumps)
+        self.barrier_timeout = barrier_timeout
+        self.last_skew = None
+        self._workers = [_PumpWorker(pump) for pump in self.pumps]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def dispatch(self, actions):
+        barrier = threading.Barrier(len(self._workers), timeout=self.barrier_timeout)
+        futures = [worker.submit(action, barrier) for worker, action in zip(self._workers, actions)]
+        acknowledgements = [future.result() for future in futures]
+        sent_times = [ack.sent_at for ack in acknowledgements]
+        self.last_skew = max(sent_times) - min(sent_times)
+        return acknowledgements
+
+    def send_command(self, command):
+        return self.dispatch([lambda pump: pump.send_command(command)] * len(self.pumps))
+
+    def start(self):
+        acknowledgements = self.dispatch([lambda pump: pump.start_pump()] * len(self.pumps))
+        print(f"Started pumps on {', '.join(pump.port for pump in self.pumps)} "
+              f"with {self.last_skew * 1000:.1f} ms skew.")
+        return acknowledgements
+
+    def stop(self):
+        return self.dispatch([lambda pump: pump.stop_pump()] * len(self.pumps))
+
+    def set_flow_rates(self, rates):
+        # rates holds one (rate, unit) pair per pump, in the group's order
+        actions = [lambda pump, rate=rate, unit=unit: pump.set_flow_rate(rate, unit) for rate, unit in rates]
+        return self.dispatch(actions)
+
+    def close(self, close_pumps=False):
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+        if close_pumps:
+            for pump in self.pumps:
+                pump.close()
@@ -0,0 +1,389 @@
+import argparse
+import ast
+import json
+import operator
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .auto_exposure import auto_exposure, collect_adaptive
+from .instrumentation import METRICS, timer
+from .kinetics import measurement_times, record_pump_events
+from .pump_group import PumpGroup
+from .steady_state import SteadyStateDetector, wait_for_steady_state
+
+ACTIONS = ('stop', 'start', 'set_flow_rates', 'set_diameters', 'wait', 'wait_steady', 'measure')
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+def evaluate_formula(formula, variables):
+    # Arithmetic on numbers and recipe variables only, e.g. "(c / stock) * total"
+    def evaluate(node):
+        if isinstance(node, ast.Expression):
+            return evaluate(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in variables:
+                raise ValueError(f"Unknown variable '{node.id}' in formula '{formula}'.")
+            return variables[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](evaluate(node.operand))
+        raise ValueError(f"Unsupported expression in formula '{formula}'.")
+
+    if isinstance(formula, (int, float)):
+        return formula
+    return evaluate(ast.parse(formula, mode='eval'))
+
+
+def load_recipe(path):
+    with open(path) as f:
+        recipe = json.load(f)
+    validate_recipe(recipe)
+    return recipe
+
+
+def validate_recipe(recipe):
+    for key in ('pumps', 'flow_rate_unit', 'steps'):
+        if key not in recipe:
+            raise ValueError(f"Recipe is missing '{key}'.")
+    if 'concentrations' not in recipe and 'optimize' not in recipe:
+        raise ValueError("Recipe needs either 'concentrations' or an 'optimize' section.")
+    if 'optimize' in recipe and not any(step.get('action') == 'measure' for step in recipe['steps']):
+        raise ValueError("An 'optimize' recipe needs a 'measure' step to score each experiment.")
+    for name in recipe.get('optimize', {}).get('parameters', {}):
+        if name != 'c' and name not in recipe.get('variables', {}):
+            raise ValueError(f"Optimized parameter '{name}' is neither 'c' nor a recipe variable.")
+    pump_names = set(recipe['pumps'])
+    for section in ('setup', 'steps'):
+        for step in recipe.get(section, []):
+            if step.get('action') not in ACTIONS:
+                raise ValueError(f"Unknown action {step.get('action')!r} in {section}. Expected one of {ACTIONS}.")
+            unknown = set(step.get('pumps', [])) - pump_names
+            if unknown:
+                raise ValueError(f"Step {step} refers to unknown pumps {sorted(unknown)}.")
+    missing = set(recipe.get('flow_rates', {})) - pump_names
+    if missing:
+        raise ValueError(f"Flow rates are given for unknown pumps {sorted(missing)}.")
+
+
+def check_recipe_kind(recipe, kind):
+    # 'concentrations' for a sweep, 'optimize' for the closed-loop search;
+    # checked before any hardware is opened
+    if kind == 'optimize' and 'optimize' not in recipe:
+        raise ValueError("This recipe has no 'optimize' section; run it with 'aunpc sweep --recipe' instead.")
+    if kind == 'concentrations' and 'concentrations' not in recipe:
+        raise ValueError("This recipe has no 'concentrations' to sweep; run it with 'aunpc optimize' instead.")
+
+
+def flow_rates_for(recipe, concentration=None, names=None, variables=None):
+    variables = dict(recipe.get('variables', {}), **(variables or {}))
+    if concentration is not None:
+        variables['c'] = concentration
+    formulas = recipe.get('flow_rates', {})
+    if names is None:
+        names = list(formulas)
+    return {name: evaluate_formula(formulas[name], variables) for name in names if name in formulas}
+
+
+def estimated_cycle_time(recipe):
+    # Steady-state waits are counted at their minimum
+    return sum(step.get('seconds', step.get('min_wait', 0)) for step in recipe['steps']
+               if step['action'] in ('wait', 'wait_steady'))
+
+
+class RecipeRunner:
+    # Executes a recipe without prompts. Measurements are saved by a
+    # background worker so the next condition's pump commands and waits
+    # start while the previous spectrum is still being written; the
+    # acquisition engine keeps reading the detector throughout.
+    def __init__(self, recipe, pumps, acquisition, absorbance_calculator, store, viewer=None, checkpoint=None):
+        self.recipe = recipe
+        self.pumps = pumps
+        self.acquisition = acquisition
+        self.absorbance_calculator = absorbance_calculator
+        self.store = store
+        self.viewer = viewer
+        # Progress is saved here after each condition, see supervisor.Checkpoint
+        self.checkpoint = checkpoint
+        # Overrides for recipe variables, e.g. set by the optimizer
+        self.variables = {}
+        self.completed = 0
+        self.started_at = None
+        self._groups = {}
+        self._saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recipe-saver")
+        self._pending_saves = []
+
+    def _group(self, names):
+        names = tuple(names)
+        if names not in self._groups:
+            self._groups[names] = PumpGroup([self.pumps[name] for name in names])
+        return self._groups[names]
+
+    def experiments_per_hour(self):
+        if not self.started_at or not self.completed:
+            return 0.0
+        return self.completed / ((time.monotonic() - self.started_at) / 3600)
+
+    def run_step(self, step, concentration=None):
+        action = step['action']
+        names = step.get('pumps', list(self.pumps))
+        unit = self.recipe['flow_rate_unit']
+        if action == 'stop':
+            self._group(names).stop()
+        elif action == 'start':
+            self._group(names).start()
+        elif action == 'set_flow_rates':
+            rates = flow_rates_for(self.recipe, concentration, names, self.variables)
+            names = list(rates)
+            self._group(names).set_flow_rates([(rates[name], unit) for name in names])
+        elif action == 'set_diameters':
+            for name in names:
+                self.pumps[name].set_syringe_diameter(self.recipe['pumps'][name]['diameter'])
+        elif action == 'wait':
+            time.sleep(step['seconds'])
+        elif action == 'wait_steady':
+            detector = SteadyStateDetector(self.acquisition.wavelengths, **step.get('detector', {}))
+            metadata = {'kind': 'equilibration', 'methyl_orange_concentration': concentration}
+
+            def record(intensities, absorbance, timestamp, monotonic):
+                self._pending_saves.append(self._saver.submit(
+                    self._save_equilibration, intensities.copy(), absorbance.copy(), metadata, (timestamp, monotonic)))
+            wait_for_steady_state(self.acquisition, self.absorbance_calculator, detector,
+                                  num_measurements=step.get('num_measurements', 5),
+                                  timeout=step.get('timeout'), min_wait=step.get('min_wait', 0.0), record=record)
+        elif action == 'measure':
+            self.measure(step, concentration)
+
+    def measure(self, step, concentration):
+        started = time.monotonic()
+        if 'target_standard_error' in step:
+            sample_intensities, _ = collect_adaptive(self.acquisition, step['target_standard_error'],
+                                                     absorbance_calculator=self.absorbance_calculator,
+                                                     max_measurements=step.get('max_measurements', 1000))
+        else:
+            num_measurements = step.get('num_measurements', self.recipe.get('num_measurements', 10))
+            sample_intensities, _ = self.acquisition.collect(num_measurements)
+        sample_intensities = sample_intensities.copy()
+        times = measurement_times(started)
+        metadata = {'methyl_orange_concentration': concentration}
+        metadata.update(self.variables)
+        metadata.update({f'{name}_flow_rate': rate
+                         for name, rate in flow_rates_for(self.recipe, concentration, variables=self.variables).items()})
+        self._pending_saves.append(self._saver.submit(self._save, sample_intensities, metadata, times))
+
+    def _save(self, sample_intensities, metadata, times):
+        absorbance = self.absorbance_calculator(sample_intensities)
+        timestamp, monotonic = times
+        frame_number = self.store.append(sample_intensities, absorbance, metadata, timestamp, monotonic)
+        if self.viewer is not None:
+            self.viewer.show(absorbance, f"{metadata['methyl_orange_concentration']} mM", kind='absorbance')
+        return frame_number
+
+    def _save_equilibration(self, sample_intensities, absorbance, metadata, times):
+        # The averages the steady-state decision was made on, kept so a
+        # replay sees the same inputs
+        self.store.append(sample_intensities, absorbance, metadata, *times)
+
+    def run_setup(self):
+        for step in self.recipe.get('setup', []):
+            with timer(f"setup_{step['action']}"):
+                self.run_step(step)
+
+    def _run_steps(self, concentration):
+        with timer('cycle'):
+            for step in self.recipe['steps']:
+                with timer(f"step_{step['action']}"):
+                    self.run_step(step, concentration)
+        self.completed += 1
+
+    def run_condition(self, concentration):
+        # Runs the steps for one condition and returns the store frame
+        # numbers of the spectra it measured, once they are saved;
+        # equilibration averages are left out
+        pending = len(self._pending_saves)
+        self._run_steps(concentration)
+        frame_numbers = [future.result() for future in self._pending_saves[pending:]]
+        return [frame_number for frame_number in frame_numbers if frame_number is not None]
+
+    def _save_checkpoint(self, conditions_completed):
+        # Runs on the saver thread, after the condition's spectra are stored
+        self.checkpoint.save(conditions_completed=conditions_completed, frames=len(self.store))
+
+    def shutdown(self):
+        self._group(list(self.pumps)).stop()
+        self._saver.shutdown(wait=True)
+        for group in self._groups.values():
+            group.close()
+
+    def run(self):
+        self.started_at = time.monotonic()
+        concentrations = self.recipe['concentrations']
+        first = self.checkpoint.get('conditions_completed', 0) if self.checkpoint is not None else 0
+        if first:
+            print(f"Skipping the {first} conditions completed before the run was interrupted.")
+        try:
+            self.run_setup()
+            for i, concentration in enumerate(concentrations[first:], start=first + 1):
+                print(f"Condition {i}/{len(concentrations)}: methyl orange {concentration} mM")
+                self._run_steps(concentration)
+                if self.checkpoint is not None:
+                    self._pending_saves.append(self._saver.submit(self._save_checkpoint, i))
+                remaining = (len(concentrations) - i) / max(self.experiments_per_hour(), 1e-9)
+                print(f"Completed {self.completed} conditions, {self.experiments_per_hour():.1f} experiments/hour, "
+                      f"about {remaining:.2f} h remaining.")
+            for future in self._pending_saves:
+                future.result()
+        finally:
+            self.shutdown()
+        print(f"Recipe finished: {self.completed} experiments at {self.experiments_per_hour():.1f} experiments/hour.")
+        return self.completed
+
+
+def run_recipe(path, dry_run=False, run=None, broker=None, resume=False, kind='concentrations'):
+    # run(runner) replaces RecipeRunner.run, e.g. with the optimizer, which
+    # passes kind='optimize' so a sweep recipe is rejected up front. With a
+    # broker address the devices are used through a running 'aunpc broker'.
+    # With resume, path is the store directory of an interrupted run: its
+    # recipe, integration time and calibration are reused and the
+    # conditions it completed are skipped.
+    from .spectrum_store import SpectrumStore
+    from .supervisor import Checkpoint
+
+    checkpoint = None
+    if resume:
+        checkpoint = Checkpoint(path)
+        if not checkpoint:
+            raise FileNotFoundError(f"No checkpoint in {path}; only recipe runs can be resumed.")
+        with SpectrumStore(path) as store:
+            recipe = store.run_metadata['recipe']
+        if 'concentrations' not in recipe:
+            raise ValueError(f"{path} is an optimizer run; those cannot be resumed. Start a new run from its recipe.")
+    else:
+        recipe = load_recipe(path)
+    check_recipe_kind(recipe, kind)
+    if dry_run:
+        for concentration in recipe.get('concentrations', []):
+            rates = ', '.join(f"{name} {rate:.4g}" for name, rate in flow_rates_for(recipe, concentration).items())
+            print(f"{concentration} mM: {rates} {recipe['flow_rate_unit']}")
+        cycle_time = estimated_cycle_time(recipe)
+        print(f"Waits take {cycle_time} s per condition, at most {3600 / max(cycle_time, 1):.1f} experiments/hour.")
+        return
+
+    from .acquisition import ContinuousAcquisition
+    from .calibration_cache import load_or_acquire_calibration
+    from .hardware import open_spectrometer
+    from .processing import AbsorbanceCalculator
+    from .supervisor import AcquisitionWatchdog, open_supervised_pump
+
+    settings = recipe['spectrometer']
+    integration_time = checkpoint.get('integration_time') if checkpoint else settings['integration_time']
+    store_path = path if checkpoint else None
+    # Everything is opened inside the try, so whatever did open is closed
+    # again if a later device fails
+    client = acquisition = watchdog = None
+    pumps = {}
+    try:
+        if broker is not None:
+            from .broker import BrokerClient
+
+            client = BrokerClient(broker)
+            if integration_time == 'auto':
+                input("Put the reference in place and press Enter to set the integration time...")
+            acquisition = client.acquisition(settings['serial_number'], integration_time)
+            integration_time = acquisition.integration_time
+            for name, pump in recipe['pumps'].items():
+                pumps[name] = client.pump(pump['port'])
+            acquisition.start()
+        else:
+            spec = open_spectrometer(settings['serial_number'], integration_time)
+            if integration_time == 'auto':
+                input("Put the reference in place and press Enter to set the integration time...")
+                integration_time = auto_exposure(spec)
+            acquisition = ContinuousAcquisition(spec).start()
+            watchdog = AcquisitionWatchdog(
+                acquisition, lambda: open_spectrometer(settings['serial_number'], integration_time)).start()
+            # Pumps reconnect and the spectrometer is reopened if they stop
+            # responding, instead of ending a run that may take hours
+            for name, pump in recipe['pumps'].items():
+                pumps[name] = open_supervised_pump(pump['port'])
+
+        if checkpoint:
+            store = SpectrumStore(store_path, chunk_frames=1, recover=True)
+            # Spectra of a condition that did not reach its checkpoint are
+            # measured again
+            store.truncate(checkpoint.get('frames', len(store)))
+            reference_intensities, background_intensities = store.calibration(checkpoint.get('calibration'))
+            print(f"Resuming {store_path} with its calibration and an integration time of {integration_time} microseconds.")
+        else:
+            num_measurements = recipe.get('num_measurements', 10)
+            reference_intensities, background_intensities = load_or_acquire_calibration(
+                acquisition.collect, acquisition.serial_number, integration_time, num_measurements)
+            print("Calibration done; the rest of the recipe runs unattended.")
+
+            output = os.path.expanduser(recipe.get('output', os.path.join('~', 'Desktop')))
+            store_path = os.path.join(output, datetime.now().strftime("recipe_run_%Y%m%d%H%M%S"))
+            run_metadata = {'recipe': recipe, 'spectrometer': acquisition.serial_number}
+            # An optional "storage" section crops, bins and compresses the
+            # spectra on their way to disk, e.g. {"roi": [350, 900],
+            # "bin_size": 4, "dtype": "float32", "compression": "zlib"}
+            storage = dict(recipe.get('storage', {}))
+            compression = storage.pop('compression', None)
+            store = SpectrumStore(store_path, acquisition.wavelengths, run_metadata, chunk_frames=1,
+                                  reduction=storage or None, compression=compression)
+            calibration = store.add_calibration(reference_intensities, background_intensities)
+            checkpoint = Checkpoint(store_path)
+            checkpoint.save(integration_time=integration_time, calibration=calibration, conditions_completed=0,
+                            frames=0)
+        # Stage timings go to trace.jsonl and metrics.prom alongside the spectra
+        METRICS.start_run(store_path)
+        with store:
+            # Pump commands are logged with the spectra for residence-time queries
+            record_pump_events(store, pumps)
+            absorbance_calculator = AbsorbanceCalculator(reference_intensities, background_intensities)
+            runner = RecipeRunner(recipe, pumps, acquisition, absorbance_calculator, store, checkpoint=checkpoint)
+            (run or RecipeRunner.run)(runner)
+        print(f"Spectra have been written to {store_path}")
+    except BaseException:
+        # Only sweeps can be resumed, and only once their checkpoint exists
+        if run is None and checkpoint:
+            print(f"Run interrupted after {checkpoint.get('conditions_completed')} conditions. "
+                  f"Continue it with: python -m aunpc sweep --resume \"{store_path}\"")
+        raise
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+        if acquisition is not None:
+            acquisition.stop()
+        for pump in pumps.values():
+            pump.close()
+        if client is not None:
+            client.close()
+        METRICS.finish_run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a synthesis recipe unattended.")
+    parser.add_argument("recipe", help="JSON recipe file, or with --resume the store directory of an interrupted run")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run where it stopped")
+    parser.add_argument("--dry-run", action="store_true", help="print the flow rates and timing without touching hardware")
+    parser.add_argument("--broker", nargs='?', const='127.0.0.1:50505', metavar="HOST:PORT",
+                        help="use the devices held by a running 'aunpc broker'")
+    args = parser.parse_args(argv)
+    run_recipe(args.recipe, args.dry_run, broker=args.broker, resume=args.resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import zlib
+
+import numpy as np
+
+
+class SpectralReduction:
+    # Shrinks spectra on their way into a SpectrumStore: a wavelength region
+    # of interest, then either averaging of bin_size adjacent pixels or
+    # linear resampling onto a fixed (start, stop, step) grid, then a
+    # smaller float type. The QE Pro's deep-UV and NIR ends carry no signal
+    # through the flow cell, so cropping them loses nothing. describe()
+    # records exactly what was done, and from_description() rebuilds it.
+    def __init__(self, wavelengths, roi=None, bin_size=1, grid=None, dtype='<f4'):
+        if grid is not None and bin_size > 1:
+            raise ValueError("Use either pixel binning or a wavelength grid, not both.")
+        self.source_wavelengths = np.asarray(wavelengths, dtype=float)
+        self.roi = tuple(float(value) for value in roi) if roi is not None else None
+        self.bin_size = int(bin_size)
+        self.grid = tuple(float(value) for value in grid) if grid is not None else None
+        self.dtype = np.dtype(dtype)
+
+        inside = np.ones(len(self.source_wavelengths), dtype=bool)
+        if self.roi is not None:
+            inside = (self.source_wavelengths >= self.roi[0]) & (self.source_wavelengths <= self.roi[1])
+        pixels = np.flatnonzero(inside)
+        if len(pixels) == 0:
+            raise ValueError(f"No pixels between {self.roi[0]} and {self.roi[1]} nm.")
+        self._start, self._stop = int(pixels[0]), int(pixels[-1]) + 1
+        cropped = self.source_wavelengths[self._start:self._stop]
+
+        if self.grid is not None:
+            start, stop, step = self.grid
+            targets = np.arange(start, stop + step / 2, step)
+            if targets[0] < cropped[0] or targets[-1] > cropped[-1]:
+                raise ValueError(f"The grid {start}-{stop} nm reaches outside {cropped[0]:.1f}-{cropped[-1]:.1f} nm.")
+            # Each grid point as a weighted pair of neighbouring pixels
+            position = np.interp(targets, cropped, np.arange(len(cropped)))
+            self._left = np.minimum(np.floor(position).astype(int), len(cropped) - 2)
+            self._weight = position - self._left
+            self.wavelengths = targets
+        elif self.bin_size > 1:
+            # Pixels left over at the red end are dropped
+            self._stop = self._start + len(cropped) // self.bin_size * self.bin_size
+            self.wavelengths = self.source_wavelengths[self._start:self._stop].reshape(-1, self.bin_size).mean(axis=1)
+        else:
+            self.wavelengths = cropped
+
+    @property
+    def num_pixels(self):
+        return len(self.wavelengths)
+
+    def __call__(self, spectra):
+        # One spectrum or an (n_spectra, n_pixels) array at full resolution
+        cropped = np.asarray(spectra, dtype=float)[..., self._start:self._stop]
+        if self.grid is not None:
+            reduced = cropped[..., self._left] * (1 - self._weight) + cropped[..., self._left + 1] * self._weight
+        elif self.bin_size > 1:
+            reduced = cropped.reshape(cropped.shape[:-1] + (-1, self.bin_size)).mean(axis=-1)
+        else:
+            reduced = cropped
+        return reduced.astype(self.dtype)
+
+    def describe(self):
+        return {
+            'roi': list(self.roi) if self.roi is not None else None,
+            'bin_size': self.bin_size,
+            'grid': list(self.grid) if self.grid is not None else None,
+            'dtype': self.dtype.str,
+            'source_pixels': len(self.source_wavelengths),
+            'pixels': self.num_pixels,
+        }
+
+    @classmethod
+    def from_description(cls, wavelengths, description):
+        return cls(wavelengths, description.get('roi'), description.get('bin_size', 1), description.get('grid'),
+                   description.get('dtype', '<f4'))
+
+
+def compress(values, level=6):
+    # Lossless: the bytes of each float are regrouped so all the exponent
+    # bytes sit together, which zlib packs far better than raw floats
+    values = np.ascontiguousarray(values)
+    shuffled = values.view(np.uint8).reshape(-1, values.dtype.itemsize).T
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes(), level)
+
+
+def decompress(data, dtype, shape):
+    dtype = np.dtype(dtype)
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(shuffled.T).view(dtype).reshape(shape)
+
+
+def reduce_store(source, destination, reduction_options, compression='zlib', chunk_frames=256):
+    # Copies a store through a reduction, e.g. to shrink runs recorded
+    # before the reduction stage existed
+    from .spectrum_store import CALIBRATION_FIELDS, SpectrumStore
+
+    with SpectrumStore(source) as store:
+        reduction = SpectralReduction(store.wavelengths, **reduction_options)
+        index = store.index()
+        metadata = store.metadata()
+        with SpectrumStore(destination, store.wavelengths, store.run_metadata, chunk_frames=chunk_frames,
+                           reduction=reduction, compression=compression) as reduced:
+            reduced.copy_sessions(store)
+            calibrations = len(store.read(CALIBRATION_FIELDS[0]))
+            for calibration in range(calibrations):
+                reference, background = store.calibration(calibration)
+                reduced.add_calibration(reference, background)
+                frames = np.flatnonzero(index['calibration'] == calibration)
+                for start in range(0, len(frames), chunk_frames):
+                    chunk = frames[start:start + chunk_frames]
+                    samples = store.read('sample')[chunk]
+                    absorbance = store.read('absorbance')[chunk]
+                    for i, frame in enumerate(chunk):
+                        reduced.append(samples[i], absorbance[i], metadata[frame], index['timestamp'][frame],
+                                       index['monotonic'][frame])
+            for event in store.events():
+                reduced.add_event(event, event.get('timestamp'), event.get('monotonic'))
+    return destination
+
+
+def main(argv=None):
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(prog="aunpc reduce",
+                                     description="Copy a spectrum store with a wavelength range, binning, float32 and compression.")
+    parser.add_argument("store", help="spectrum store directory")
+    parser.add_argument("output", help="directory for the reduced store")
+    parser.add_argument("--roi", type=float, nargs=2, default=(350.0, 900.0), help="wavelength range to keep in nm")
+    parser.add_argument("--bin", dest="bin_size", type=int, default=4, help="average this many adjacent pixels (default: 4)")
+    parser.add_argument("--grid", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="resample onto a fixed wavelength grid in nm instead of binning")
+    parser.add_argument("--dtype", default='float32', help="stored float type (default: float32)")
+    parser.add_argument("--no-compression", action="store_true", help="store uncompressed, memory-mappable files")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    options = {'roi': args.roi, 'bin_size': 1 if args.grid else args.bin_size, 'grid': args.grid, 'dtype': args.dtype}
+    reduce_store(args.store, args.output, options, None if args.no_compression else 'zlib')
+
+    def size(directory):
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+                   if name.endswith('.bin'))
+    before, after = size(args.store), size(args.output)
+    print(f"Spectra take {after / 1e6:.2f} MB instead of {before / 1e6:.2f} MB ({before / max(after, 1):.1f}x smaller), "
+          f"reduced in {time.perf_counter() - started:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
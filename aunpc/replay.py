@@ -0,0 +1,208 @@
+import argparse
+import time
+
+import numpy as np
+
+from .processing import AbsorbanceCalculator
+from .spr_features import FEATURE_NAMES, extract_features
+from .steady_state import SteadyStateDetector
+
+# Pump commands after which a live run waits for a new steady state
+_RESET_COMMANDS = ('RUN', 'STP', 'RAT')
+
+
+class VirtualClock:
+    # Recorded time instead of the system clock. With a speed of N every
+    # recorded second takes 1/N s of real time; with no speed the clock
+    # jumps straight to the next timestamp.
+    def __init__(self, start=0.0, speed=None):
+        self.start = start
+        self.speed = speed
+        self._now = start
+
+    def monotonic(self):
+        return self._now
+
+    def elapsed(self):
+        return self._now - self.start
+
+    def advance_to(self, timestamp):
+        if timestamp <= self._now:
+            return
+        if self.speed:
+            time.sleep((timestamp - self._now) / self.speed)
+        self._now = timestamp
+
+    def sleep(self, seconds):
+        self.advance_to(self._now + seconds)
+
+
+def _pump_changes(store):
+    # Pump events that change what flows through the reactor, oldest first
+    events = [event for event in store.events() if event.get('kind') == 'pump' and event.get('command')
+              and event['command'].split()[0] in _RESET_COMMANDS and event.get('ok', True)]
+    return sorted(events, key=lambda event: event['run_time'])
+
+
+def recorded_detector_options(store):
+    # The SteadyStateDetector options the live run's wait_steady step used;
+    # sweeps, synthesis runs and recipes without a 'detector' entry used
+    # the defaults
+    recipe = store.run_metadata.get('recipe', {})
+    options = [step.get('detector', {}) for step in recipe.get('steps', []) if step.get('action') == 'wait_steady']
+    if any(other != options[0] for other in options[1:]):
+        print("The recipe's wait_steady steps use different detector settings; replaying with the first.")
+    return dict(options[0]) if options else {}
+
+
+def replay(store, speed=None, start=None, stop=None, chunk_frames=1024, detector_options=None, **feature_options):
+    # Feeds a recorded run back through the live processing in recorded
+    # order under a VirtualClock: absorbance from the stored sample and
+    # calibration with AbsorbanceCalculator, steady-state decisions from a
+    # SteadyStateDetector given the recorded timestamps and reset at each
+    # pump change, and SPR features from extract_features. Returns
+    # (columns, decisions), where decisions lists every pump change with
+    # the recorded seconds until the detector called steady state (None if
+    # it never did before the next change).
+    #
+    # Recipe and sweep runs store the short averages wait_for_steady_state
+    # decided on as 'equilibration' frames. When a run has them, only those
+    # go to the detector, which starts afresh after any other frame, just as
+    # each live wait did; the final measurements are still converted and
+    # get features. Runs without them, e.g. continuous captures, feed every
+    # frame to the detector. The detector is set up like the live one, see
+    # recorded_detector_options; detector_options override single settings.
+    # Times are on one clock across resumed sessions, see SpectrumStore.run_times
+    full_times = store.run_times()
+    index = store.index()[start:stop]
+    first = range(len(store))[slice(start, stop)].start
+    times = full_times[start:stop]
+    clock = VirtualClock(times[0] if len(times) else 0.0, speed)
+    options = dict(recorded_detector_options(store), **(detector_options or {}))
+    detector = SteadyStateDetector(store.wavelengths, **options)
+    calculators = {}
+    events = _pump_changes(store)
+    # Changes since the frame before the replayed range count towards it
+    previous = full_times[first - 1] if first > 0 else -np.inf
+    next_event = int(np.searchsorted([event['run_time'] for event in events], previous, side='right'))
+    decisions = []
+    columns = {name: np.full(len(index), np.nan) for name in
+               ('time', 'absorbance_error', 'steady', 'peak_change', 'drift') + FEATURE_NAMES}
+    columns['frame'] = np.arange(first, first + len(index))
+    equilibration = np.array([metadata.get('kind') == 'equilibration'
+                              for metadata in store.metadata(first, first + len(index))], dtype=bool)
+    detected = equilibration if equilibration.any() else np.ones(len(index), dtype=bool)
+
+    for chunk_start in range(0, len(index), chunk_frames):
+        chunk = slice(chunk_start, min(chunk_start + chunk_frames, len(index)))
+        samples = np.asarray(store.read('sample', first + chunk.start, first + chunk.stop))
+        stored = np.asarray(store.read('absorbance', first + chunk.start, first + chunk.stop))
+        absorbance = np.empty_like(samples)
+        for i, frame in enumerate(range(chunk.start, chunk.stop)):
+            calibration = int(index['calibration'][frame])
+            if calibration not in calculators:
+                reference, background = store.calibration(calibration)
+                if store.reduction is not None:
+                    # Stored spectra were reduced, the calibrations were not
+                    reference, background = store.reduction(reference), store.reduction(background)
+                calculators[calibration] = AbsorbanceCalculator(reference, background)
+            calculators[calibration](samples[i], out=absorbance[i])
+
+            timestamp = times[frame]
+            while next_event < len(events) and events[next_event]['run_time'] <= timestamp:
+                event = events[next_event]
+                clock.advance_to(event['run_time'])
+                detector.reset()
+                decisions.append({'time': event['run_time'] - clock.start, 'pump': event['pump'],
+                                  'command': event['command'], 'steady_after': None})
+                next_event += 1
+            clock.advance_to(timestamp)
+            columns['time'][frame] = clock.elapsed()
+            if not detected[frame]:
+                detector.reset()
+                continue
+            steady = detector.update(absorbance[i], clock.monotonic())
+            if steady and decisions and decisions[-1]['steady_after'] is None:
+                decisions[-1]['steady_after'] = clock.elapsed() - decisions[-1]['time']
+            status = detector.status()
+            columns['steady'][frame] = steady
+            for name in ('peak_change', 'drift'):
+                if status[name] is not None:
+                    columns[name][frame] = status[name]
+        # Pixels without signal are NaN or inf in both, so they are left out
+        with np.errstate(invalid='ignore'):
+            error = np.abs(absorbance - stored)
+        error[~np.isfinite(error)] = np.nan
+        columns['absorbance_error'][chunk] = np.fmax.reduce(error, axis=1)
+        features = extract_features(store.wavelengths, absorbance, **feature_options)
+        for name in FEATURE_NAMES:
+            columns[name][chunk] = features[name]
+    return columns, decisions
+
+
+def compare(columns, reference):
+    # Largest difference per shared column and the frames whose steady-state
+    # decision changed, e.g. against the output of an earlier replay
+    frames, ours, theirs = np.intersect1d(columns['frame'], reference['frame'], return_indices=True)
+    differences = {}
+    for name in columns:
+        if name in ('frame', 'time') or name not in reference:
+            continue
+        a, b = columns[name][ours], np.asarray(reference[name], dtype=float)[theirs]
+        both = np.isfinite(a) & np.isfinite(b)
+        differences[name] = float(np.max(np.abs(a[both] - b[both]))) if both.any() else 0.0
+    a, b = columns['steady'][ours], np.asarray(reference['steady'], dtype=float)[theirs]
+    # Frames the detector did not see are NaN in both
+    changed = frames[(a != b) & ~(np.isnan(a) & np.isnan(b))]
+    return differences, changed
+
+
+def main(argv=None):
+    from .batch import write_summary
+    from .spectrum_store import SpectrumStore
+
+    parser = argparse.ArgumentParser(prog="aunpc replay",
+                                     description="Replay a recorded run through the processing and steady-state logic.")
+    parser.add_argument("store", help="spectrum store directory")
+    parser.add_argument("--speed", type=float, help="replay at this multiple of real time (default: as fast as possible)")
+    parser.add_argument("--start", type=int, help="first frame to replay")
+    parser.add_argument("--stop", type=int, help="frame to stop at")
+    parser.add_argument("--roi", type=float, nargs=2,
+                        help="peak search range in nm (default: 450 700, or the run's steady-state setting)")
+    parser.add_argument("--window", type=int, help="steady-state window in measurements (default: as recorded)")
+    parser.add_argument("--peak-tolerance", type=float, help="steady-state peak tolerance in nm (default: as recorded)")
+    parser.add_argument("--drift-tolerance", type=float, help="steady-state drift tolerance (default: as recorded)")
+    parser.add_argument("--output", help="write the per-frame results (.npz, .csv or .parquet)")
+    parser.add_argument("--compare", help="results of an earlier replay (.npz) to compare against")
+    args = parser.parse_args(argv)
+
+    # Only the settings given on the command line replace the recorded ones
+    overrides = {'window': args.window, 'peak_tolerance': args.peak_tolerance,
+                 'drift_tolerance': args.drift_tolerance, 'roi': tuple(args.roi) if args.roi else None}
+    detector_options = {name: value for name, value in overrides.items() if value is not None}
+    started = time.perf_counter()
+    with SpectrumStore(args.store) as store:
+        columns, decisions = replay(store, args.speed, args.start, args.stop, detector_options=detector_options,
+                                    roi=tuple(args.roi) if args.roi else (450.0, 700.0))
+    elapsed = time.perf_counter() - started
+
+    recorded = columns['time'][-1] if len(columns['time']) else 0.0
+    print(f"Replayed {len(columns['frame'])} spectra covering {recorded:.0f} s in {elapsed:.2f} s "
+          f"({recorded / max(elapsed, 1e-9):.0f}x real time).")
+    print(f"Largest difference from the stored absorbance: {np.fmax.reduce(columns['absorbance_error'], initial=0.0):.3g}")
+    for decision in decisions:
+        steady = "no steady state" if decision['steady_after'] is None else f"steady after {decision['steady_after']:.0f} s"
+        print(f"  {decision['time']:8.1f} s  {decision['pump']}: {decision['command']} -> {steady}")
+    if args.compare:
+        reference = dict(np.load(args.compare))
+        differences, changed = compare(columns, reference)
+        for name, difference in differences.items():
+            print(f"  {name}: largest change {difference:.3g}")
+        print(f"{len(changed)} spectra changed their steady-state decision.")
+    if args.output:
+        write_summary(columns, args.output)
+        print(f"Results have been written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
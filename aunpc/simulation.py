@@ -0,0 +1,203 @@
+import os
+import select
+import threading
+import time
+
+import numpy as np
+
+
+class SimulatedSpectrometer:
+    # Stand-in for seabreeze.spectrometers.Spectrometer. The lamp is a broad
+    # Gaussian, the sample a gold nanoparticle SPR band, and mode selects what
+    # the detector sees: "sample", "reference" (lamp only) or "background"
+    # (lamp off).
+    def __init__(self, serial_number="QEP-SIM", num_pixels=1044, wavelength_range=(200.0, 1000.0),
+                 lamp_counts_per_second=500000.0, dark_counts=1500.0, read_noise=20.0,
+                 max_intensity=200000.0, peak_wavelength=520.0, peak_width=45.0, peak_absorbance=0.8,
+                 realtime=True, seed=None):
+        self.serial_number = serial_number
+        self.model = "QE-PRO"
+        self.max_intensity = max_intensity
+        self.mode = "sample"
+        self.realtime = realtime
+        self.lamp_counts_per_second = lamp_counts_per_second
+        self.dark_counts = dark_counts
+        self.read_noise = read_noise
+        self._wavelengths = np.linspace(wavelength_range[0], wavelength_range[1], num_pixels)
+        self._lamp_profile = np.exp(-0.5 * ((self._wavelengths - 600.0) / 180.0) ** 2)
+        self._integration_time = 100000
+        self._rng = np.random.default_rng(seed)
+        self._next_frame_time = None
+        self._sample_start = (peak_wavelength, peak_width, peak_absorbance)
+        self._sample_target = self._sample_start
+        self._sample_set_at = 0.0
+        self._time_constant = 0.0
+
+    def wavelengths(self):
+        return self._wavelengths.copy()
+
+    def integration_time_micros(self, integration_time_micros):
+        self._integration_time = int(integration_time_micros)
+
+    def set_sample(self, peak_wavelength=None, peak_width=None, peak_absorbance=None, time_constant=0.0):
+        # Move the SPR band towards new values with an exponential approach,
+        # which is how a flow reactor drifts to a new steady state
+        start = self._current_sample()
+        target = (peak_wavelength if peak_wavelength is not None else self._sample_target[0],
+                  peak_width if peak_width is not None else self._sample_target[1],
+                  peak_absorbance if peak_absorbance is not None else self._sample_target[2])
+        self._sample_start = start
+        self._sample_target = target
+        self._sample_set_at = time.monotonic()
+        self._time_constant = time_constant
+
+    def _current_sample(self):
+        if self._time_constant <= 0:
+            return self._sample_target
+        remaining = np.exp(-(time.monotonic() - self._sample_set_at) / self._time_constant)
+        return tuple(t + (s - t) * remaining for s, t in zip(self._sample_start, self._sample_target))
+
+    def absorbance(self):
+        peak_wavelength, peak_width, peak_absorbance = self._current_sample()
+        spr_band = peak_absorbance * np.exp(-0.5 * ((self._wavelengths - peak_wavelength) / peak_width) ** 2)
+        # Interband absorption of Au(0) rises towards the UV
+        interband = 0.35 * peak_absorbance * np.clip((550.0 - self._wavelengths) / 350.0, 0.0, None)
+        return spr_band + interband
+
+    def _wait_for_frame(self):
+        # Frames are clocked back-to-back like the real detector
+        period = self._integration_time / 1_000_000
+        now = time.monotonic()
+        if self._next_frame_time is None or self._next_frame_time < now:
+            self._next_frame_time = now
+        self._next_frame_time += period
+        time.sleep(max(0.0, self._next_frame_time - now))
+
+    def intensities(self, correct_dark_counts=False, correct_nonlinearity=False):
+        if self.realtime:
+            self._wait_for_frame()
+        exposure = self._integration_time / 1_000_000
+        signal = np.zeros_like(self._wavelengths)
+        if self.mode != "background":
+            signal = self.lamp_counts_per_second * exposure * self._lamp_profile
+            if self.mode == "sample":
+                signal = signal * 10 ** (-self.absorbance())
+        counts = self.dark_counts + signal
+        counts = counts + self._rng.normal(0.0, 1.0, counts.shape) * np.sqrt(signal + self.read_noise ** 2)
+        if correct_dark_counts:
+            counts -= self.dark_counts
+        return np.clip(counts, 0.0, self.max_intensity)
+
+    def close(self):
+        pass
+
+
+
+def open_simulated_spectrometer(serial_number, **options):
+    # Drop-in for hardware.open_spectrometer, e.g. as the open_device of a
+    # MultiDeviceAcquisition (wrap in functools.partial to pass options)
+    return SimulatedSpectrometer(serial_number=serial_number, **options)
+
+
+class SimulatedSyringePump:
+    # Emulates a New Era style syringe pump on a pseudo-terminal, so the real
+    # SyringePump class can open self.port with serial.Serial unchanged.
+    # Replies follow the basic RS-232 format <STX>address prompt [data]<ETX>.
+    VOLUME_UNITS = {"UM": "UL", "UH": "UL", "MM": "ML", "MH": "ML"}
+
+    def __init__(self, address=0, latency=0.02, baudrate=9600):
+        # Pseudo-terminals only exist on Linux and macOS; imported here so
+        # the simulated spectrometer still works on the Windows lab PCs
+        import tty
+
+        self.address = address
+        self.latency = latency
+        self.baudrate = baudrate
+        self.diameter = 26.59
+        self.rate = 0.0
+        self.rate_units = "MM"
+        self.volume = 0.0
+        self.running = False
+        self.commands = []
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name=f"simulated-pump-{address}", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _serve(self):
+        pending = b""
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                pending += os.read(self._master, 1024)
+            except OSError:
+                break
+            while b"\r" in pending:
+                line, pending = pending.split(b"\r", 1)
+                response = self.handle(line.decode("latin1").strip())
+                # Command processing time plus transmission time at the baud rate
+                time.sleep(self.latency + len(response) * 10 / self.baudrate)
+                os.write(self._master, response)
+
+    def _reply(self, data=""):
+        prompt = "I" if self.running else "S"
+        return f"\x02{self.address:02d}{prompt}{data}\x03".encode("latin1")
+
+    def handle(self, command):
+        self.commands.append(command)
+        parts = command.upper().split()
+        if parts and parts[0].isdigit():
+            parts = parts[1:]
+        if not parts:
+            return self._reply()
+        name, args = parts[0], parts[1:]
+        try:
+            if name == "DIA":
+                if not args:
+                    return self._reply(f"{self.diameter:.2f}")
+                if self.running:
+                    return self._reply("?NA")
+                diameter = float(args[0])
+                if not 0.1 <= diameter <= 50.0:
+                    return self._reply("?OOR")
+                self.diameter = diameter
+            elif name == "RAT":
+                if not args:
+                    return self._reply(f"{self.rate:.3f}{self.rate_units}")
+                units = args[1] if len(args) > 1 else self.rate_units
+                if units not in self.VOLUME_UNITS:
+                    return self._reply("?")
+                self.rate = float(args[0])
+                self.rate_units = units
+            elif name == "VOL":
+                if not args:
+                    return self._reply(f"{self.volume:.3f}{self.VOLUME_UNITS[self.rate_units]}")
+                self.volume = float(args[0])
+            elif name == "RUN":
+                self.running = True
+            elif name == "STP":
+                self.running = False
+            else:
+                return self._reply("?")
+        except ValueError:
+            return self._reply("?")
+        return self._reply()
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
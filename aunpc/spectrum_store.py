@@ -0,0 +1,466 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .instrumentation import timer
+from .processing import AbsorbanceCalculator
+from .reduction import SpectralReduction, compress, decompress
+
+# One row per stored spectrum. The data files are always flushed before the
+# index, so every row in the index points at spectra that are on disk.
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('monotonic', '<f8'), ('calibration', '<i4')])
+CALIBRATION_DTYPE = np.dtype([('timestamp', '<f8')])
+SPECTRUM_FIELDS = ('sample', 'absorbance')
+CALIBRATION_FIELDS = ('reference', 'background')
+# With compression each flush writes one zlib block per field, and a row
+# here saying where it is and how many frames it holds
+BLOCK_DTYPE = np.dtype([('offset', '<i8'), ('size', '<i8'), ('frames', '<i8')])
+COMPRESSIONS = (None, 'zlib')
+
+
+class SpectrumStore:
+    # Append-only store for a run. Wavelengths are written once; sample
+    # intensities and absorbance are appended to flat binary files that are
+    # memory-mapped for reading, and reference/background spectra are stored
+    # once per calibration rather than once per measurement.
+    #
+    # reduction (a SpectralReduction, or its options as a dict) crops, bins
+    # and quantizes sample spectra as they are appended, and the stored
+    # absorbance is computed from the reduced sample and calibration rather
+    # than reduced itself: log10 does not commute with averaging, and this
+    # way anything that recomputes absorbance from the stored spectra gets
+    # the same numbers. Calibrations are kept at full resolution so a
+    # resumed run can still compute absorbance from them. compression='zlib' stores the spectra as
+    # compressed blocks, which read() decompresses instead of memory-mapping.
+    # Both are fixed when the store is created and recorded in meta.json.
+    #
+    # recover=True cuts files back to the last indexed frame before
+    # appending to an interrupted run. Only the process that will write to
+    # the store may do this: a live writer has spectra on disk that are not
+    # indexed yet, and a reader sees just the indexed frames.
+    #
+    # Frames and events are timed on time.monotonic(), which starts again
+    # after a reboot. Each process that writes to the store records a
+    # session in meta.json, and run_times() and the events' 'run_time' put
+    # every session on the clock of the first one.
+    def __init__(self, path, wavelengths=None, run_metadata=None, chunk_frames=64, reduction=None, compression=None,
+                 recover=False):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            if wavelengths is None:
+                raise FileNotFoundError(f"No spectrum store at {path}; wavelengths are needed to create one.")
+            if compression not in COMPRESSIONS:
+                raise ValueError(f"Unknown compression '{compression}'. Expected one of {COMPRESSIONS}.")
+            if isinstance(reduction, dict):
+                reduction = SpectralReduction(wavelengths, **reduction)
+            os.makedirs(path, exist_ok=True)
+            self.meta = {
+                'version': 1,
+                'num_pixels': reduction.num_pixels if reduction else len(wavelengths),
+                'dtype': reduction.dtype.str if reduction else '<f8',
+                'reduction': reduction.describe() if reduction else None,
+                'compression': compression,
+                'created': datetime.now().isoformat(),
+                'run': dict(run_metadata or {}),
+            }
+            if reduction:
+                np.save(os.path.join(path, 'source_wavelengths.npy'), reduction.source_wavelengths)
+                wavelengths = reduction.wavelengths
+            np.save(os.path.join(path, 'wavelengths.npy'), np.asarray(wavelengths, dtype=float))
+            self._write_meta()
+        self.num_pixels = self.meta['num_pixels']
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.wavelengths = np.load(os.path.join(path, 'wavelengths.npy'))
+        self.reduction = None
+        if self.meta.get('reduction'):
+            self.reduction = SpectralReduction.from_description(
+                np.load(os.path.join(path, 'source_wavelengths.npy')), self.meta['reduction'])
+        self.compression = self.meta.get('compression')
+        self._files = {}
+        self._pending_blocks = {}
+        self._calculator = None
+        self._calculator_calibration = None
+        self._pending_index = []
+        self._pending_metadata = []
+        # Pump events arrive from the pump worker threads
+        self._event_lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self._session_started = False
+        self._count = self._rows('index.bin', INDEX_DTYPE)
+        self._calibration = self._rows('calibrations.bin', CALIBRATION_DTYPE) - 1
+        if recover:
+            self._recover()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count + len(self._pending_index)
+
+    @property
+    def run_metadata(self):
+        return self.meta['run']
+
+    def update_run_metadata(self, **metadata):
+        self.meta['run'].update(metadata)
+        self._write_meta()
+
+    def _write_meta(self):
+        temporary_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(temporary_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(temporary_path, os.path.join(self.path, 'meta.json'))
+
+    def _start_session(self):
+        # Called before each write; the first one records where this
+        # process's frames and events begin and its wall-minus-monotonic
+        # offset, which changes when monotonic time starts again
+        with self._session_lock:
+            if self._session_started:
+                return
+            self._session_started = True
+            self.meta.setdefault('sessions', []).append(
+                {'frame': len(self), 'event': len(self.events()), 'offset': time.time() - time.monotonic()})
+            self._write_meta()
+
+    def copy_sessions(self, other):
+        # For a copy of other's frames and events in the same order, e.g.
+        # by reduction.reduce_store
+        with self._session_lock:
+            self._session_started = True
+            self.meta['sessions'] = [dict(session) for session in other.meta.get('sessions', [])]
+            self._write_meta()
+
+    def _session_offsets(self, key, count):
+        # Seconds to add to the monotonic time of each of the first count
+        # frames or events. Stores from before sessions were recorded get
+        # no correction.
+        sessions = self.meta.get('sessions') or [{'frame': 0, 'event': 0, 'offset': 0.0}]
+        starts = np.array([session[key] for session in sessions])
+        offsets = np.array([session['offset'] - sessions[0]['offset'] for session in sessions])
+        return offsets[np.maximum(np.searchsorted(starts, np.arange(count), side='right') - 1, 0)]
+
+    def run_times(self):
+        # Each frame's monotonic time on the first session's clock. A
+        # backwards step means a run was continued on a new monotonic base
+        # that was not recorded, and times across it cannot be compared.
+        monotonic = np.asarray(self.index()['monotonic'], dtype=float)
+        times = monotonic + self._session_offsets('frame', len(monotonic))
+        backwards = np.flatnonzero(np.diff(times) < 0)
+        if len(backwards):
+            raise ValueError(f"Frame {backwards[0] + 1} of {self.path} is timed before the frame ahead of it; "
+                             "the run was continued after a restart and its times cannot be aligned.")
+        return times
+
+    def _rows(self, name, dtype):
+        file_path = os.path.join(self.path, name)
+        if not os.path.exists(file_path):
+            return 0
+        return os.path.getsize(file_path) // dtype.itemsize
+
+    def _layout(self, field):
+        # (pixels, dtype) of one spectrum of a field
+        if field in CALIBRATION_FIELDS and self.reduction is not None:
+            return len(self.reduction.source_wavelengths), np.dtype('<f8')
+        return self.num_pixels, self.dtype
+
+    def _blocks(self, field):
+        rows = self._rows(f'{field}.blocks', BLOCK_DTYPE)
+        if rows == 0:
+            return np.empty(0, dtype=BLOCK_DTYPE)
+        return np.fromfile(os.path.join(self.path, f'{field}.blocks'), dtype=BLOCK_DTYPE, count=rows)
+
+    def _truncate(self, name, size):
+        file_path = os.path.join(self.path, name)
+        if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+            print(f"Discarding {os.path.getsize(file_path) - size} bytes after the last complete record in {file_path}")
+            os.truncate(file_path, size)
+
+    def _recover(self):
+        # A run that stopped mid-append can leave spectra, metadata or a
+        # calibration without their index entry. Cut every file back to
+        # what the index accounts for, so appends after a resume line up.
+        self._truncate('index.bin', self._count * INDEX_DTYPE.itemsize)
+        self._truncate('calibrations.bin', (self._calibration + 1) * CALIBRATION_DTYPE.itemsize)
+        for field in SPECTRUM_FIELDS + CALIBRATION_FIELDS:
+            rows = self._count if field in SPECTRUM_FIELDS else self._calibration + 1
+            if self.compression is None:
+                pixels, dtype = self._layout(field)
+                self._truncate(f'{field}.bin', rows * pixels * dtype.itemsize)
+                continue
+            # Blocks are written whole before the index, so keep the blocks
+            # that end at or before the last indexed frame
+            blocks = self._blocks(field)
+            kept = int(np.searchsorted(np.cumsum(blocks['frames']), rows, side='right'))
+            self._truncate(f'{field}.blocks', kept * BLOCK_DTYPE.itemsize)
+            self._truncate(f'{field}.bin', int(blocks['offset'][kept - 1] + blocks['size'][kept - 1]) if kept else 0)
+        metadata_path = os.path.join(self.path, 'metadata.jsonl')
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                lines = f.readlines()
+            if len(lines) > self._count:
+                print(f"Discarding {len(lines) - self._count} metadata lines without a stored spectrum")
+                with open(metadata_path, 'w') as f:
+                    f.writelines(lines[:self._count])
+
+    def _file(self, name):
+        if name not in self._files:
+            self._files[name] = open(os.path.join(self.path, name), 'ab')
+        return self._files[name]
+
+    def _write_spectrum(self, field, values):
+        pixels, dtype = self._layout(field)
+        values = np.ascontiguousarray(values, dtype=dtype)
+        if values.shape != (pixels,):
+            raise ValueError(f"Expected {pixels} pixels for '{field}', got shape {values.shape}.")
+        if self.compression is None:
+            self._file(f'{field}.bin').write(memoryview(values))
+        else:
+            self._pending_blocks.setdefault(field, []).append(values)
+
+    def _commit_spectra(self, fields):
+        # Puts the spectra written since the last commit on disk
+        for field in fields:
+            if self.compression is None:
+                self._file(f'{field}.bin').flush()
+                continue
+            spectra = self._pending_blocks.pop(field, None)
+            if not spectra:
+                continue
+            data = compress(np.stack(spectra))
+            f = self._file(f'{field}.bin')
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            blocks = self._file(f'{field}.blocks')
+            blocks.write(np.array([(offset, len(data), len(spectra))], dtype=BLOCK_DTYPE).tobytes())
+            blocks.flush()
+
+    def add_calibration(self, reference, background, timestamp=None):
+        self._start_session()
+        self.flush()
+        self._write_spectrum('reference', reference)
+        self._write_spectrum('background', background)
+        self._commit_spectra(CALIBRATION_FIELDS)
+        if timestamp is None:
+            timestamp = time.time()
+        row = np.array([(timestamp,)], dtype=CALIBRATION_DTYPE)
+        f = self._file('calibrations.bin')
+        f.write(row.tobytes())
+        f.flush()
+        self._calibration += 1
+        return self._calibration
+
+    def append(self, sample, absorbance, metadata=None, timestamp=None, monotonic=None, reduced=False):
+        # With a reduction, sample is on the detector's wavelength axis and
+        # is reduced here; reduced=True says it already is on the store's
+        # axis, e.g. when copying from a store with the same reduction
+        if self._calibration < 0:
+            raise ValueError("Add a reference/background calibration before appending spectra.")
+        # 0.0 is a valid time, e.g. the first frame of a replayed run
+        if timestamp is None:
+            timestamp = time.time()
+        if monotonic is None:
+            monotonic = time.monotonic()
+        self._start_session()
+        with timer('store_append'):
+            if self.reduction is not None:
+                sample, absorbance = self._reduce(sample, reduced)
+            self._write_spectrum('sample', sample)
+            self._write_spectrum('absorbance', absorbance)
+            self._pending_index.append((timestamp, monotonic, self._calibration))
+            self._pending_metadata.append(json.dumps(metadata or {}))
+            frame_number = len(self) - 1
+            if len(self._pending_index) >= self.chunk_frames:
+                self.flush()
+        return frame_number
+
+    def _reduce(self, sample, reduced):
+        # (reduced sample, its absorbance) exactly as replay computes them.
+        # The axis is stated rather than guessed from the length, which a
+        # grid or a dtype-only reduction can leave unchanged.
+        pixels = self.num_pixels if reduced else len(self.reduction.source_wavelengths)
+        if np.shape(sample) != (pixels,):
+            axis = "the store's" if reduced else "the detector's"
+            raise ValueError(f"Expected a spectrum of {pixels} pixels on {axis} wavelength axis, "
+                             f"got shape {np.shape(sample)}.")
+        if not reduced:
+            sample = self.reduction(sample)
+        sample = np.asarray(sample, dtype=self.dtype)
+        if self._calculator_calibration != self._calibration:
+            reference, background = self.calibration(self._calibration)
+            self._calculator = AbsorbanceCalculator(self.reduction(reference), self.reduction(background))
+            self._calculator_calibration = self._calibration
+        return sample, self._calculator(sample, out=np.empty(self.num_pixels, dtype=self.dtype))
+
+    def add_event(self, event, timestamp=None, monotonic=None):
+        # Events such as pump commands, timed on the same clocks as the
+        # spectra. They are rare, so each one is written straight away.
+        self._start_session()
+        # run_time is derived when events are read, see events()
+        event = {key: value for key, value in event.items() if key != 'run_time'}
+        if monotonic is None:
+            monotonic = time.monotonic()
+        if timestamp is None:
+            timestamp = time.time() - (time.monotonic() - monotonic)
+        line = json.dumps(dict(event, timestamp=timestamp, monotonic=monotonic))
+        with self._event_lock:
+            with open(os.path.join(self.path, 'events.jsonl'), 'a') as f:
+                f.write(line + '\n')
+
+    def events(self):
+        events_path = os.path.join(self.path, 'events.jsonl')
+        if not os.path.exists(events_path):
+            return []
+        with self._event_lock:
+            with open(events_path) as f:
+                events = [json.loads(line) for line in f if line.strip()]
+        for event, offset in zip(events, self._session_offsets('event', len(events))):
+            event['run_time'] = event['monotonic'] + float(offset)
+        return events
+
+    def flush(self):
+        if not self._pending_index:
+            return
+        self._commit_spectra(SPECTRUM_FIELDS)
+        with open(os.path.join(self.path, 'metadata.jsonl'), 'a') as f:
+            f.write(''.join(line + '\n' for line in self._pending_metadata))
+        index_file = self._file('index.bin')
+        index_file.write(np.array(self._pending_index, dtype=INDEX_DTYPE).tobytes())
+        index_file.flush()
+        self._count += len(self._pending_index)
+        self._pending_index = []
+        self._pending_metadata = []
+
+    def truncate(self, frames):
+        # Drops every spectrum after the first frames, e.g. those of a
+        # condition that was interrupted before its checkpoint was saved
+        self.close()
+        if frames < self._count:
+            print(f"Discarding {self._count - frames} spectra after frame {frames}")
+            self._count = frames
+            self._recover()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def _map(self, name, dtype, rows, shape=()):
+        if rows == 0:
+            return np.empty((0,) + shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=(rows,) + shape)
+
+    def index(self):
+        self.flush()
+        return self._map('index.bin', INDEX_DTYPE, self._count)
+
+    def read(self, field, start=None, stop=None):
+        # Memory-mapped view of a slice of frames; nothing is read until used
+        self.flush()
+        if field in CALIBRATION_FIELDS:
+            rows = self._calibration + 1
+        elif field in SPECTRUM_FIELDS:
+            rows = self._count
+        else:
+            raise ValueError(f"Unknown field '{field}'. Expected one of {SPECTRUM_FIELDS + CALIBRATION_FIELDS}.")
+        pixels, dtype = self._layout(field)
+        if self.compression is not None:
+            return self._read_blocks(field, range(rows)[start:stop], pixels, dtype)
+        return self._map(f'{field}.bin', dtype, rows, (pixels,))[start:stop]
+
+    def _read_blocks(self, field, frames, pixels, dtype):
+        # Decompresses only the blocks that hold the requested frames
+        if len(frames) == 0:
+            return np.empty((0, pixels), dtype=dtype)
+        blocks = self._blocks(field)
+        ends = np.cumsum(blocks['frames'])
+        first = int(np.searchsorted(ends, frames.start, side='right'))
+        last = int(np.searchsorted(ends, frames.stop - 1, side='right'))
+        spectra = []
+        with open(os.path.join(self.path, f'{field}.bin'), 'rb') as f:
+            for block in blocks[first:last + 1]:
+                f.seek(int(block['offset']))
+                spectra.append(decompress(f.read(int(block['size'])), dtype, (int(block['frames']), pixels)))
+        begin = int(ends[first] - blocks['frames'][first])
+        return np.concatenate(spectra)[frames.start - begin:frames.stop - begin]
+
+    def time_slice(self, start_time, stop_time):
+        # Frames with start_time <= timestamp < stop_time, found by binary search
+        timestamps = self.index()['timestamp']
+        start, stop = np.searchsorted(timestamps, [start_time, stop_time])
+        return slice(int(start), int(stop))
+
+    def calibration(self, calibration_id):
+        # Reference and background at the detector's full resolution
+        return self.read('reference')[calibration_id], self.read('background')[calibration_id]
+
+    def metadata(self, start=None, stop=None):
+        self.flush()
+        metadata_path = os.path.join(self.path, 'metadata.jsonl')
+        if not os.path.exists(metadata_path):
+            return []
+        with open(metadata_path) as f:
+            # A writer may have lines on disk beyond the indexed frames
+            lines = f.readlines()[:self._count][start:stop]
+        return [json.loads(line) for line in lines]
+
+    def export_csv(self, directory, start=None, stop=None):
+        # Writes the per-measurement CSV files the scripts used to produce,
+        # named absorbance_data_<timestamp>[_<concentration>mM].csv
+        import pandas as pd
+
+        os.makedirs(directory, exist_ok=True)
+        index = self.index()[start:stop]
+        absorbance = self.read('absorbance', start, stop)
+        metadata = self.metadata(start, stop)
+        first = range(len(self))[slice(start, stop)].start
+        file_paths = []
+        for i, row in enumerate(index):
+            name = 'absorbance_data_' + datetime.fromtimestamp(row['timestamp']).strftime("%Y%m%d%H%M%S")
+            concentration = metadata[i].get('methyl_orange_concentration')
+            if concentration is not None:
+                name += f'_{concentration}mM'
+            file_path = os.path.join(directory, name + '.csv')
+            if os.path.exists(file_path):
+                file_path = os.path.join(directory, f'{name}_{first + i}.csv')
+            df = pd.DataFrame({'Wavelength': self.wavelengths, 'Absorbance': absorbance[i]})
+            df.to_csv(file_path, index=False)
+            file_paths.append(file_path)
+        return file_paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="aunpc export",
+                                     description="Show a spectrum store, or export its spectra to CSV files.")
+    parser.add_argument("store", help="spectrum store directory")
+    parser.add_argument("directory", nargs='?', help="write one absorbance CSV per stored spectrum into this directory")
+    parser.add_argument("--start", type=int, help="first frame to export")
+    parser.add_argument("--stop", type=int, help="frame to stop exporting at")
+    args = parser.parse_args(argv)
+
+    with SpectrumStore(args.store) as store:
+        print(f"{args.store}: {len(store)} spectra, {store.num_pixels} pixels, run metadata {store.run_metadata}")
+        if store.reduction is not None or store.compression is not None:
+            print(f"Stored with reduction {store.meta['reduction']} and compression {store.compression}")
+        if args.directory:
+            file_paths = store.export_csv(args.directory, args.start, args.stop)
+            print(f"Exported {len(file_paths)} files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FEATURE_NAMES = ('peak_wavelength', 'peak_absorbance', 'fwhm', 'absorbance_400', 'peak_to_400_ratio')
+
+
+def crop_roi(wavelengths, spectra, roi):
+    mask = (wavelengths >= roi[0]) & (wavelengths <= roi[1])
+    return wavelengths[mask], spectra[..., mask]
+
+
+def mask_invalid(spectra):
+    # calculate_absorbance leaves NaN/inf wherever the detector had no
+    # signal; mark them all as NaN so they can be excluded consistently
+    return np.where(np.isfinite(spectra), spectra, np.nan)
+
+
+def savgol_coefficients(window, order):
+    if window % 2 == 0 or window <= order:
+        raise ValueError("The Savitzky-Golay window must be odd and larger than the polynomial order.")
+    offsets = np.arange(window) - window // 2
+    vandermonde = offsets[:, None] ** np.arange(order + 1)
+    # Row 0 of the pseudo-inverse evaluates the fitted polynomial at the centre
+    return np.linalg.pinv(vandermonde)[0]
+
+
+def savgol_smooth(spectra, window=11, order=2):
+    # Smooths every spectrum along the last axis in one pass. Windows that
+    # touch a NaN pixel produce NaN instead of spreading it as zeros.
+    coefficients = savgol_coefficients(window, order)
+    half = window // 2
+    valid = np.isfinite(spectra)
+    filled = np.where(valid, spectra, 0.0)
+    padding = [(0, 0)] * (spectra.ndim - 1) + [(half, half)]
+    windows = sliding_window_view(np.pad(filled, padding, mode='edge'), window, axis=-1)
+    smoothed = windows @ coefficients
+    invalid_windows = sliding_window_view(np.pad(~valid, padding, mode='edge'), window, axis=-1).any(axis=-1)
+    smoothed[invalid_windows] = np.nan
+    return smoothed
+
+
+def peak_positions(wavelengths, spectra, half_width=10):
+    # Maximum of each row refined by a least-squares parabola through the
+    # 2 * half_width + 1 pixels around it; SPR bands are tens of nm wide, so
+    # a three-point fit would follow the noise rather than the band.
+    # Returns (peak wavelength, peak height, peak index); all-NaN rows give NaN.
+    num_pixels = spectra.shape[-1]
+    half_width = max(1, min(half_width, (num_pixels - 1) // 2))
+    searchable = np.where(np.isnan(spectra), -np.inf, spectra)
+    index = np.argmax(searchable, axis=-1)
+    centre = np.clip(index, half_width, num_pixels - 1 - half_width)
+    offsets = np.arange(-half_width, half_width + 1)
+    neighbourhood = np.take_along_axis(spectra, centre[..., None] + offsets, axis=-1)
+    a, b, c = np.moveaxis(neighbourhood @ np.linalg.pinv(offsets[:, None] ** np.arange(3)).T, -1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertex = np.where(c < 0, -b / (2 * c), np.nan)
+    # Fall back to the raw maximum when the fit has no maximum in the window
+    fitted = np.isfinite(vertex) & (np.abs(vertex) <= half_width)
+    vertex = np.where(fitted, vertex, index - centre)
+    position = centre + vertex
+    lower = np.clip(np.floor(position).astype(int), 0, num_pixels - 2)
+    peak_wavelength = wavelengths[lower] + (position - lower) * (wavelengths[lower + 1] - wavelengths[lower])
+    raw_height = np.take_along_axis(spectra, index[..., None], axis=-1)[..., 0]
+    peak_height = np.where(fitted, a + b * vertex + c * vertex ** 2, raw_height)
+    peak_wavelength = np.where(np.isnan(raw_height), np.nan, peak_wavelength)
+    return peak_wavelength, peak_height, index
+
+
+def full_width_half_maximum(wavelengths, spectra, peak_index, peak_height, baseline=None):
+    # Half maximum is taken above the baseline (the row minimum by default)
+    # and both crossings are linearly interpolated between pixels
+    if baseline is None:
+        baseline = np.where(np.isfinite(spectra), spectra, np.inf).min(axis=-1)
+    half = baseline + (peak_height - baseline) / 2
+    pixels = np.arange(spectra.shape[-1])
+    below = spectra < half[..., None]
+    last = spectra.shape[-1] - 1
+    left = np.where(below & (pixels < peak_index[..., None]), pixels, -1).max(axis=-1)
+    right = np.where(below & (pixels > peak_index[..., None]), pixels, last + 1).min(axis=-1)
+
+    def crossing(a, b):
+        a = np.clip(a, 0, last)
+        b = np.clip(b, 0, last)
+        ya = np.take_along_axis(spectra, a[..., None], axis=-1)[..., 0]
+        yb = np.take_along_axis(spectra, b[..., None], axis=-1)[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(yb != ya, (half - ya) / (yb - ya), 0.0)
+        return wavelengths[a] + fraction * (wavelengths[b] - wavelengths[a])
+
+    width = crossing(right - 1, right) - crossing(left, left + 1)
+    return np.where((left >= 0) & (right <= last), width, np.nan)
+
+
+def value_at(wavelengths, spectra, wavelength):
+    # Linear interpolation of every row at a single wavelength
+    upper = int(np.clip(np.searchsorted(wavelengths, wavelength), 1, len(wavelengths) - 1))
+    fraction = (wavelength - wavelengths[upper - 1]) / (wavelengths[upper] - wavelengths[upper - 1])
+    return spectra[..., upper - 1] + fraction * (spectra[..., upper] - spectra[..., upper - 1])
+
+
+def extract_features(wavelengths, absorbance, roi=(450.0, 700.0), window=11, order=2, reference_wavelength=400.0):
+    # absorbance is one spectrum or an (n_spectra, n_pixels) array. The SPR
+    # peak and FWHM are searched in roi; the absorbance at
+    # reference_wavelength tracks the Au(0) yield.
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    absorbance = np.asarray(absorbance, dtype=float)
+    single = absorbance.ndim == 1
+    spectra = np.atleast_2d(absorbance)
+
+    span = (min(roi[0], reference_wavelength - window), max(roi[1], reference_wavelength + window))
+    span_wavelengths, cropped = crop_roi(wavelengths, mask_invalid(spectra), span)
+    smoothed = savgol_smooth(cropped, window, order)
+
+    roi_mask = (span_wavelengths >= roi[0]) & (span_wavelengths <= roi[1])
+    roi_wavelengths = span_wavelengths[roi_mask]
+    roi_spectra = smoothed[:, roi_mask]
+    peak_wavelength, peak_absorbance, peak_index = peak_positions(roi_wavelengths, roi_spectra)
+    fwhm = full_width_half_maximum(roi_wavelengths, roi_spectra, peak_index, peak_absorbance)
+    absorbance_400 = value_at(span_wavelengths, smoothed, reference_wavelength)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = peak_absorbance / absorbance_400
+
+    features = {
+        'peak_wavelength': peak_wavelength,
+        'peak_absorbance': peak_absorbance,
+        'fwhm': fwhm,
+        'absorbance_400': absorbance_400,
+        'peak_to_400_ratio': ratio,
+    }
+    if single:
+        return {name: float(values[0]) for name, values in features.items()}
+    return features
+
+
+def store_features(store, start=None, stop=None, chunk_frames=4096, **options):
+    # Features for a slice of a SpectrumStore, read through the memmap in chunks
+    absorbance = store.read('absorbance', start, stop)
+    chunks = [extract_features(store.wavelengths, absorbance[i:i + chunk_frames], **options)
+              for i in range(0, len(absorbance), chunk_frames)]
+    if not chunks:
+        return {name: np.empty(0) for name in FEATURE_NAMES}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in FEATURE_NAMES}
+
+
+def main(argv=None):
+    from .spectrum_store import SpectrumStore
+
+    parser = argparse.ArgumentParser(prog="aunpc features",
+                                     description="Compute SPR features for every spectrum in a spectrum store.")
+    parser.add_argument("store", help="spectrum store directory")
+    parser.add_argument("output", help="CSV file for the features")
+    parser.add_argument("--roi", type=float, nargs=2, default=(450.0, 700.0), help="peak search range in nm")
+    args = parser.parse_args(argv)
+
+    with SpectrumStore(args.store) as store:
+        features = store_features(store, roi=tuple(args.roi))
+        timestamps = store.index()['timestamp']
+    columns = np.column_stack([timestamps] + [features[name] for name in FEATURE_NAMES])
+    np.savetxt(args.output, columns, delimiter=',', header=','.join(('timestamp',) + FEATURE_NAMES), comments='')
+    print(f"Features for {len(timestamps)} spectra have been written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
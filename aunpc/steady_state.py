@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+
+from .kinetics import measurement_times
+from .spr_features import peak_positions, savgol_smooth
+
+
+def _trend(timestamps, values):
+    # Least-squares change across the window for every column of values,
+    # i.e. slope * window duration. Using the trend rather than max - min
+    # keeps frame-to-frame noise from holding off convergence.
+    t = timestamps - timestamps.mean()
+    denominator = np.dot(t, t)
+    if denominator == 0:
+        return np.full(values.shape[1:], np.inf)
+    slope = np.tensordot(t, values - np.nanmean(values, axis=0), axes=(0, 0)) / denominator
+    return slope * (timestamps[-1] - timestamps[0])
+
+
+class SteadyStateDetector:
+    # Tracks the SPR peak position, peak height and the whole spectrum in
+    # the region of interest over a sliding window of absorbance spectra,
+    # and reports steady state once none of them is still trending. Peaks
+    # are found on a smoothed spectrum and the drift is measured on
+    # wavelength bands, so detector noise does not hold off convergence.
+    def __init__(self, wavelengths, window=20, roi=(450.0, 700.0), peak_tolerance=1.0,
+                 height_tolerance=0.01, drift_tolerance=0.005, smoothing=11, bands=25):
+        wavelengths = np.asarray(wavelengths)
+        self.roi_mask = (wavelengths >= roi[0]) & (wavelengths <= roi[1])
+        self.wavelengths = wavelengths[self.roi_mask]
+        self.window = window
+        self.peak_tolerance = peak_tolerance
+        self.height_tolerance = height_tolerance
+        self.drift_tolerance = drift_tolerance
+        self.smoothing = smoothing
+        band_edges = np.linspace(0, len(self.wavelengths), min(bands, len(self.wavelengths)) + 1).astype(int)
+        self._band_starts = band_edges[:-1]
+        self._band_sizes = np.diff(band_edges)
+        self._spectra = np.zeros((window, len(self._band_starts)))
+        self._features = np.zeros((window, 2))
+        self._timestamps = np.zeros(window)
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+
+    def update(self, absorbance, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        slot = self.count % self.window
+        spectrum = np.asarray(absorbance, dtype=float)[self.roi_mask]
+        spectrum[~np.isfinite(spectrum)] = np.nan
+        peak_wavelength, peak_height, _ = peak_positions(self.wavelengths, savgol_smooth(spectrum[None], self.smoothing))
+        self._features[slot] = peak_wavelength[0], peak_height[0]
+        self._spectra[slot] = np.add.reduceat(spectrum, self._band_starts) / self._band_sizes
+        self._timestamps[slot] = timestamp
+        self.count += 1
+        return self.steady
+
+    def _ordered(self):
+        order = np.argsort(self._timestamps[:min(self.count, self.window)])
+        return self._timestamps[order], self._features[order], self._spectra[order]
+
+    def status(self):
+        if self.count < 2:
+            return {'peak_wavelength': None, 'peak_change': None, 'height_change': None, 'drift': None}
+        timestamps, features, spectra = self._ordered()
+        peak_change, height_change = np.abs(_trend(timestamps, features))
+        drift = float(np.sqrt(np.nanmean(_trend(timestamps, spectra) ** 2)))
+        return {
+            'peak_wavelength': float(features[-1, 0]),
+            'peak_change': float(peak_change),
+            'height_change': float(height_change),
+            'drift': drift,
+        }
+
+    @property
+    def steady(self):
+        if self.count < self.window:
+            return False
+        status = self.status()
+        return (status['peak_change'] <= self.peak_tolerance
+                and status['height_change'] <= self.height_tolerance
+                and status['drift'] <= self.drift_tolerance)
+
+
+def wait_for_steady_state(acquisition, absorbance_calculator, detector, num_measurements=5,
+                          timeout=None, min_wait=0.0, report_every=10, record=None):
+    # Measures short averages until the detector reports steady state.
+    # Returns False if the timeout passes first so the caller can decide
+    # whether to measure anyway. record(intensities, absorbance, timestamp,
+    # monotonic) is called with every average the detector sees, e.g. to
+    # store it so 'aunpc replay' can repeat the decision; both arrays are
+    # reused for the next average.
+    detector.reset()
+    absorbance = np.empty(len(acquisition.wavelengths))
+    start = time.monotonic()
+    while True:
+        started = time.monotonic()
+        intensities, _ = acquisition.collect(num_measurements)
+        timestamp, monotonic = measurement_times(started)
+        absorbance_calculator(intensities, out=absorbance)
+        if record is not None:
+            record(intensities, absorbance, timestamp, monotonic)
+        steady = detector.update(absorbance, monotonic)
+        elapsed = time.monotonic() - start
+        if detector.count >= 2 and detector.count % report_every == 0:
+            status = detector.status()
+            print(f"Equilibrating for {elapsed:.0f} s: peak {status['peak_wavelength']:.1f} nm, "
+                  f"peak change {status['peak_change']:.2f} nm, drift {status['drift']:.4f}")
+        if steady and elapsed >= min_wait:
+            print(f"Steady state reached after {elapsed:.0f} s.")
+            return True
+        if timeout is not None and elapsed >= timeout:
+            print(f"No steady state after {elapsed:.0f} s.")
+            return False
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import serial
+
+CHECKPOINT_NAME = 'checkpoint.json'
+
+# SyringePump methods that talk to the pump and are retried after a reconnect
+_PUMP_COMMANDS = ('send_command', 'set_syringe_diameter', 'set_flow_rate', 'set_volume', 'start_pump', 'stop_pump')
+
+
+class SupervisedPump:
+    # Wraps a SyringePump so a timed-out reply or a serial error reconnects
+    # the port, puts the pump back into its last known state and sends the
+    # command again, instead of ending the run. Everything else is passed
+    # through, so PumpGroup and RecipeRunner use it like the pump itself.
+    def __init__(self, pump, retries=3, backoff=2.0):
+        self.pump = pump
+        self.retries = retries
+        self.backoff = backoff
+        self.reconnects = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.pump, name)
+        if name not in _PUMP_COMMANDS:
+            return attribute
+
+        def supervised(*args):
+            return self._call(attribute, name, args)
+        return supervised
+
+    def _call(self, method, name, args):
+        for attempt in range(self.retries + 1):
+            try:
+                response = method(*args)
+                if not response.timed_out:
+                    return response
+                problem = f"no reply to '{response.command}'"
+            except (serial.SerialException, OSError) as e:
+                problem = f"{type(e).__name__}: {e}"
+            if attempt == self.retries:
+                raise RuntimeError(f"Pump on {self.pump.port} failed after {self.retries} reconnects: {problem}")
+            print(f"Pump on {self.pump.port}: {problem}; reconnecting (attempt {attempt + 1}/{self.retries})")
+            time.sleep(self.backoff * attempt)
+            if name in ('start_pump', 'stop_pump'):
+                # Restore the run state the command asked for, so a failed
+                # stop does not restart the pump on reconnect
+                self.pump.last_known_state['running'] = name == 'start_pump'
+            try:
+                self.pump.reconnect()
+                self.reconnects += 1
+            except (serial.SerialException, OSError) as e:
+                print(f"Reconnecting to {self.pump.port} failed: {e}")
+
+
+def open_supervised_pump(port):
+    from .syringe_pump import SyringePump
+
+    return SupervisedPump(SyringePump(port))
+
+
+class AcquisitionWatchdog:
+    # Restarts a ContinuousAcquisition whose detector stops delivering
+    # frames, because the read thread died or a read hung for longer than
+    # stall_timeout. reopen() returns a freshly opened spectrometer with its
+    # integration time set. While the watchdog runs, collect waits through
+    # a restart instead of failing.
+    def __init__(self, acquisition, reopen, stall_timeout=10.0, check_interval=1.0, max_restarts=5):
+        self.acquisition = acquisition
+        self.reopen = reopen
+        self.stall_timeout = stall_timeout
+        self.check_interval = check_interval
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.acquisition.watchdog = self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="acquisition-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.acquisition.watchdog = None
+
+    def _run(self):
+        frames = self.acquisition.buffer.count
+        last_progress = time.monotonic()
+        while not self._stop_event.wait(self.check_interval):
+            if self.acquisition.buffer.count != frames:
+                frames = self.acquisition.buffer.count
+                last_progress = time.monotonic()
+                continue
+            stalled = time.monotonic() - last_progress > self.stall_timeout
+            if self.acquisition.running and not stalled:
+                continue
+            if self.restarts >= self.max_restarts:
+                print(f"Spectrometer {self.acquisition.serial_number} did not recover after {self.restarts} restarts.")
+                # Let collect raise instead of waiting forever
+                self.acquisition.watchdog = None
+                return
+            reason = "stalled" if self.acquisition.running else f"stopped ({self.acquisition.error})"
+            print(f"Spectrometer {self.acquisition.serial_number} {reason}; reopening it.")
+            self.restarts += 1
+            try:
+                old_spec = self.acquisition.spec
+                if hasattr(old_spec, 'close'):
+                    try:
+                        old_spec.close()
+                    except Exception:
+                        pass
+                self.acquisition.restart(self.reopen())
+            except Exception as e:
+                print(f"Reopening spectrometer {self.acquisition.serial_number} failed: {e}")
+            last_progress = time.monotonic()
+
+
+class Checkpoint:
+    # Progress of a run, kept next to its spectra so an interrupted run can
+    # resume: the number of conditions completed, the frames and
+    # calibration they are in, and the integration time. Written atomically
+    # like the store's meta.json.
+    def __init__(self, directory):
+        self.path = os.path.join(directory, CHECKPOINT_NAME)
+        self.data = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+    def __bool__(self):
+        return bool(self.data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def save(self, **progress):
+        self.data.update(progress, updated=datetime.now().isoformat())
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temporary_path, self.path)
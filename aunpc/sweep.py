@@ -0,0 +1,164 @@
+import os
+import time
+from datetime import datetime
+
+from .acquisition import ContinuousAcquisition
+from .auto_exposure import collect_adaptive
+from .calibration_cache import load_or_acquire_calibration
+from .hardware import get_spectrometer, open_spectrometer, set_integration_time
+from .instrumentation import METRICS, timer
+from .kinetics import measurement_times, record_pump_events
+from .live_viewer import LiveViewer
+from .processing import AbsorbanceCalculator
+from .pump_group import PumpGroup
+from .spectrum_store import SpectrumStore
+from .steady_state import SteadyStateDetector, wait_for_steady_state
+from .supervisor import AcquisitionWatchdog, open_supervised_pump
+
+
+def open_spectrum_store(wavelengths, run_metadata):
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
+    store_path = os.path.join(desktop_path, f'absorbance_run_{timestamp}')
+    print(f"Spectra will be written to {store_path}")
+    # Measurements are minutes apart, so commit every spectrum straight away
+    return SpectrumStore(store_path, wavelengths, run_metadata, chunk_frames=1)
+
+
+def main(serial_number=None, integration_time=None):
+    spec = get_spectrometer(serial_number)
+    if not spec:
+        return
+    integration_time = set_integration_time(spec, integration_time)
+
+    # Read the spectrometer continuously in the background from here on, and
+    # reopen it if it stops delivering spectra
+    acquisition = ContinuousAcquisition(spec).start()
+    # Everything opened from here on is closed again on an error or Ctrl-C
+    watchdog = viewer = store = mixing_pumps = None
+    pumps = []
+    try:
+        watchdog = AcquisitionWatchdog(acquisition, lambda: open_spectrometer(spec.serial_number, integration_time)).start()
+        viewer = LiveViewer(acquisition, title="AuNPC inline synthesis").start()
+
+        reference_intensities, background_intensities = load_or_acquire_calibration(
+            acquisition.collect, spec.serial_number, integration_time, num_measurements=10)
+        wavelengths = acquisition.wavelengths
+        viewer.show(reference_intensities, "Reference Spectrum")
+        viewer.show(background_intensities, "Background Spectrum")
+        absorbance_calculator = AbsorbanceCalculator(reference_intensities, background_intensities)
+        viewer.set_calibration(reference_intensities, background_intensities)
+        steady_state_detector = SteadyStateDetector(wavelengths)
+
+        # Pumps that stop replying are reconnected and restored; each is
+        # listed as soon as it opens, so a later one failing still closes it
+        for port in ('COM7', 'COM8', 'COM9', 'COM10'):
+            pumps.append(open_supervised_pump(port))
+        haucl4_pump, sodium_citrate_pump, milliq_water_pump, methyl_orange_pump = pumps
+        # MilliQ and methyl orange are always switched together to keep the mixing ratio
+        mixing_pumps = PumpGroup([milliq_water_pump, methyl_orange_pump])
+
+        flow_rate_unit = input("Enter the unit for flow rate (uL/min, mL/min, uL/hr, mL/hr): ").strip()
+        haucl4_flow_rate = float(input("Enter the flow rate for HAuCl4 Syringe Pump (COM7): ").strip())
+        sodium_citrate_flow_rate = float(input("Enter the flow rate for Sodium Citrate Syringe Pump (COM8): ").strip())
+        milliq_flow_rate_total = float(input("Enter the total flow rate for MilliQ Water and Methyl Orange Syringe Pumps: ").strip())
+
+        haucl4_pump.set_flow_rate(haucl4_flow_rate, flow_rate_unit)
+        sodium_citrate_pump.set_flow_rate(sodium_citrate_flow_rate, flow_rate_unit)
+
+        store = open_spectrum_store(wavelengths, {
+            'spectrometer': spec.serial_number,
+            'flow_rate_unit': flow_rate_unit,
+            'haucl4_flow_rate': haucl4_flow_rate,
+            'sodium_citrate_flow_rate': sodium_citrate_flow_rate,
+            'milliq_flow_rate_total': milliq_flow_rate_total,
+        })
+        store.add_calibration(reference_intensities, background_intensities)
+        # Log every pump start and flow rate change next to the spectra, so they
+        # can be looked up by residence time afterwards
+        record_pump_events(store, {
+            'haucl4': haucl4_pump,
+            'sodium_citrate': sodium_citrate_pump,
+            'milliq_water': milliq_water_pump,
+            'methyl_orange': methyl_orange_pump,
+        })
+        # Stage timings are traced next to the spectra and summarised at the end
+        METRICS.start_run(store.path)
+
+        while True:
+            input("Press Enter to update the concentration and flow rates of MilliQ and Methyl Orange pumps...")
+            methyl_orange_concentration = float(input("Enter the desired concentration of methyl orange (in mM): "))
+            methyl_orange_flow_rate = (methyl_orange_concentration / 2.5) * milliq_flow_rate_total
+            milliq_flow_rate = milliq_flow_rate_total - methyl_orange_flow_rate
+
+            # Stop the pumps before updating the flow rates
+            mixing_pumps.stop()
+
+            # Update flow rates before starting the pumps
+            mixing_pumps.set_flow_rates([(milliq_flow_rate, flow_rate_unit), (methyl_orange_flow_rate, flow_rate_unit)])
+
+            print(f"Updated MilliQ Water Pump Flow Rate: {milliq_flow_rate} {flow_rate_unit}")
+            print(f"Updated Methyl Orange Pump Flow Rate: {methyl_orange_flow_rate} {flow_rate_unit}")
+
+            # Start MilliQ and Methyl Orange pumps together
+            mixing_pumps.start()
+            print("MilliQ and Methyl Orange pumps started.")
+
+            # Wait for 60 seconds
+            time.sleep(60)
+
+            # Start HAuCl4 pump
+            haucl4_pump.start_pump()
+            print("HAuCl4 pump started.")
+
+            # Wait for another 30 seconds
+            time.sleep(30)
+
+            # Start Sodium Citrate pump
+            sodium_citrate_pump.start_pump()
+            print("Sodium Citrate pump started.")
+
+            # Measure as soon as the reactor output stops changing
+            with timer('wait_steady'):
+                # Every average the decision is made on is stored for replay
+                def record(intensities, absorbance, timestamp, monotonic):
+                    store.append(intensities, absorbance, {'kind': 'equilibration',
+                                                           'methyl_orange_concentration': methyl_orange_concentration},
+                                 timestamp, monotonic)
+                wait_for_steady_state(acquisition, absorbance_calculator, steady_state_detector, timeout=600, record=record)
+
+            # Average only as many spectra as the target noise level needs
+            started = time.monotonic()
+            with timer('collect_adaptive'):
+                sample_intensities, _ = collect_adaptive(acquisition, target_standard_error=0.002,
+                                                         absorbance_calculator=absorbance_calculator)
+            timestamp, monotonic = measurement_times(started)
+            absorbance = absorbance_calculator(sample_intensities)
+            viewer.show(absorbance, f"{methyl_orange_concentration} mM", kind='absorbance')
+            frame_number = store.append(sample_intensities, absorbance, {
+                'methyl_orange_concentration': methyl_orange_concentration,
+                'milliq_flow_rate': milliq_flow_rate,
+                'methyl_orange_flow_rate': methyl_orange_flow_rate,
+            }, timestamp, monotonic)
+            print(f"Spectrum {frame_number} has been written to {store.path}")
+
+            choice = input("Press 'Q' to quit or Enter to continue with another methyl orange concentration: ").strip().lower()
+            if choice == 'q':
+                break
+    finally:
+        if store is not None:
+            store.close()
+        if viewer is not None:
+            viewer.close()
+        if mixing_pumps is not None:
+            mixing_pumps.close()
+        for pump in pumps:
+            pump.close()
+        if watchdog is not None:
+            watchdog.stop()
+        acquisition.stop()
+        METRICS.finish_run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import time
+from datetime import datetime
+
+from .acquisition import ContinuousAcquisition
+from .auto_exposure import collect_adaptive
+from .calibration_cache import load_or_acquire_calibration
+from .hardware import get_spectrometer, open_spectrometer, set_integration_time
+from .instrumentation import METRICS
+from .kinetics import measurement_times, record_pump_events
+from .live_viewer import LiveViewer
+from .processing import AbsorbanceCalculator
+from .spectrum_store import SpectrumStore
+from .steady_state import SteadyStateDetector, wait_for_steady_state
+from .supervisor import AcquisitionWatchdog, SupervisedPump
+from .syringe_pump import SyringePump
+
+
+def main(serial_number=None, integration_time=None):
+    # Initialize spectrometer
+    spec = get_spectrometer(serial_number)
+    if not spec:
+        return
+
+    # Set integration time for spectrometer
+    integration_time = set_integration_time(spec, integration_time)
+
+    # Read the spectrometer continuously in the background from here on, and
+    # reopen it if it stops delivering spectra
+    acquisition = ContinuousAcquisition(spec).start()
+    watchdog = AcquisitionWatchdog(acquisition, lambda: open_spectrometer(spec.serial_number, integration_time)).start()
+    viewer = LiveViewer(acquisition, title="AuNPC inline synthesis").start()
+
+    # Reuse a recent reference/background if it still matches, otherwise recalibrate
+    intensities_light_on, intensities_light_off = load_or_acquire_calibration(
+        acquisition.collect, spec.serial_number, integration_time, num_measurements=20)
+    viewer.show(intensities_light_on, 'Reference Spectrum')
+    viewer.snapshot('C:/Users/py23pp/Desktop/Peter/baseline_with_light_on.png')
+    viewer.show(intensities_light_off, 'Background Spectrum')
+    viewer.snapshot('C:/Users/py23pp/Desktop/Peter/baseline_with_light_off.png')
+    viewer.set_calibration(intensities_light_on, intensities_light_off)
+
+    # Initialize and configure syringe pumps
+    port1 = 'COM4' # Two inlet pump
+    port2 = 'COM5' # One inlet pump
+
+    # Either pump may fail to open, so only close the ones that did
+    pump1 = pump2 = None
+    try:
+        # Pumps that stop replying are reconnected and restored
+        pump1 = SupervisedPump(SyringePump(port=port1))
+        pump2 = SupervisedPump(SyringePump(port=port2))
+
+        if pump1.is_open() and pump2.is_open():
+            diameter1 = float(input("Enter the diameter for the two inlet pump (in mm): "))
+            diameter2 = float(input("Enter the diameter for the one inlet pump (in mm): "))
+
+            volume1 = float(input("Enter the volume for the two inlet pump (in ml): "))
+            volume2 = float(input("Enter the volume for the one inlet pump (in ml): "))
+
+            flow_rate1 = float(input("Enter the flow rate for the two inlet pump: "))
+            unit1 = input("Enter the unit for the two inlet pump flow rate (MH, UH, UM, MM): ")
+
+            flow_rate2 = float(input("Enter the flow rate for the one inlet pump: "))
+            unit2 = input("Enter the unit for the one inlet pump flow rate (MH, UH, UM, MM): ")
+
+            # Set parameters for pump 1 (two inlet pump)
+            pump1.set_syringe_diameter(diameter1)
+            pump1.set_volume(volume1)
+            pump1.set_flow_rate(flow_rate1, unit1)
+
+            # Set parameters for pump 2 (one inlet pump)
+            pump2.set_syringe_diameter(diameter2)
+            pump2.set_volume(volume2)
+            pump2.set_flow_rate(flow_rate2, unit2)
+
+            # Prompt user to enter delay time for the one inlet pump
+            delay_time = float(input("Enter the delay time in seconds for the one inlet pump: "))
+
+            # Open this run's store in the time evolution folder before the pumps
+            # start, so both starts are logged with the spectra
+            run_name = datetime.now().strftime("run_%Y%m%d%H%M%S")
+            run_metadata = {
+                'spectrometer': spec.serial_number,
+                'two_inlet_pump': {'port': port1, 'diameter': diameter1, 'volume': volume1, 'flow_rate': flow_rate1, 'unit': unit1},
+                'one_inlet_pump': {'port': port2, 'diameter': diameter2, 'volume': volume2, 'flow_rate': flow_rate2, 'unit': unit2},
+                'delay_time': delay_time,
+            }
+            with SpectrumStore(os.path.join('C:/Users/py23pp/Desktop/Peter/Time evolution', run_name), acquisition.wavelengths, run_metadata) as store:
+                store.add_calibration(intensities_light_on, intensities_light_off)
+                record_pump_events(store, {'two_inlet_pump': pump1, 'one_inlet_pump': pump2})
+
+                # Prompt user to start both pumps
+                input("Press Enter to start both pumps...")
+
+                # Start both pumps
+                pump1.start_pump()
+
+                # Wait for delay time before starting pump2
+                time.sleep(delay_time)
+
+                # Start one inlet pump after delay
+                pump2.start_pump()
+
+                # Measure as soon as the reactor output stops changing
+                absorbance_calculator = AbsorbanceCalculator(intensities_light_on, intensities_light_off)
+                # Every average the decision is made on is stored for replay
+                def record(intensities, absorbance, timestamp, monotonic):
+                    store.append(intensities, absorbance, {'kind': 'equilibration'}, timestamp, monotonic)
+                wait_for_steady_state(acquisition, absorbance_calculator, SteadyStateDetector(acquisition.wavelengths),
+                                      timeout=600, record=record)
+
+                # Average only as many sample spectra as the target noise level needs
+                started = time.monotonic()
+                intensities_sample, wavelengths_sample = collect_adaptive(acquisition, target_standard_error=0.002,
+                                                                          absorbance_calculator=absorbance_calculator)
+                timestamp, monotonic = measurement_times(started)
+
+                # Calculate absorbance
+                absorbance = absorbance_calculator(intensities_sample)
+
+                # Save the spectrum, timed on the same clock as the pump starts
+                store.append(intensities_sample, absorbance, timestamp=timestamp, monotonic=monotonic)
+            print("Data has been written to", store.path)
+
+            # Plot absorbance
+            viewer.show(absorbance, 'Sample Absorbance', kind='absorbance')
+            viewer.snapshot('C:/Users/py23pp/Desktop/Peter/sample_absorbance.png')
+
+            # Keep running until user presses 'Q' to stop pumps
+            while True:
+                action = input("Press 'Q' to stop both pumps: ")
+                if action.lower() == 'q':
+                    # Stop both pumps
+                    pump1.stop_pump()
+                    pump2.stop_pump()
+                    break
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+    finally:
+        viewer.close()
+        watchdog.stop()
+        acquisition.stop()
+        for pump in (pump1, pump2):
+            if pump is not None:
+                pump.close()
+        print(METRICS.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import math
+import re
+import time
+
+import serial
+
+from .instrumentation import observe
+
+STX = b'\x02'
+ETX = b'\x03'
+
+# Prompt characters returned after the pump address in every reply
+PUMP_STATUS = {
+    'I': 'infusing',
+    'W': 'withdrawing',
+    'S': 'stopped',
+    'P': 'paused',
+    'T': 'timed pause',
+    'U': 'user wait',
+    'X': 'purging',
+    'A': 'alarm',
+}
+
+_RESPONSE_PATTERN = re.compile(r'(\d{2})([A-Z])(.*)', re.DOTALL)
+# Query replies such as "14.43", "1.000MM" or "5.000ML"
+_VALUE_PATTERN = re.compile(r'\s*([-+]?[0-9]*\.?[0-9]+)\s*([A-Z]*)')
+
+# Commands that change each cached setting
+_SETTINGS = {'DIA': 'diameter', 'RAT': 'rate', 'VOL': 'volume'}
+
+
+class PumpResponse:
+    def __init__(self, command, raw, round_trip_time):
+        self.command = command
+        self.raw = raw
+        self.round_trip_time = round_trip_time
+        # True when the command was not sent because the pump was known to
+        # be in the requested state already
+        self.skipped = False
+        # time.monotonic() just before the command was written, set by the
+        # sender; None for skipped commands
+        self.sent_at = None
+        self.text = raw.decode('latin1').strip('\x02\x03\r\n ')
+        self.address = None
+        self.status = None
+        self.data = self.text
+        match = _RESPONSE_PATTERN.match(self.text)
+        if match:
+            self.address = int(match.group(1))
+            self.status = match.group(2)
+            self.data = match.group(3)
+
+    @property
+    def timed_out(self):
+        return not self.raw
+
+    @property
+    def error(self):
+        if self.timed_out:
+            return 'timeout'
+        if self.data.startswith('?'):
+            return self.data
+        return None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def status_name(self):
+        return PUMP_STATUS.get(self.status, 'unknown')
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"PumpResponse({self.command!r}, {self.text!r}, {self.round_trip_time * 1000:.1f} ms)"
+
+
+class PumpTransport:
+    # Reads each reply up to the terminator byte instead of sleeping a fixed
+    # time and waiting for a newline the pump never sends. The serial timeout
+    # is the deadline for a reply.
+    def __init__(self, ser, terminator=ETX):
+        self.ser = ser
+        self.terminator = terminator
+
+    def _read_response(self, command, start):
+        raw = self.ser.read_until(self.terminator)
+        if not raw.endswith(self.terminator):
+            raw = b''
+        return PumpResponse(command, raw, time.perf_counter() - start)
+
+    def transact(self, command):
+        # Drop late replies left over from earlier timeouts
+        self.ser.reset_input_buffer()
+        start = time.perf_counter()
+        self.ser.write((command + '\r').encode())
+        return self._read_response(command, start)
+
+    def transact_many(self, commands):
+        # Pipelined: all commands are written at once and the replies are
+        # matched up in order. Each round-trip time is measured from the write.
+        self.ser.reset_input_buffer()
+        start = time.perf_counter()
+        self.ser.write(''.join(command + '\r' for command in commands).encode())
+        return [self._read_response(command, start) for command in commands]
+
+
+class SyringePump:
+    # Keeps a model of the pump's diameter, rate, volume and run state, built
+    # from acknowledged commands, the status prompt of every reply and
+    # queries in sync(). Setters whose value matches the model are not sent.
+    # RUN is only skipped with no volume target (VOL 0), since otherwise the
+    # pump stops by itself once it has delivered the volume. Pass
+    # cache_state=False to send everything.
+    def __init__(self, port, baudrate=9600, timeout=1, terminator=ETX, cache_state=True):
+        print(f"Initializing serial connection on port: {port}")
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.terminator = terminator
+        self.ser = serial.Serial(port, baudrate, timeout=timeout)
+        self.transport = PumpTransport(self.ser, terminator)
+        self.last_response = None
+        self.cache_state = cache_state
+        self.skipped_commands = 0
+        # Called as listener(pump, response, sent_at) for every command that
+        # reaches the pump, with sent_at on the time.monotonic() clock
+        self.listeners = []
+        self.state = {}
+        self.invalidate()
+        # Every setting the pump has acknowledged, kept when a timeout
+        # clears the model, for restore() after a reconnect
+        self.last_known_state = dict(self.state)
+        print("Serial connection initialized.")
+        if cache_state:
+            self.sync()
+
+    def invalidate(self):
+        # Forget the model, e.g. after the pump was changed from its keypad
+        self.state = {'diameter': None, 'rate': None, 'rate_unit': None, 'volume': None, 'running': None}
+
+    def sync(self, pipelined=True):
+        # One pipelined batch of queries instead of three round trips. A
+        # lost reply would shift the others onto the wrong query, so after
+        # trouble on the line the queries are sent one at a time.
+        queries = ["DIA", "RAT", "VOL"]
+        if pipelined:
+            responses = self.send_commands(queries)
+        else:
+            responses = [self.send_command(query) for query in queries]
+        for response in responses:
+            match = _VALUE_PATTERN.match(response.data) if response.ok else None
+            if match is None:
+                continue
+            name = _SETTINGS[response.command]
+            self.state[name] = float(match.group(1))
+            if name == 'rate' and match.group(2):
+                self.state['rate_unit'] = match.group(2)
+        return self.state
+
+    def reconnect(self):
+        # Reopens the serial port, e.g. after a USB adapter reset, and puts
+        # the pump back into its last known state
+        print(f"Reconnecting to the pump on {self.port}")
+        try:
+            self.ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+        self.transport = PumpTransport(self.ser, self.terminator)
+        self.invalidate()
+        return self.restore(self.last_known_state)
+
+    def restore(self, state):
+        # Re-applies diameter, volume, rate and run state from a state dict;
+        # settings the pump still holds are skipped after the sync
+        state = dict(state)
+        self.sync(pipelined=False)
+        # The pump refuses a new diameter while it runs, and still has the
+        # old one if it kept running
+        if state['diameter'] is not None and not self.state['running']:
+            self.set_syringe_diameter(state['diameter'])
+        if state['volume'] is not None:
+            self.set_volume(state['volume'])
+        if state['rate'] is not None and state['rate_unit']:
+            self.set_flow_rate(state['rate'], state['rate_unit'])
+        if state['running']:
+            self.start_pump()
+        elif state['running'] is False:
+            self.stop_pump()
+        return self.state
+
+    def _update_state(self, response):
+        if response.timed_out:
+            self.invalidate()
+            return
+        if response.status in ('I', 'W', 'X'):
+            self.state['running'] = True
+        elif response.status is not None:
+            self.state['running'] = False
+        parts = response.command.upper().split()
+        if not parts or parts[0] not in _SETTINGS or len(parts) < 2:
+            return
+        name = _SETTINGS[parts[0]]
+        if not response.ok:
+            self.state[name] = None
+            return
+        try:
+            self.state[name] = float(parts[1])
+        except ValueError:
+            self.state[name] = None
+        if name == 'rate':
+            self.state['rate_unit'] = parts[2] if len(parts) > 2 else self.state['rate_unit']
+        elif name == 'diameter':
+            # The pump may rescale its rate and volume limits for a new syringe
+            self.state['rate'] = self.state['volume'] = None
+
+    def _remember_state(self):
+        for name, value in self.state.items():
+            if value is not None:
+                self.last_known_state[name] = value
+
+    def _matches(self, name, value):
+        current = self.state[name]
+        # Values typed in at a prompt arrive as strings; anything that is not
+        # a number is always sent
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        return current is not None and math.isclose(current, value, rel_tol=1e-6, abs_tol=1e-12)
+
+    def _skip(self, command):
+        # Answer from the model without touching the serial port
+        self.skipped_commands += 1
+        status = 'I' if self.state['running'] else 'S'
+        address = self.last_response.address if self.last_response and self.last_response.address is not None else 0
+        response = PumpResponse(command, STX + f"{address:02d}{status}".encode() + ETX, 0.0)
+        response.skipped = True
+        print(f"Command skipped: {command} (pump on {self.port} is already set)")
+        return response
+
+    def is_open(self):
+        status = self.ser.is_open
+        print(f"Serial port open: {status}")
+        return status
+
+    def _notify(self, response, sent_at):
+        for listener in self.listeners:
+            listener(self, response, sent_at)
+
+    def send_command(self, command):
+        sent_at = time.monotonic()
+        response = self.transport.transact(command)
+        response.sent_at = sent_at
+        observe('pump_command', response.round_trip_time, port=self.port)
+        self._update_state(response)
+        self._remember_state()
+        self.last_response = response
+        self._notify(response, sent_at)
+        print(f"Command sent: {command}, Response: {response} ({response.round_trip_time * 1000:.1f} ms)")
+        if not response.ok:
+            print(f"Pump on {self.port} reported an error for '{command}': {response.error}")
+        return response
+
+    def send_commands(self, commands):
+        sent_at = time.monotonic()
+        responses = self.transport.transact_many(commands)
+        for response in responses:
+            response.sent_at = sent_at
+            observe('pump_command', response.round_trip_time, port=self.port)
+            self._update_state(response)
+            self._remember_state()
+            self._notify(response, sent_at)
+            print(f"Command sent: {response.command}, Response: {response} ({response.round_trip_time * 1000:.1f} ms)")
+        self.last_response = responses[-1] if responses else self.last_response
+        return responses
+
+    def set_syringe_diameter(self, diameter):
+        command = f"DIA {diameter}"
+        if self.cache_state and self._matches('diameter', diameter):
+            return self._skip(command)
+        return self.send_command(command)
+
+    def set_flow_rate(self, rate, unit):
+        command = f"RAT {rate} {unit}"
+        if self.cache_state and self._matches('rate', rate) and self.state['rate_unit'] == unit.upper():
+            return self._skip(command)
+        return self.send_command(command)
+
+    def set_volume(self, volume):
+        command = f"VOL {volume}"
+        if self.cache_state and self._matches('volume', volume):
+            return self._skip(command)
+        return self.send_command(command)
+
+    def start_pump(self):
+        command = "RUN"
+        if self.cache_state and self.state['running'] and self.state['volume'] == 0:
+            return self._skip(command)
+        return self.send_command(command)
+
+    def stop_pump(self):
+        command = "STP"
+        if self.cache_state and self.state['running'] is False:
+            return self._skip(command)
+        return self.send_command(command)
+
+    def close(self):
+        print("Closing serial connection.")
+        self.ser.close()
+        print("Serial connection closed.")
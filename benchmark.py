@@ -0,0 +1,244 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from aunpc.acquisition import ContinuousAcquisition
+from aunpc.multi_device import MultiDeviceAcquisition
+from aunpc.processing import AbsorbanceCalculator
+from aunpc.pump_group import PumpGroup
+from aunpc.spectrum_store import SpectrumStore
+from aunpc.simulation import SimulatedSpectrometer, SimulatedSyringePump, open_simulated_spectrometer
+from aunpc.syringe_pump import SyringePump
+
+# Metrics where a larger value is better; every other metric is a duration
+HIGHER_IS_BETTER = {"legacy_frames_per_second", "continuous_frames_per_second", "multi_device_min_frames_per_second"}
+
+
+def quiet():
+    # The pump and acquisition code report every step on stdout
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def benchmark_acquisition(integration_time, num_frames):
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(integration_time)
+
+    # The pre-engine pattern: read, then sleep another integration period
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        spec.intensities()
+        time.sleep(integration_time / 1_000_000)
+    legacy = num_frames / (time.perf_counter() - start)
+
+    with ContinuousAcquisition(spec) as acquisition:
+        acquisition.collect(1)
+        start = time.perf_counter()
+        acquisition.collect(num_frames)
+        continuous = num_frames / (time.perf_counter() - start)
+
+    return {"legacy_frames_per_second": legacy, "continuous_frames_per_second": continuous}
+
+
+def benchmark_multi_device(integration_time, num_frames, num_devices):
+    # The slowest device's frame rate with num_devices running side by side
+    devices = {f"SIM-{i}": integration_time for i in range(num_devices)}
+    with MultiDeviceAcquisition(devices, open_device=open_simulated_spectrometer) as acquisition:
+        acquisition.collect(1)
+        start = time.perf_counter()
+        acquisition.collect(num_frames)
+        elapsed = time.perf_counter() - start
+    return {"multi_device_min_frames_per_second": num_frames / elapsed}
+
+
+def benchmark_serial(num_commands, latency):
+    round_trips = []
+    with SimulatedSyringePump(latency=latency) as simulated, quiet():
+        pump = SyringePump(port=simulated.port)
+        try:
+            for i in range(num_commands):
+                start = time.perf_counter()
+                pump.set_flow_rate(1.0 + i, "MM")
+                round_trips.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            pump.send_commands(["DIA 26.59", "VOL 10", "RAT 1.0 MM"])
+            pipelined = time.perf_counter() - start
+        finally:
+            pump.close()
+    return {
+        "serial_round_trip_mean_s": statistics.mean(round_trips),
+        "serial_round_trip_max_s": max(round_trips),
+        "serial_pipelined_batch_s": pipelined,
+    }
+
+
+def _spectrum_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+               if name.endswith(('.bin', '.blocks')) and name not in ('index.bin', 'calibrations.bin'))
+
+
+def benchmark_storage(num_frames, num_pixels=1044):
+    rng = np.random.default_rng(0)
+    wavelengths = np.linspace(200.0, 1000.0, num_pixels)
+    # An SPR band with detector noise, so compression sees realistic data
+    band = 0.8 * np.exp(-0.5 * ((wavelengths - 520.0) / 45.0) ** 2)
+    spectra = band + rng.normal(0.0, 0.002, (num_frames, num_pixels))
+    with tempfile.TemporaryDirectory() as directory:
+        # One pandas CSV per measurement, as save_to_csv used to write
+        start = time.perf_counter()
+        for i, absorbance in enumerate(spectra):
+            df = pd.DataFrame({'Wavelength': wavelengths, 'Absorbance': absorbance})
+            df.to_csv(os.path.join(directory, f'absorbance_data_{i}.csv'), index=False)
+        csv = (time.perf_counter() - start) / num_frames
+
+        start = time.perf_counter()
+        with SpectrumStore(os.path.join(directory, 'store'), wavelengths) as store:
+            store.add_calibration(spectra[0], spectra[1])
+            for absorbance in spectra:
+                store.append(absorbance, absorbance)
+        stored = (time.perf_counter() - start) / num_frames
+        stored_bytes = _spectrum_bytes(os.path.join(directory, 'store')) / num_frames
+
+        # 350-900 nm, four pixels averaged into one, float32 and zlib blocks
+        start = time.perf_counter()
+        reduction = {'roi': (350.0, 900.0), 'bin_size': 4, 'dtype': '<f4'}
+        with SpectrumStore(os.path.join(directory, 'reduced'), wavelengths, reduction=reduction,
+                           compression='zlib') as store:
+            store.add_calibration(spectra[0], spectra[1])
+            for absorbance in spectra:
+                store.append(absorbance, absorbance)
+        reduced = (time.perf_counter() - start) / num_frames
+        reduced_bytes = _spectrum_bytes(os.path.join(directory, 'reduced')) / num_frames
+    return {"csv_write_per_frame_s": csv, "store_append_per_frame_s": stored,
+            "reduced_store_append_per_frame_s": reduced, "store_bytes_per_frame": stored_bytes,
+            "reduced_store_bytes_per_frame": reduced_bytes}
+
+
+def synthesis_cycle(pumps, acquisition, absorbance_calculator, store, concentration, wait_scale,
+                    total_flow_rate=1.0, unit="MM"):
+    # One iteration of the methyl orange concentration loop
+    haucl4_pump, sodium_citrate_pump, mixing_pumps = pumps
+    methyl_orange_flow_rate = (concentration / 2.5) * total_flow_rate
+    milliq_flow_rate = total_flow_rate - methyl_orange_flow_rate
+
+    mixing_pumps.stop()
+    mixing_pumps.set_flow_rates([(milliq_flow_rate, unit), (methyl_orange_flow_rate, unit)])
+    mixing_pumps.start()
+    time.sleep(60 * wait_scale)
+    haucl4_pump.start_pump()
+    time.sleep(30 * wait_scale)
+    sodium_citrate_pump.start_pump()
+
+    sample_intensities, wavelengths = acquisition.collect(num_measurements=10)
+    absorbance = absorbance_calculator(sample_intensities)
+    store.append(sample_intensities, absorbance, {'methyl_orange_concentration': concentration})
+
+
+def benchmark_synthesis(num_cycles, integration_time, latency, wait_scale):
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(integration_time)
+    simulated_pumps = [SimulatedSyringePump(address=0, latency=latency) for _ in range(4)]
+    cycle_times = []
+    start_skews = []
+    try:
+        with quiet():
+            pumps = [SyringePump(port=simulated.port) for simulated in simulated_pumps]
+        mixing_pumps = PumpGroup(pumps[2:])
+        with ContinuousAcquisition(spec) as acquisition, tempfile.TemporaryDirectory() as directory, quiet():
+            spec.mode = "reference"
+            reference, _ = acquisition.collect(10)
+            spec.mode = "background"
+            background, _ = acquisition.collect(10)
+            spec.mode = "sample"
+            absorbance_calculator = AbsorbanceCalculator(reference, background)
+            store = SpectrumStore(os.path.join(directory, 'store'), acquisition.wavelengths, chunk_frames=1)
+            store.add_calibration(reference, background)
+            commands_before = sum(len(simulated.commands) for simulated in simulated_pumps)
+            for concentration in np.linspace(0.1, 1.0, num_cycles):
+                start = time.perf_counter()
+                synthesis_cycle((pumps[0], pumps[1], mixing_pumps), acquisition, absorbance_calculator, store,
+                                round(concentration, 3), wait_scale)
+                cycle_times.append(time.perf_counter() - start)
+                start_skews.append(mixing_pumps.last_skew)
+            commands_sent = sum(len(simulated.commands) for simulated in simulated_pumps) - commands_before
+            store.close()
+        mixing_pumps.close()
+        with quiet():
+            for pump in pumps:
+                pump.close()
+    finally:
+        for simulated in simulated_pumps:
+            simulated.close()
+    return {
+        "synthesis_cycle_mean_s": statistics.mean(cycle_times),
+        "pump_group_start_skew_max_s": max(start_skews),
+        "pump_commands_per_cycle": commands_sent / num_cycles,
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        if name in HIGHER_IS_BETTER:
+            regressed = value < baseline[name] * (1 - tolerance)
+        else:
+            regressed = value > baseline[name] * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{name}: {value:.4g} (baseline {baseline[name]:.4g})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark acquisition, pump I/O and synthesis cycles against simulated hardware.")
+    parser.add_argument("--integration-time", type=int, default=8000, help="integration time in microseconds")
+    parser.add_argument("--frames", type=int, default=200, help="frames per acquisition benchmark")
+    parser.add_argument("--commands", type=int, default=5, help="pump commands per serial benchmark")
+    parser.add_argument("--devices", type=int, default=3, help="simulated spectrometers for the multi-device benchmark")
+    parser.add_argument("--cycles", type=int, default=3, help="synthesis cycles to time")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated pump response latency in seconds")
+    parser.add_argument("--wait-scale", type=float, default=0.0, help="fraction of the 60 s + 30 s pump staggering to keep")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against; exits non-zero on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    results.update(benchmark_acquisition(args.integration_time, args.frames))
+    results.update(benchmark_multi_device(args.integration_time, args.frames, args.devices))
+    results.update(benchmark_storage(args.frames))
+    # The simulated pumps need a pseudo-terminal, which Windows does not have
+    if hasattr(os, 'openpty'):
+        results.update(benchmark_serial(args.commands, args.latency))
+        results.update(benchmark_synthesis(args.cycles, args.integration_time, args.latency, args.wait_scale))
+    else:
+        print("No pseudo-terminals on this platform; skipping the pump and synthesis benchmarks.")
+
+    for name, value in results.items():
+        print(f"{name:36s} {value:12.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
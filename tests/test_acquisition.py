@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from aunpc.acquisition import ContinuousAcquisition, SpectrumRingBuffer
+from aunpc.processing import StreamingAverager
+from aunpc.simulation import SimulatedSpectrometer
+
+
+def _filled(capacity, frames):
+    buffer = SpectrumRingBuffer(capacity, 3)
+    for frame_number in range(frames):
+        buffer.append(np.full(3, float(frame_number)), float(frame_number))
+    return buffer
+
+
+def test_ring_buffer_keeps_the_latest_frames():
+    buffer = _filled(4, 6)
+    assert buffer.count == 6
+    spectra, timestamps = buffer.latest(10)
+    np.testing.assert_array_equal(timestamps, [2.0, 3.0, 4.0, 5.0])
+    np.testing.assert_array_equal(spectra[:, 0], timestamps)
+    np.testing.assert_array_equal(buffer.mean(2), np.full(3, 4.5))
+
+
+def test_since_starts_at_the_oldest_frame_still_held():
+    spectra, timestamps, start = _filled(4, 6).since(1)
+    assert start == 2
+    np.testing.assert_array_equal(timestamps, [2.0, 3.0, 4.0, 5.0])
+
+
+def test_accumulate_refuses_overwritten_and_future_frames():
+    buffer = _filled(4, 6)
+    averager = StreamingAverager(3)
+    assert not buffer.accumulate(1, averager)
+    assert not buffer.accumulate(6, averager)
+    assert buffer.accumulate(5, averager)
+    np.testing.assert_array_equal(averager.mean, np.full(3, 5.0))
+
+
+def test_empty_buffer_has_no_mean():
+    with pytest.raises(ValueError):
+        SpectrumRingBuffer(4, 3).mean(1)
+    assert not SpectrumRingBuffer(4, 3).wait_for(1, timeout=0.01)
+
+
+def test_collect_averages_fresh_frames():
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(8000)
+    spec.mode = 'reference'
+    with ContinuousAcquisition(spec) as acquisition:
+        intensities, wavelengths = acquisition.collect(5, timeout=5)
+        assert acquisition.frame_rate() > 0
+    assert not acquisition.running
+    assert intensities.shape == wavelengths.shape == (len(spec.wavelengths()),)
+    assert np.max(intensities) > spec.dark_counts
+
+
+def test_collect_fails_once_the_detector_stops():
+    class Unplugged(SimulatedSpectrometer):
+        def intensities(self, correct_dark_counts=False, correct_nonlinearity=False):
+            raise OSError("USB device disconnected")
+
+    with ContinuousAcquisition(Unplugged(seed=0)) as acquisition:
+        with pytest.raises(RuntimeError, match="USB device disconnected"):
+            acquisition.collect(3, timeout=5)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from aunpc.auto_exposure import MIN_INTEGRATION_TIME, auto_exposure, collect_adaptive
+from aunpc.acquisition import ContinuousAcquisition
+from aunpc.processing import AbsorbanceCalculator
+from aunpc.simulation import SimulatedSpectrometer
+
+
+def _reference(**options):
+    spec = SimulatedSpectrometer(realtime=False, seed=0, **options)
+    spec.mode = 'reference'
+    return spec
+
+
+def _peak(spec, integration_time):
+    spec.integration_time_micros(integration_time)
+    return np.max(spec.intensities())
+
+
+def test_auto_exposure_fills_the_detector_without_saturating():
+    spec = _reference()
+    integration_time = auto_exposure(spec)
+    assert 0.6 * spec.max_intensity < _peak(spec, integration_time) < 0.9 * spec.max_intensity
+
+
+def test_auto_exposure_never_returns_a_saturated_setting():
+    # A bright lamp and a long start leave only halving steps within the iterations
+    spec = _reference(lamp_counts_per_second=2e7)
+    integration_time = auto_exposure(spec, start_time=3000000, max_iterations=2)
+    assert _peak(spec, integration_time) < 0.9 * spec.max_intensity
+
+
+def test_auto_exposure_raises_if_the_shortest_time_saturates():
+    spec = _reference(lamp_counts_per_second=1e9)
+    with pytest.raises(RuntimeError, match=f"saturates even at {MIN_INTEGRATION_TIME}"):
+        auto_exposure(spec)
+
+
+def test_collect_adaptive_reaches_the_target_error():
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(MIN_INTEGRATION_TIME)
+    with ContinuousAcquisition(spec) as acquisition:
+        spec.mode = 'reference'
+        reference, _ = acquisition.collect(20)
+        calculator = AbsorbanceCalculator(reference.copy(), np.full(len(reference), spec.dark_counts))
+        spec.mode = 'sample'
+        _, wavelengths = collect_adaptive(acquisition, 0.01, absorbance_calculator=calculator, max_measurements=200)
+    assert len(wavelengths) == len(reference)
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aunpc.batch import parse_filename, summarize, write_summary
+
+
+def _write_spectra(directory, names):
+    wavelengths = np.linspace(400.0, 800.0, 401)
+    for i, name in enumerate(names):
+        absorbance = np.exp(-0.5 * ((wavelengths - (510.0 + 10.0 * i)) / 40.0) ** 2)
+        pd.DataFrame({'Wavelength': wavelengths, 'Absorbance': absorbance}).to_csv(directory / name, index=False)
+
+
+def test_filenames_give_time_and_concentration():
+    timestamp, concentration = parse_filename('absorbance_data_20240105120000_0.25mM_3.csv')
+    assert concentration == 0.25
+    later, concentration = parse_filename('absorbance_data_20240105120001.csv')
+    assert later - timestamp == 1.0 and np.isnan(concentration)
+    assert parse_filename('notes.csv') is None
+
+
+def test_summary_is_the_same_with_several_workers(tmp_path):
+    names = [f'absorbance_data_2024010512000{i}_0.{i}mM.csv' for i in range(6)]
+    _write_spectra(tmp_path, names)
+    (tmp_path / 'notes.csv').write_text('not a spectrum\n')
+    serial = summarize(str(tmp_path), workers=1)
+    parallel = summarize(str(tmp_path), workers=2, chunk_files=2)
+    assert [path.rsplit('/', 1)[-1] for path in serial['path']] == names
+    np.testing.assert_allclose(serial['peak_wavelength'], 510.0 + 10.0 * np.arange(6), atol=0.5)
+    for name in serial:
+        np.testing.assert_array_equal(parallel[name], serial[name])
+
+
+def test_summary_formats(tmp_path):
+    _write_spectra(tmp_path, ['absorbance_data_20240105120000_0.1mM.csv'])
+    summary = summarize(str(tmp_path))
+    write_summary(summary, str(tmp_path / 'summary.npz'))
+    np.testing.assert_array_equal(np.load(tmp_path / 'summary.npz')['concentration'], [0.1])
+    with pytest.raises(ValueError, match="Unsupported summary format"):
+        write_summary(summary, str(tmp_path / 'summary.txt'))
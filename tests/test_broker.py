@@ -0,0 +1,79 @@
+import functools
+import threading
+
+import numpy as np
+import pytest
+
+from aunpc.broker import Broker, BrokerClient, decode_spectrum, encode_spectrum
+from aunpc.pump_group import PumpGroup
+from aunpc.simulation import SimulatedSyringePump, open_simulated_spectrometer
+from aunpc.syringe_pump import SyringePump
+
+
+@pytest.fixture
+def broker():
+    broker = Broker(port=0, open_device=functools.partial(open_simulated_spectrometer, realtime=True),
+                    open_pump=SyringePump)
+    thread = threading.Thread(target=broker.server.serve_forever, daemon=True)
+    thread.start()
+    yield broker
+    broker.server.shutdown()
+    broker.close()
+
+
+@pytest.fixture
+def simulated_pumps():
+    pumps = [SimulatedSyringePump(latency=0.001) for _ in range(2)]
+    yield pumps
+    for pump in pumps:
+        pump.close()
+
+
+def test_refuses_to_listen_beyond_this_machine():
+    with pytest.raises(ValueError, match="loopback"):
+        Broker('0.0.0.0', 0)
+
+
+def test_spectrum_encoding_round_trip():
+    values = np.random.default_rng(0).random(1044)
+    np.testing.assert_array_equal(decode_spectrum(encode_spectrum(values)), values)
+
+
+def test_pump_round_trip(broker, simulated_pumps):
+    simulated = simulated_pumps[0]
+    with BrokerClient('%s:%d' % broker.address) as first, BrokerClient('%s:%d' % broker.address) as second:
+        pump = first.pump(simulated.port)
+        assert pump.set_flow_rate(1.5, 'MM').ok
+        assert simulated.rate == 1.5
+        # The broker's state cache is shared, so the second client's
+        # identical command is skipped
+        shared = second.pump(simulated.port)
+        assert shared.set_flow_rate(1.5, 'MM').skipped
+        assert shared.state['rate'] == 1.5
+        pump.close()
+        shared.close()
+
+
+def test_synchronized_start_through_the_broker(broker, simulated_pumps):
+    with BrokerClient('%s:%d' % broker.address) as client:
+        group = PumpGroup([client.pump(simulated.port) for simulated in simulated_pumps])
+        acknowledgements = group.start()
+        assert all(ack.response.ok for ack in acknowledgements)
+        assert all(simulated.running for simulated in simulated_pumps)
+        assert [ack.port for ack in acknowledgements] == [simulated.port for simulated in simulated_pumps]
+        group.close(close_pumps=True)
+
+
+def test_clients_share_a_spectrometer(broker):
+    with BrokerClient('%s:%d' % broker.address) as first, BrokerClient('%s:%d' % broker.address) as second:
+        acquisitions = [client.acquisition('SIM-0', 8000).start() for client in (first, second)]
+        try:
+            for acquisition in acquisitions:
+                intensities, wavelengths = acquisition.collect(3, timeout=10)
+                assert intensities.shape == wavelengths.shape == (1044,)
+            assert first.status()['spectrometers']['SIM-0']['integration_time'] == 8000
+            with pytest.raises(RuntimeError, match="shared at 8000"):
+                second.acquisition('SIM-0', 20000)
+        finally:
+            for acquisition in acquisitions:
+                acquisition.stop()
@@ -0,0 +1,71 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from aunpc.calibration_cache import CalibrationCache, drift_check, load_or_acquire_calibration
+
+WAVELENGTHS = np.linspace(400.0, 800.0, 50)
+REFERENCE = 1000.0 + 500.0 * np.exp(-0.5 * ((WAVELENGTHS - 600.0) / 100.0) ** 2)
+BACKGROUND = np.full(50, 100.0)
+
+
+class Bench:
+    # collect() for a lamp whose output can be scaled, answering the
+    # calibration prompts by switching between reference and background
+    def __init__(self, monkeypatch, lamp=1.0):
+        self.lamp = lamp
+        self.showing = REFERENCE
+        self.collections = 0
+        monkeypatch.setattr('builtins.input', self.prompt)
+
+    def prompt(self, message=''):
+        self.showing = BACKGROUND if 'background' in message else REFERENCE
+        return ''
+
+    def collect(self, num_measurements):
+        self.collections += 1
+        if self.showing is BACKGROUND:
+            return BACKGROUND.copy(), WAVELENGTHS
+        return BACKGROUND + self.lamp * (REFERENCE - BACKGROUND), WAVELENGTHS
+
+
+def test_entries_round_trip_and_expire(tmp_path):
+    cache = CalibrationCache(str(tmp_path))
+    cache.save('QEP1', 20000, 10, WAVELENGTHS, REFERENCE, BACKGROUND)
+    entry = cache.load('QEP1', 20000, 10)
+    np.testing.assert_array_equal(entry['reference'], REFERENCE)
+    assert entry['age'] < 60
+    assert cache.load('QEP1', 40000, 10) is None
+    assert CalibrationCache(str(tmp_path), max_age=-1).load('QEP1', 20000, 10) is None
+    assert not os.listdir(tmp_path)
+
+
+def test_only_the_most_recent_entries_are_kept(tmp_path):
+    cache = CalibrationCache(str(tmp_path), max_entries=2)
+    for minutes, integration_time in ((3, 10000), (2, 20000), (1, 30000)):
+        cache.save('QEP1', integration_time, 10, WAVELENGTHS, REFERENCE, BACKGROUND)
+        used = time.time() - 60 * minutes
+        os.utime(os.path.join(tmp_path, cache.key('QEP1', integration_time, 10) + '.npz'), (used, used))
+    assert sorted(os.listdir(tmp_path)) == ['QEP1_20000us_10avg.npz', 'QEP1_30000us_10avg.npz']
+
+
+@pytest.mark.parametrize('lamp, ok', [(1.0, True), (1.005, True), (0.95, False)])
+def test_drift_check(monkeypatch, lamp, ok):
+    assert drift_check(Bench(monkeypatch, lamp).collect, REFERENCE, BACKGROUND)[0] == ok
+
+
+def test_calibration_is_reused_until_the_lamp_drifts(tmp_path, monkeypatch):
+    cache = CalibrationCache(str(tmp_path))
+    bench = Bench(monkeypatch)
+    reference, background = load_or_acquire_calibration(bench.collect, 'QEP1', 20000, 10, cache)
+    np.testing.assert_array_equal(background, BACKGROUND)
+    assert bench.collections == 2
+    load_or_acquire_calibration(bench.collect, 'QEP1', 20000, 10, cache)
+    # Only the quick drift check was measured
+    assert bench.collections == 3
+    bench.lamp = 0.9
+    reference, _ = load_or_acquire_calibration(bench.collect, 'QEP1', 20000, 10, cache)
+    assert bench.collections == 6
+    np.testing.assert_allclose(cache.load('QEP1', 20000, 10)['reference'], reference)
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from aunpc.cli import main
+from aunpc.spectrum_store import SpectrumStore
+
+
+def _store(path):
+    wavelengths = np.linspace(400.0, 800.0, 200)
+    absorbance = np.exp(-0.5 * ((wavelengths - 520.0) / 40.0) ** 2)
+    with SpectrumStore(path, wavelengths) as store:
+        store.add_calibration(np.full(200, 1000.0), np.zeros(200))
+        for concentration in (0.1, 0.2):
+            store.append(1000.0 * 10 ** -absorbance, absorbance, {'methyl_orange_concentration': concentration})
+    return path
+
+
+def test_export_writes_one_csv_per_spectrum(tmp_path):
+    store = _store(str(tmp_path / 'run'))
+    main(['export', store, str(tmp_path / 'csv')])
+    assert len(os.listdir(tmp_path / 'csv')) == 2
+
+
+def test_features_finds_the_peak(tmp_path):
+    store = _store(str(tmp_path / 'run'))
+    main(['features', store, str(tmp_path / 'features.csv')])
+    features = np.genfromtxt(tmp_path / 'features.csv', delimiter=',', names=True)
+    np.testing.assert_allclose(features['peak_wavelength'], 520.0, atol=1.0)
+
+
+def test_parsing_loads_no_heavy_modules():
+    # The CLI is also what a pump-only PC runs, without seabreeze or matplotlib
+    code = ("import sys; from aunpc.cli import build_parser; build_parser().parse_known_args(['pump']); "
+            "print(sorted(name for name in ('numpy', 'seabreeze', 'matplotlib', 'pandas') if name in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.join(os.path.dirname(__file__), os.pardir)).stdout
+    assert output.strip() == '[]'
+
+
+def test_options_are_checked_for_commands_that_own_none(capsys):
+    with pytest.raises(SystemExit):
+        main(['measure', '--bogus'])
+    assert "unrecognized arguments: --bogus" in capsys.readouterr().err
@@ -0,0 +1,46 @@
+import os
+
+from aunpc.instrumentation import Histogram, Metrics
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = Histogram((0.001, 0.01, 0.1))
+    for value in [0.0005] * 90 + [0.05] * 10:
+        histogram.observe(value)
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == 0.001
+    assert histogram.quantile(0.95) == 0.05
+    assert abs(histogram.mean - 0.00545) < 1e-12
+
+
+def test_timings_are_kept_per_stage_and_label():
+    metrics = Metrics()
+
+    @metrics.timed('read')
+    def read():
+        return 1
+
+    assert read() == 1
+    with metrics.timer('pump_command', port='COM7'):
+        pass
+    metrics.observe('pump_command', 0.02, port='COM8')
+    assert sorted(metrics.histograms()) == [('pump_command', (('port', 'COM7'),)),
+                                           ('pump_command', (('port', 'COM8'),)), ('read', ())]
+    assert 'pump_command COM8' in metrics.summary()
+
+
+def test_a_recorded_run_writes_a_trace_and_prometheus_metrics(tmp_path):
+    metrics = Metrics()
+    metrics.start_run(str(tmp_path))
+    metrics.observe('collect', 0.3, serial='QEP1')
+    metrics.observe('collect', 0.02, serial='QEP1')
+    metrics.finish_run()
+    metrics.observe('collect', 0.3, serial='QEP1')
+    with open(tmp_path / 'trace.jsonl') as f:
+        assert len(f.readlines()) == 2
+    with open(tmp_path / 'metrics.prom') as f:
+        prometheus = f.read()
+    assert '# TYPE aunpc_collect_seconds histogram' in prometheus
+    assert 'aunpc_collect_seconds_bucket{serial="QEP1",le="0.025"} 1' in prometheus
+    assert 'aunpc_collect_seconds_count{serial="QEP1"} 2' in prometheus
+    assert not os.path.exists(tmp_path / 'metrics.prom.tmp')
@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from aunpc import spectrum_store
+from aunpc.kinetics import KineticsIndex, record_pump_events
+from aunpc.simulation import SimulatedSyringePump
+from aunpc.spectrum_store import SpectrumStore
+from aunpc.syringe_pump import SyringePump
+
+
+class Clock:
+    # Wall and monotonic time of one boot of the lab PC
+    def __init__(self, boot_time, monotonic):
+        self.boot_time = boot_time
+        self.now = monotonic
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.boot_time + self.now
+
+
+def _pump_event(command, running, rate=1.0):
+    return {'kind': 'pump', 'pump': 'citrate', 'command': command, 'ok': True, 'running': running,
+            'rate': rate, 'diameter': 14.43, 'volume': None}
+
+
+def _session(path, clock, start, frames, concentration, monkeypatch, wavelengths=None):
+    monkeypatch.setattr(spectrum_store, 'time', clock)
+    with SpectrumStore(path, wavelengths) as store:
+        if wavelengths is not None:
+            store.add_calibration(np.ones(8), np.zeros(8))
+        store.add_event(_pump_event('RUN', True), monotonic=start)
+        for monotonic in frames:
+            store.append(np.ones(8), np.zeros(8), {'methyl_orange_concentration': concentration},
+                         monotonic=monotonic)
+
+
+def test_residence_times_across_a_reboot(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run')
+    _session(path, Clock(1000.0, 100.0), 100.0, [110.0, 120.0], 0.1, monkeypatch, np.linspace(400.0, 800.0, 8))
+    # The run is resumed after a restart, with monotonic time starting again
+    _session(path, Clock(5000.0, 5.0), 5.0, [10.0, 40.0], 0.2, monkeypatch)
+
+    with SpectrumStore(path) as store:
+        index = KineticsIndex(store)
+        np.testing.assert_allclose(index.residence_times('citrate'), [10.0, 20.0, 5.0, 35.0])
+        np.testing.assert_array_equal(index.by_residence_time('citrate', 0.0, 15.0), [0, 2])
+        np.testing.assert_array_equal(index.by_concentration(0.2), [2, 3])
+
+
+def test_refuses_unaligned_times(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run')
+    _session(path, Clock(1000.0, 100.0), 100.0, [110.0], 0.1, monkeypatch, np.linspace(400.0, 800.0, 8))
+    _session(path, Clock(5000.0, 5.0), 5.0, [10.0], 0.2, monkeypatch)
+    # A store written before sessions were recorded
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    del meta['sessions']
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    with SpectrumStore(path) as store:
+        with pytest.raises(ValueError, match="continued after a restart"):
+            KineticsIndex(store)
+
+
+def test_pump_settings_follow_rate_changes(tmp_path):
+    path = str(tmp_path / 'run')
+    with SpectrumStore(path, np.linspace(400.0, 800.0, 8)) as store:
+        store.add_calibration(np.ones(8), np.zeros(8))
+        store.add_event(_pump_event(None, False, rate=0.5), monotonic=0.0)
+        store.add_event(_pump_event('RUN', True, rate=0.5), monotonic=1.0)
+        store.add_event(_pump_event('RAT 2.0 MM', True, rate=2.0), monotonic=5.0)
+        for monotonic in (0.5, 2.0, 6.0):
+            store.append(np.ones(8), np.zeros(8), monotonic=monotonic)
+
+    with SpectrumStore(path) as store:
+        index = KineticsIndex(store)
+        np.testing.assert_array_equal(index.pump_settings('citrate'), [0.5, 0.5, 2.0])
+        np.testing.assert_allclose(index.residence_times('citrate'), [np.nan, 1.0, 5.0])
+        np.testing.assert_array_equal(index.by_pump_setting('citrate', 2.0), [2])
+
+
+def test_events_recorded_from_a_pump(tmp_path):
+    path = str(tmp_path / 'run')
+    with SimulatedSyringePump(latency=0.001) as simulated:
+        pump = SyringePump(simulated.port, timeout=0.5)
+        try:
+            with SpectrumStore(path, np.linspace(400.0, 800.0, 8)) as store:
+                store.add_calibration(np.ones(8), np.zeros(8))
+                record_pump_events(store, {'citrate': pump})
+                store.append(np.ones(8), np.zeros(8))
+                pump.set_flow_rate(1.5, 'MM')
+                pump.start_pump()
+                store.append(np.ones(8), np.zeros(8))
+                pump.stop_pump()
+                store.append(np.ones(8), np.zeros(8))
+        finally:
+            pump.close()
+
+    with SpectrumStore(path) as store:
+        index = KineticsIndex(store)
+        residence_times = index.residence_times('citrate')
+        assert np.isnan(residence_times[0]) and np.isnan(residence_times[2])
+        assert 0.0 < residence_times[1] < 1.0
+        np.testing.assert_array_equal(index.pump_settings('citrate'), [0.0, 1.5, 1.5])
@@ -0,0 +1,37 @@
+import os
+import time
+
+import numpy as np
+
+from aunpc.acquisition import ContinuousAcquisition
+from aunpc.live_viewer import LiveViewer, _finite_limits
+from aunpc.simulation import SimulatedSpectrometer
+
+
+def test_limits_grow_to_fit_finite_data_only():
+    assert _finite_limits(np.array([0.2, 0.8, np.nan]), (0.0, 1.0)) == (0.0, 1.0)
+    low, high = _finite_limits(np.array([0.0, 2.0, np.inf]), (0.0, 1.0))
+    assert low < 0.0 and high > 2.0
+    assert _finite_limits(np.full(3, np.nan), (0.0, 1.0)) == (0.0, 1.0)
+
+
+def test_viewer_runs_beside_the_acquisition(tmp_path, monkeypatch):
+    # The viewer process draws off screen
+    monkeypatch.setenv('MPLBACKEND', 'Agg')
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(8000)
+    snapshot = str(tmp_path / 'viewer.png')
+    with ContinuousAcquisition(spec) as acquisition:
+        with LiveViewer(acquisition, max_fps=50, max_points=200) as viewer:
+            assert len(viewer.wavelengths) <= 200
+            spec.mode = 'reference'
+            reference, _ = acquisition.collect(3)
+            viewer.set_calibration(reference.copy(), np.full(len(reference), spec.dark_counts))
+            viewer.show(reference, 'Reference')
+            spec.mode = 'sample'
+            viewer.snapshot(snapshot)
+            deadline = time.monotonic() + 30
+            while not os.path.exists(snapshot) and time.monotonic() < deadline:
+                time.sleep(0.05)
+        assert acquisition.running
+    assert os.path.getsize(snapshot) > 0
@@ -0,0 +1,24 @@
+import pytest
+
+from aunpc.calibration_cache import CalibrationCache
+from aunpc.multi_device import MultiDeviceAcquisition, ProcessAcquisition
+from aunpc.simulation import open_simulated_spectrometer
+
+
+def test_integration_time_is_required():
+    def open_device(serial_number):
+        raise AssertionError("The integration time must be checked before the device is opened.")
+    with pytest.raises(ValueError, match="integration time"):
+        ProcessAcquisition('SIM-0', None, open_device=open_device)
+
+
+def test_records_every_device_with_its_integration_time(tmp_path, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda prompt='': '')
+    devices = {'SIM-0': 5000, 'SIM-1': 8000}
+    with MultiDeviceAcquisition(devices, open_device=open_simulated_spectrometer) as acquisition:
+        acquisition.calibrate(2, cache=CalibrationCache(str(tmp_path / 'cache')))
+        stores = acquisition.open_stores(str(tmp_path / 'run'))
+        assert acquisition.record(2, {'point': 0}) == {'SIM-0': 0, 'SIM-1': 0}
+        for serial_number, integration_time in devices.items():
+            assert stores[serial_number].run_metadata['integration_time'] == integration_time
+            assert len(stores[serial_number]) == 1
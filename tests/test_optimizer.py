@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from aunpc.optimizer import FAILED_EXPERIMENT, NelderMead, objective, on_target, optimize
+from aunpc.spectrum_store import SpectrumStore
+
+
+def test_simplex_finds_the_minimum_inside_the_bounds():
+    bounds = [(0.0, 2.0), (-1.0, 1.0)]
+    search = NelderMead([1.5, 0.5], [0.3, 0.3], bounds, xtol=1e-4)
+    for _ in range(300):
+        if search.converged:
+            break
+        x, y = search.ask()
+        assert 0.0 <= x <= 2.0 and -1.0 <= y <= 1.0
+        search.tell((x - 0.7) ** 2 + (y + 0.2) ** 2)
+    point, value = search.best
+    np.testing.assert_allclose(point, [0.7, -0.2], atol=1e-3)
+    assert value < 1e-5
+
+
+def test_simplex_stays_on_a_bound_when_the_minimum_is_beyond_it():
+    search = NelderMead([0.9], [0.1], [(0.0, 1.0)], xtol=1e-4)
+    for _ in range(100):
+        if search.converged:
+            break
+        search.tell(-search.ask()[0])
+    assert search.best[0][0] == 1.0
+
+
+def test_objective_counts_misses_in_tolerances():
+    features = {'peak_wavelength': 532.0, 'fwhm': np.nan}
+    assert objective(features, {'peak_wavelength': 530.0}, {'peak_wavelength': 1.0}) == 4.0
+    assert objective(features, {'fwhm': 50.0}, {'fwhm': 1.0}) == FAILED_EXPERIMENT
+    assert on_target(features, {'peak_wavelength': 530.0}, {'peak_wavelength': 2.0})
+    assert not on_target(features, {'peak_wavelength': 530.0}, {'peak_wavelength': 1.0})
+
+
+class PeakRunner:
+    # Stands in for a RecipeRunner whose measured SPR peak shifts linearly
+    # with the methyl orange concentration
+    def __init__(self, store):
+        self.store = store
+        self.variables = {}
+        self.conditions = []
+        self.shut_down = False
+
+    def run_setup(self):
+        pass
+
+    def run_condition(self, concentration):
+        self.conditions.append(concentration)
+        peak = 520.0 + 20.0 * concentration
+        absorbance = np.exp(-0.5 * ((self.store.wavelengths - peak) / 30.0) ** 2)
+        return [self.store.append(10 ** -absorbance, absorbance, {'methyl_orange_concentration': concentration})]
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+def test_optimize_reaches_the_target_peak(tmp_path):
+    settings = {'parameters': {'c': [0.0, 2.5]}, 'initial': {'c': 0.1}, 'step': {'c': 0.5},
+                'targets': {'peak_wavelength': 530.0}, 'tolerances': {'peak_wavelength': 1.0}, 'max_experiments': 12}
+    with SpectrumStore(str(tmp_path / 'run'), np.linspace(400.0, 800.0, 401)) as store:
+        store.add_calibration(np.ones(401), np.zeros(401))
+        runner = PeakRunner(store)
+        best = optimize(runner, settings)
+        assert runner.shut_down
+        assert best['parameters']['c'] == pytest.approx(0.5, abs=0.05)
+        assert len(runner.conditions) <= 12
+        # Every proposed condition is measured once
+        assert len(set(runner.conditions)) == len(runner.conditions)
+        assert store.run_metadata['optimization']['best']['frame_number'] == best['frame_number']
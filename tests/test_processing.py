@@ -0,0 +1,36 @@
+import numpy as np
+
+from aunpc.processing import AbsorbanceCalculator, StreamingAverager, calculate_absorbance
+
+
+def test_streaming_average_matches_numpy():
+    spectra = np.random.default_rng(0).normal(1000.0, 30.0, (50, 16))
+    averager = StreamingAverager(16)
+    for spectrum in spectra:
+        averager.update(spectrum)
+    np.testing.assert_allclose(averager.mean, spectra.mean(axis=0))
+    np.testing.assert_allclose(averager.variance(), spectra.var(axis=0, ddof=1))
+    np.testing.assert_allclose(averager.standard_error(), spectra.std(axis=0, ddof=1) / np.sqrt(50))
+    averager.reset()
+    assert averager.count == 0
+    assert np.isnan(averager.variance()).all()
+
+
+def test_absorbance_into_a_caller_owned_buffer():
+    reference, background = np.array([1000.0, 1000.0, 10.0]), np.array([10.0, 10.0, 10.0])
+    sample = np.array([109.0, 1000.0, 10.0])
+    out = np.empty(3)
+    result = AbsorbanceCalculator(reference, background)(sample, out=out)
+    assert result is out
+    np.testing.assert_allclose(out[:2], [1.0, 0.0])
+    # No lamp signal in the last pixel
+    assert not np.isfinite(out[2])
+    np.testing.assert_array_equal(calculate_absorbance(sample, reference, background), out)
+
+
+def test_absorbance_of_a_batch_and_its_standard_error():
+    calculator = AbsorbanceCalculator(np.full(4, 1010.0), np.full(4, 10.0))
+    samples = np.array([np.full(4, 110.0), np.full(4, 1010.0)])
+    np.testing.assert_allclose(calculator(samples), [[1.0] * 4, [0.0] * 4])
+    error = calculator.standard_error(np.full(4, 110.0), np.full(4, 1.0))
+    np.testing.assert_allclose(error, 1.0 / (np.log(10) * 100.0))
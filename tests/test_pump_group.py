@@ -0,0 +1,43 @@
+import pytest
+
+from aunpc.pump_group import PumpGroup
+from aunpc.simulation import SimulatedSyringePump
+from aunpc.syringe_pump import SyringePump
+
+
+@pytest.fixture
+def group():
+    simulated = [SimulatedSyringePump(address=address, latency=0.001) for address in range(3)]
+    group = PumpGroup([SyringePump(pump.port, timeout=0.5) for pump in simulated])
+    group.simulated = simulated
+    yield group
+    group.close(close_pumps=True)
+    for pump in simulated:
+        pump.close()
+
+
+def test_start_and_stop_reach_every_pump(group):
+    acknowledgements = group.start()
+    assert [ack.port for ack in acknowledgements] == [pump.port for pump in group.pumps]
+    assert all(ack.response.ok for ack in acknowledgements)
+    assert all(pump.running for pump in group.simulated)
+    # The barrier releases every port thread together
+    assert group.last_skew < 0.05
+    group.stop()
+    assert not any(pump.running for pump in group.simulated)
+
+
+def test_flow_rates_go_to_the_pump_in_the_same_position(group):
+    group.set_flow_rates([(0.5, 'MM'), (1.0, 'MH'), (2.0, 'UM')])
+    assert [(pump.rate, pump.rate_units) for pump in group.simulated] == [(0.5, 'MM'), (1.0, 'MH'), (2.0, 'UM')]
+
+
+def test_a_failing_pump_raises_without_blocking_the_others(group):
+    def fail(pump):
+        raise OSError("port closed")
+    with pytest.raises(OSError, match="port closed"):
+        group.dispatch([lambda pump: pump.start_pump(), fail, lambda pump: pump.start_pump()])
+    assert group.simulated[0].running and group.simulated[2].running
+    # The workers are still usable afterwards
+    group.stop()
+    assert not any(pump.running for pump in group.simulated)
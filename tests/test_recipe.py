@@ -0,0 +1,150 @@
+import builtins
+import functools
+import json
+import os
+
+import pytest
+
+import aunpc.hardware as hardware
+from aunpc import calibration_cache, optimizer
+from aunpc.recipe import RecipeRunner, evaluate_formula, flow_rates_for, load_recipe, run_recipe, validate_recipe
+from aunpc.simulation import SimulatedSpectrometer, SimulatedSyringePump
+from aunpc.spectrum_store import SpectrumStore
+from aunpc.supervisor import Checkpoint
+
+RECIPES = os.path.join(os.path.dirname(__file__), os.pardir, 'recipes')
+
+
+def _recipe(**changes):
+    with open(os.path.join(RECIPES, 'mo_concentration_sweep.json')) as f:
+        recipe = json.load(f)
+    recipe.update(changes)
+    return recipe
+
+
+def test_example_recipes_are_valid():
+    for name in os.listdir(RECIPES):
+        load_recipe(os.path.join(RECIPES, name))
+
+
+def test_flow_rates_follow_the_formulas():
+    rates = flow_rates_for(_recipe(), 0.5)
+    assert rates['methyl_orange'] == pytest.approx(0.2)
+    assert rates['milliq_water'] == pytest.approx(0.8)
+    assert flow_rates_for(_recipe(), 0.5, names=['haucl4']) == {'haucl4': 0.5}
+
+
+def test_formulas_only_do_arithmetic():
+    assert evaluate_formula("-(c / stock) ** 2", {'c': 1.0, 'stock': 2.0}) == -0.25
+    with pytest.raises(ValueError, match="Unknown variable 'x'"):
+        evaluate_formula("x + 1", {})
+    with pytest.raises(ValueError, match="Unsupported expression"):
+        evaluate_formula("__import__('os').getcwd()", {})
+
+
+@pytest.mark.parametrize('changes, message', [
+    ({'steps': [{'action': 'pour'}]}, "Unknown action 'pour'"),
+    ({'steps': [{'action': 'start', 'pumps': ['ethanol']}]}, r"unknown pumps \['ethanol'\]"),
+    ({'flow_rates': {'ethanol': 1.0}}, r"unknown pumps \['ethanol'\]"),
+    ({'concentrations': None}, "either 'concentrations' or an 'optimize' section"),
+])
+def test_invalid_recipes_are_rejected(changes, message):
+    recipe = _recipe(**changes)
+    recipe = {key: value for key, value in recipe.items() if value is not None}
+    with pytest.raises(ValueError, match=message):
+        validate_recipe(recipe)
+
+
+@pytest.fixture
+def no_hardware(monkeypatch):
+    def open_spectrometer(serial_number, integration_time=None):
+        raise AssertionError("The recipe kind must be checked before the spectrometer is opened.")
+    monkeypatch.setattr(hardware, 'open_spectrometer', open_spectrometer)
+
+
+def test_sweep_rejects_optimize_recipe(no_hardware):
+    with pytest.raises(ValueError, match="aunpc optimize"):
+        run_recipe(os.path.join(RECIPES, 'mo_target_peak.json'))
+
+
+def test_optimize_rejects_sweep_recipe(no_hardware):
+    with pytest.raises(ValueError, match="no 'optimize' section"):
+        optimizer.main([os.path.join(RECIPES, 'mo_concentration_sweep.json')])
+
+
+def test_dry_run_prints_the_flow_rates(no_hardware, capsys):
+    run_recipe(os.path.join(RECIPES, 'mo_concentration_sweep.json'), dry_run=True)
+    output = capsys.readouterr().out
+    assert "0.5 mM: haucl4 0.5, sodium_citrate 0.5, milliq_water 0.8, methyl_orange 0.2 MM" in output
+
+
+@pytest.fixture
+def simulated_sweep(tmp_path, monkeypatch):
+    # The example sweep, shortened to five conditions and run on simulated
+    # pumps and a simulated spectrometer; returns the recipe path
+    recipe = _recipe()
+    simulated_pumps = {name: SimulatedSyringePump(latency=0.001) for name in recipe['pumps']}
+    for name, pump in recipe['pumps'].items():
+        pump['port'] = simulated_pumps[name].port
+    recipe['spectrometer'] = {'serial_number': 'SIM-RESUME', 'integration_time': 12000}
+    recipe['concentrations'] = [0.1, 0.2, 0.3, 0.4, 0.5]
+    recipe['output'] = str(tmp_path)
+    recipe['steps'] = [step for step in recipe['steps'] if step['action'] not in ('wait', 'wait_steady')]
+    recipe['steps'][-1] = {'action': 'measure', 'num_measurements': 5}
+    path = str(tmp_path / 'recipe.json')
+    with open(path, 'w') as f:
+        json.dump(recipe, f)
+
+    spectrometers = []
+
+    def open_spectrometer(serial_number, integration_time=None):
+        spec = SimulatedSpectrometer(serial_number=serial_number, realtime=False, seed=len(spectrometers))
+        spec.integration_time_micros(integration_time)
+        spectrometers.append(spec)
+        return spec
+
+    def prompt(message=''):
+        message = message.lower()
+        spectrometers[-1].mode = 'background' if 'background' in message else 'reference'
+        return ''
+    monkeypatch.setattr(hardware, 'open_spectrometer', open_spectrometer)
+    monkeypatch.setattr(builtins, 'input', prompt)
+    monkeypatch.setattr(calibration_cache, 'CalibrationCache',
+                        functools.partial(calibration_cache.CalibrationCache, str(tmp_path / 'calibration')))
+    yield path
+    for pump in simulated_pumps.values():
+        pump.close()
+
+
+def test_interrupted_sweep_resumes_where_it_stopped(simulated_sweep, tmp_path, monkeypatch):
+    measure = RecipeRunner.measure
+    save_checkpoint = RecipeRunner._save_checkpoint
+    measured = []
+
+    def interrupted_measure(runner, step, concentration):
+        if len(measured) == 2:
+            raise KeyboardInterrupt
+        measured.append(concentration)
+        return measure(runner, step, concentration)
+    # The second condition's spectra reach the store but not the checkpoint
+    monkeypatch.setattr(RecipeRunner, 'measure', interrupted_measure)
+    monkeypatch.setattr(RecipeRunner, '_save_checkpoint',
+                        lambda runner, completed: save_checkpoint(runner, completed) if completed < 2 else None)
+    with pytest.raises(KeyboardInterrupt):
+        run_recipe(simulated_sweep)
+    store_path = str(next(tmp_path.glob('recipe_run_*')))
+    assert Checkpoint(store_path).get('conditions_completed') == 1
+    with SpectrumStore(store_path) as store:
+        assert len(store) == 2
+
+    monkeypatch.setattr(RecipeRunner, 'measure', measure)
+    monkeypatch.setattr(RecipeRunner, '_save_checkpoint', save_checkpoint)
+    run_recipe(store_path, resume=True)
+    with SpectrumStore(store_path) as store:
+        assert [row['methyl_orange_concentration'] for row in store.metadata()] == [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert Checkpoint(store_path).get('conditions_completed') == 5
+
+
+def test_only_recipe_runs_can_be_resumed(tmp_path):
+    with pytest.raises(FileNotFoundError, match="No checkpoint"):
+        run_recipe(str(tmp_path), resume=True)
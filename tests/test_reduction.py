@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from aunpc.reduction import SpectralReduction, compress, decompress, reduce_store
+from aunpc.spectrum_store import SpectrumStore
+
+WAVELENGTHS = np.linspace(200.0, 1000.0, 801)
+
+
+def test_crop_and_bin():
+    reduction = SpectralReduction(WAVELENGTHS, roi=(350.0, 900.0), bin_size=4)
+    assert reduction.num_pixels == 137
+    np.testing.assert_allclose(reduction.wavelengths[:2], [351.5, 355.5])
+    np.testing.assert_allclose(reduction(WAVELENGTHS)[:2], [351.5, 355.5])
+    assert reduction(np.ones((3, 801))).shape == (3, 137)
+
+
+def test_resample_onto_a_grid():
+    reduction = SpectralReduction(WAVELENGTHS, grid=(400.0, 800.0, 2.5), dtype='<f8')
+    np.testing.assert_allclose(reduction(2 * WAVELENGTHS), 2 * reduction.wavelengths)
+    with pytest.raises(ValueError, match="reaches outside"):
+        SpectralReduction(WAVELENGTHS, roi=(400.0, 600.0), grid=(300.0, 500.0, 1.0))
+    with pytest.raises(ValueError, match="either pixel binning or a wavelength grid"):
+        SpectralReduction(WAVELENGTHS, bin_size=2, grid=(400.0, 800.0, 1.0))
+
+
+def test_description_rebuilds_the_reduction():
+    reduction = SpectralReduction(WAVELENGTHS, roi=(350.0, 900.0), bin_size=4, dtype='<f4')
+    rebuilt = SpectralReduction.from_description(WAVELENGTHS, reduction.describe())
+    spectrum = np.random.default_rng(0).random(801)
+    np.testing.assert_array_equal(rebuilt(spectrum), reduction(spectrum))
+
+
+def test_compression_is_lossless():
+    values = np.random.default_rng(0).normal(0.5, 0.01, (16, 137)).astype('<f4')
+    np.testing.assert_array_equal(decompress(compress(values), '<f4', values.shape), values)
+
+
+def test_reduce_store_copies_every_frame_and_event(tmp_path):
+    source, destination = str(tmp_path / 'run'), str(tmp_path / 'reduced')
+    spectra = np.random.default_rng(0).uniform(100.0, 1000.0, (5, 801))
+    with SpectrumStore(source, WAVELENGTHS) as store:
+        store.add_calibration(np.full(801, 1000.0), np.zeros(801))
+        store.add_event({'kind': 'pump', 'pump': 'citrate', 'command': 'RUN'}, monotonic=0.5)
+        for i, spectrum in enumerate(spectra):
+            store.append(spectrum, -np.log10(spectrum / 1000.0), {'frame': i}, monotonic=float(i))
+    reduce_store(source, destination, {'roi': (350.0, 900.0), 'bin_size': 4})
+
+    reduction = SpectralReduction(WAVELENGTHS, roi=(350.0, 900.0), bin_size=4)
+    with SpectrumStore(destination) as store:
+        assert len(store) == 5
+        assert [row['frame'] for row in store.metadata()] == list(range(5))
+        np.testing.assert_allclose(store.read('sample'), reduction(spectra), rtol=1e-6)
+        np.testing.assert_array_equal(store.run_times(), np.arange(5.0))
+        assert [event['command'] for event in store.events()] == ['RUN']
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from aunpc import replay as replay_module
+from aunpc.spectrum_store import SpectrumStore
+
+
+def _recipe_run(path, detector):
+    recipe = {'steps': [{'action': 'wait_steady', 'detector': detector}, {'action': 'measure'}]}
+    wavelengths = np.linspace(400.0, 800.0, 200)
+    store = SpectrumStore(path, wavelengths, {'recipe': recipe})
+    store.add_calibration(np.full(200, 1000.0), np.zeros(200))
+    absorbance = np.exp(-0.5 * ((wavelengths - 520.0) / 40.0) ** 2)
+    for i in range(10):
+        store.append(1000.0 * 10 ** -absorbance, absorbance, {'kind': 'equilibration'}, monotonic=float(i))
+    store.close()
+    return path
+
+
+def test_replay_uses_the_recorded_detector_settings(tmp_path, monkeypatch):
+    path = _recipe_run(str(tmp_path / 'run'), {'window': 5, 'peak_tolerance': 0.5})
+    options = []
+
+    class Detector(replay_module.SteadyStateDetector):
+        def __init__(self, wavelengths, **kwargs):
+            options.append(kwargs)
+            super().__init__(wavelengths, **kwargs)
+    monkeypatch.setattr(replay_module, 'SteadyStateDetector', Detector)
+
+    with SpectrumStore(path) as store:
+        columns, _ = replay_module.replay(store)
+        replay_module.replay(store, detector_options={'window': 8})
+    assert options == [{'window': 5, 'peak_tolerance': 0.5}, {'window': 8, 'peak_tolerance': 0.5}]
+    # A constant spectrum is steady once the recorded window of 5 is full
+    assert columns['steady'].tolist() == [0.0] * 4 + [1.0] * 6
+    assert np.nanmax(columns['absorbance_error']) < 1e-12
+
+
+def test_replay_feeds_only_equilibration_frames_to_the_detector(tmp_path):
+    path = _recipe_run(str(tmp_path / 'run'), {'window': 3})
+    with SpectrumStore(path) as store:
+        store.append(np.full(200, 500.0), np.full(200, np.log10(2.0)), {'methyl_orange_concentration': 0.1},
+                     monotonic=10.0)
+    with SpectrumStore(path) as store:
+        columns, _ = replay_module.replay(store)
+    assert np.isnan(columns['steady'][-1])
+    assert columns['steady'][-2] == 1.0
+
+
+def test_pump_commands_restart_the_steady_state_search(tmp_path):
+    path = _recipe_run(str(tmp_path / 'run'), {'window': 3})
+    with SpectrumStore(path) as store:
+        store.add_event({'kind': 'pump', 'pump': 'citrate', 'command': 'RUN', 'ok': True}, monotonic=4.5)
+    with SpectrumStore(path) as store:
+        columns, decisions = replay_module.replay(store)
+    assert columns['steady'].tolist() == [0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0, 1.0, 1.0, 1.0]
+    assert decisions == [{'time': pytest.approx(4.5), 'pump': 'citrate', 'command': 'RUN',
+                          'steady_after': pytest.approx(2.5)}]
+
+
+def test_replays_are_deterministic_and_compared_frame_by_frame(tmp_path):
+    path = _recipe_run(str(tmp_path / 'run'), {'window': 3})
+    with SpectrumStore(path) as store:
+        first, _ = replay_module.replay(store)
+        second, _ = replay_module.replay(store)
+        longer_window, _ = replay_module.replay(store, detector_options={'window': 5})
+    differences, changed = replay_module.compare(second, first)
+    assert all(difference == 0.0 for difference in differences.values())
+    assert len(changed) == 0
+    _, changed = replay_module.compare(longer_window, first)
+    np.testing.assert_array_equal(changed, [2, 3])
@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+
+from aunpc.processing import AbsorbanceCalculator
+from aunpc.simulation import SimulatedSpectrometer, SimulatedSyringePump
+from aunpc.syringe_pump import SyringePump
+
+
+def _average(spec, mode, n=50):
+    spec.mode = mode
+    return np.mean([spec.intensities() for _ in range(n)], axis=0)
+
+
+def test_absorbance_is_recovered_from_simulated_intensities():
+    spec = SimulatedSpectrometer(realtime=False, seed=0)
+    reference, background, sample = (_average(spec, mode) for mode in ('reference', 'background', 'sample'))
+    absorbance = AbsorbanceCalculator(reference, background)(sample)
+    wavelengths = spec.wavelengths()
+    lit = (wavelengths > 400.0) & (wavelengths < 800.0)
+    np.testing.assert_allclose(absorbance[lit], spec.absorbance()[lit], atol=0.02)
+    assert abs(wavelengths[lit][np.argmax(absorbance[lit])] - 520.0) < 5.0
+
+
+def test_realtime_frames_take_one_integration_time():
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(20000)
+    spec.intensities()
+    started = time.monotonic()
+    for _ in range(5):
+        spec.intensities()
+    assert 0.09 < time.monotonic() - started < 0.2
+
+
+def test_simulated_pump_follows_the_protocol():
+    with SimulatedSyringePump(address=2, latency=0.001) as simulated:
+        pump = SyringePump(simulated.port, timeout=0.5, cache_state=False)
+        try:
+            response = pump.send_command('RUN')
+            assert (response.address, response.status_name) == (2, 'infusing')
+            assert pump.send_command('DIA 10').error == '?NA'
+            assert pump.send_command('STP').status_name == 'stopped'
+            assert pump.send_command('DIA 60').error == '?OOR'
+            assert pump.send_command('FOO').error == '?'
+            assert pump.send_command('RAT 2 UH').ok and pump.send_command('VOL').data == '0.000UL'
+        finally:
+            pump.close()
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from aunpc.spectrum_store import SpectrumStore
+
+
+def test_reader_does_not_truncate_a_live_writer(tmp_path):
+    # A reader opened while another instance writes must leave the writer's
+    # spectra that are not indexed yet alone
+    path = str(tmp_path / 'store')
+    wavelengths = np.linspace(200.0, 1000.0, 1044)
+    spectra = np.random.default_rng(0).random((10, 1044))
+    writer = SpectrumStore(path, wavelengths, chunk_frames=64)
+    writer.add_calibration(spectra[0], spectra[1])
+    for spectrum in spectra:
+        writer.append(spectrum, spectrum)
+    writer._files['sample.bin'].flush()
+
+    with SpectrumStore(path) as reader:
+        assert len(reader) == 0
+        assert len(reader.read('sample')) == 0
+        assert reader.metadata() == []
+    assert os.path.getsize(os.path.join(path, 'sample.bin')) == spectra.nbytes
+
+    writer.close()
+    with SpectrumStore(path) as reader:
+        assert len(reader) == 10
+        np.testing.assert_array_equal(reader.read('sample'), spectra)
+
+
+def test_recover_discards_unindexed_spectra(tmp_path):
+    path = str(tmp_path / 'store')
+    wavelengths = np.linspace(200.0, 1000.0, 16)
+    with SpectrumStore(path, wavelengths) as store:
+        store.add_calibration(np.ones(16), np.zeros(16))
+        store.append(np.ones(16), np.zeros(16))
+    with open(os.path.join(path, 'sample.bin'), 'ab') as f:
+        f.write(b'\0' * 100)
+
+    with SpectrumStore(path, recover=True) as store:
+        store.append(np.full(16, 2.0), np.zeros(16))
+        np.testing.assert_array_equal(store.read('sample')[:, 0], [1.0, 2.0])
+
+
+def test_append_keeps_zero_times(tmp_path):
+    path = str(tmp_path / 'store')
+    with SpectrumStore(path, np.linspace(200.0, 1000.0, 16)) as store:
+        store.add_calibration(np.ones(16), np.zeros(16), timestamp=0.0)
+        store.append(np.ones(16), np.zeros(16), timestamp=0.0, monotonic=0.0)
+        store.append(np.ones(16), np.zeros(16), timestamp=1.0, monotonic=1.0)
+    with SpectrumStore(path) as store:
+        assert store.index()['monotonic'].tolist() == [0.0, 1.0]
+        assert store.index()['timestamp'].tolist() == [0.0, 1.0]
+    assert np.fromfile(os.path.join(path, 'calibrations.bin')).tolist() == [0.0]
+
+
+def test_reduction_that_keeps_the_length_is_applied(tmp_path):
+    wavelengths = np.linspace(400.0, 800.0, 401)
+    sample = np.random.default_rng(1).random(401) + 1.0
+    # A grid with as many points as the detector has pixels, and a dtype-only reduction
+    for name, reduction in (('grid', {'grid': (400.5, 799.5, 399.0 / 400)}), ('dtype', {'dtype': '<f2'})):
+        path = str(tmp_path / name)
+        with SpectrumStore(path, wavelengths, reduction=reduction) as store:
+            assert store.num_pixels == 401
+            store.add_calibration(np.full(401, 2.0), np.zeros(401))
+            store.append(sample, sample)
+            store.append(store.reduction(sample), None, reduced=True)
+        with SpectrumStore(path) as store:
+            stored = store.read('sample')
+            assert stored.dtype == store.reduction.dtype
+            np.testing.assert_array_equal(stored[0], store.reduction(sample))
+            np.testing.assert_array_equal(stored[1], stored[0])
@@ -0,0 +1,34 @@
+import numpy as np
+
+from aunpc.spr_features import FEATURE_NAMES, extract_features
+
+WAVELENGTHS = np.linspace(350.0, 900.0, 1101)
+
+
+def _band(peak_wavelength, sigma=30.0, height=0.8, baseline=0.1):
+    return baseline + height * np.exp(-0.5 * ((WAVELENGTHS - peak_wavelength) / sigma) ** 2)
+
+
+def test_features_of_a_gaussian_band():
+    features = extract_features(WAVELENGTHS, _band(525.0))
+    assert abs(features['peak_wavelength'] - 525.0) < 0.1
+    assert abs(features['peak_absorbance'] - 0.9) < 0.01
+    # Measured above the baseline: 2 sqrt(2 ln 2) sigma
+    assert abs(features['fwhm'] - 2.3548 * 30.0) < 1.0
+    assert abs(features['absorbance_400'] - _band(525.0)[100]) < 1e-3
+
+
+def test_a_batch_matches_single_spectra():
+    spectra = np.array([_band(peak) for peak in (510.0, 530.0, 560.0)])
+    batch = extract_features(WAVELENGTHS, spectra)
+    for i, spectrum in enumerate(spectra):
+        single = extract_features(WAVELENGTHS, spectrum)
+        for name in FEATURE_NAMES:
+            np.testing.assert_allclose(batch[name][i], single[name])
+
+
+def test_spectra_without_signal_give_nan_features():
+    spectra = np.array([_band(530.0), np.full(len(WAVELENGTHS), np.nan)])
+    features = extract_features(WAVELENGTHS, spectra)
+    assert np.isfinite(features['peak_wavelength'][0])
+    assert np.isnan(features['peak_wavelength'][1])
@@ -0,0 +1,60 @@
+import numpy as np
+
+from aunpc.acquisition import ContinuousAcquisition
+from aunpc.processing import AbsorbanceCalculator
+from aunpc.simulation import SimulatedSpectrometer
+from aunpc.steady_state import SteadyStateDetector, wait_for_steady_state
+
+WAVELENGTHS = np.linspace(400.0, 800.0, 401)
+
+
+def _spectrum(peak_wavelength, peak_absorbance=0.8):
+    return peak_absorbance * np.exp(-0.5 * ((WAVELENGTHS - peak_wavelength) / 45.0) ** 2)
+
+
+def test_steady_once_the_window_is_full():
+    detector = SteadyStateDetector(WAVELENGTHS, window=5)
+    assert [detector.update(_spectrum(520.0), float(t)) for t in range(6)] == [False] * 4 + [True] * 2
+    assert abs(detector.status()['peak_wavelength'] - 520.0) < 0.5
+    detector.reset()
+    assert not detector.update(_spectrum(520.0), 6.0)
+
+
+def test_a_moving_peak_is_not_steady():
+    detector = SteadyStateDetector(WAVELENGTHS, window=5, peak_tolerance=1.0)
+    for t in range(10):
+        steady = detector.update(_spectrum(520.0 + 0.5 * t), float(t))
+    assert not steady
+    assert detector.status()['peak_change'] > 1.0
+
+
+def test_a_rising_band_is_not_steady():
+    detector = SteadyStateDetector(WAVELENGTHS, window=5)
+    for t in range(10):
+        steady = detector.update(_spectrum(520.0, 0.5 + 0.02 * t), float(t))
+    assert not steady
+
+
+def _calibrated(spec, acquisition):
+    spec.mode = 'reference'
+    reference, _ = acquisition.collect(5)
+    spec.mode = 'background'
+    background, _ = acquisition.collect(5)
+    spec.mode = 'sample'
+    return AbsorbanceCalculator(reference.copy(), background.copy())
+
+
+def test_wait_for_steady_state_on_the_simulator():
+    spec = SimulatedSpectrometer(seed=0)
+    spec.integration_time_micros(8000)
+    with ContinuousAcquisition(spec) as acquisition:
+        calculator = _calibrated(spec, acquisition)
+        recorded = []
+        detector = SteadyStateDetector(acquisition.wavelengths, window=5)
+        assert wait_for_steady_state(acquisition, calculator, detector, num_measurements=2, timeout=10,
+                                     record=lambda *values: recorded.append(values[3]))
+        assert len(recorded) == detector.count >= 5
+        # A reactor still drifting to its new steady state times out
+        spec.set_sample(peak_wavelength=560.0, time_constant=1.0)
+        detector = SteadyStateDetector(acquisition.wavelengths, window=5)
+        assert not wait_for_steady_state(acquisition, calculator, detector, num_measurements=2, timeout=0.3)
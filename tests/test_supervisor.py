@@ -0,0 +1,49 @@
+import pytest
+
+from aunpc.simulation import SimulatedSyringePump
+from aunpc.supervisor import Checkpoint, SupervisedPump
+from aunpc.syringe_pump import SyringePump
+
+
+@pytest.fixture
+def simulated():
+    with SimulatedSyringePump(latency=0.001) as simulated:
+        yield simulated
+
+
+@pytest.fixture
+def pump(simulated):
+    pump = SyringePump(simulated.port, timeout=0.5)
+    yield pump
+    pump.close()
+
+
+def test_supervised_pump_reconnects_and_restores_the_pump(simulated, pump):
+    supervised = SupervisedPump(pump, backoff=0.0)
+    supervised.set_syringe_diameter(14.5)
+    supervised.set_flow_rate(2.0, 'MH')
+    # The adapter drops out and the pump comes back with its defaults
+    pump.ser.close()
+    simulated.diameter, simulated.rate, simulated.rate_units = 26.59, 0.0, 'MM'
+    supervised.set_volume(3.0)
+    assert supervised.reconnects == 1
+    assert (simulated.diameter, simulated.rate, simulated.rate_units, simulated.volume) == (14.5, 2.0, 'MH', 3.0)
+
+
+def test_supervised_pump_gives_up_after_its_retries(simulated, pump, monkeypatch):
+    supervised = SupervisedPump(pump, retries=2, backoff=0.0)
+
+    def unplugged():
+        raise OSError("device disconnected")
+    monkeypatch.setattr(pump, 'reconnect', unplugged)
+    pump.ser.close()
+    with pytest.raises(RuntimeError, match="after 2 reconnects"):
+        supervised.start_pump()
+
+
+def test_checkpoint_survives_a_restart(tmp_path):
+    assert not Checkpoint(str(tmp_path))
+    Checkpoint(str(tmp_path)).save(conditions_completed=2, frames=6)
+    checkpoint = Checkpoint(str(tmp_path))
+    assert checkpoint.get('conditions_completed') == 2 and checkpoint.get('frames') == 6
+    assert not (tmp_path / 'checkpoint.json.tmp').exists()
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from aunpc.simulation import SimulatedSyringePump
+from aunpc.syringe_pump import PumpResponse, SyringePump
+
+
+@pytest.fixture
+def simulated():
+    with SimulatedSyringePump(latency=0.001) as simulated:
+        yield simulated
+
+
+@pytest.fixture
+def pump(simulated):
+    pump = SyringePump(simulated.port, timeout=0.5)
+    yield pump
+    pump.close()
+
+
+def test_state_is_read_when_the_port_opens(simulated, pump):
+    assert pump.state['diameter'] == simulated.diameter
+    assert pump.state['rate'] == simulated.rate
+
+
+def test_settings_the_pump_already_has_are_skipped(simulated, pump):
+    pump.set_flow_rate(1.5, 'MM')
+    sent = len(simulated.commands)
+    response = pump.set_flow_rate(1.5, 'mm')
+    assert response.skipped and response.ok
+    assert len(simulated.commands) == sent
+    assert pump.skipped_commands == 1
+    # A different unit is a different setting
+    pump.set_flow_rate(1.5, 'UM')
+    assert simulated.rate_units == 'UM'
+
+
+def test_stop_is_skipped_only_when_the_pump_is_known_to_be_stopped(simulated, pump):
+    pump.start_pump()
+    assert simulated.running
+    assert not pump.stop_pump().skipped
+    assert not simulated.running
+    assert pump.stop_pump().skipped
+
+
+def test_invalidate_sends_everything_again(simulated, pump):
+    pump.set_volume(2.0)
+    pump.invalidate()
+    assert not pump.set_volume(2.0).skipped
+    assert simulated.commands[-1] == 'VOL 2.0'
+
+
+def test_without_the_cache_every_command_is_sent(simulated):
+    pump = SyringePump(simulated.port, timeout=0.5, cache_state=False)
+    try:
+        pump.set_volume(2.0)
+        assert not pump.set_volume(2.0).skipped
+        assert simulated.commands == ['VOL 2.0', 'VOL 2.0']
+    finally:
+        pump.close()
+
+
+def test_rejected_setting_is_forgotten(simulated, pump):
+    pump.start_pump()
+    response = pump.set_syringe_diameter(10.0)
+    assert response.error is not None
+    assert pump.state['diameter'] is None
+    assert pump.last_known_state['diameter'] == 26.59
+
+
+def test_replies_are_parsed():
+    response = PumpResponse('RAT', b'\x0201S1.500MM\x03', 0.01)
+    assert (response.address, response.status, response.data) == (1, 'S', '1.500MM')
+    assert response.ok and response.status_name == 'stopped'
+    assert PumpResponse('FOO', b'\x0200S?\x03', 0.01).error == '?'
+    assert PumpResponse('RUN', b'', 1.0).timed_out
+
+
+def test_a_reply_is_read_up_to_its_terminator(simulated, pump):
+    response = pump.send_command('RAT')
+    assert response.ok and response.data == '0.000MM'
+    # Far less than the one second serial timeout
+    assert response.round_trip_time < 0.5
+
+
+def test_pipelined_queries_are_matched_in_order(simulated, pump):
+    pump.set_syringe_diameter(14.43)
+    pump.set_volume(2.0)
+    responses = pump.send_commands(['DIA', 'RAT', 'VOL'])
+    assert [response.data for response in responses] == ['14.43', '0.000MM', '2.000ML']
+
+
+def test_a_missing_reply_times_out_and_clears_the_state(simulated, pump):
+    simulated.latency = 1.0
+    response = pump.send_command('RUN')
+    assert response.timed_out and response.error == 'timeout'
+    assert pump.state['running'] is None
+    # The late reply is dropped before the next command
+    simulated.latency = 0.001
+    time.sleep(1.0)
+    assert pump.send_command('DIA').data == '26.59'